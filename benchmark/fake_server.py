@@ -0,0 +1,284 @@
+import hashlib
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from xml.sax.saxutils import escape
+
+from llm_tool.gen_tool import TokenBucket
+
+# 合成论文使用的词汇，包含主题相关与无关的词，便于本地预筛选产生区分度
+TOPIC_WORDS = ["green", "building", "low", "carbon", "energy", "concrete", "emission", "construction"]
+OTHER_WORDS = ["neural", "network", "graph", "quantum", "protein", "language", "vision", "market", "theorem"]
+
+
+class FakeConfig:
+    """
+    本地替身服务的配置
+    """
+
+    def __init__(self, paper_number=100, query_number=5, overlap=0.1, pdf_size=200 * 1024, text_size=20000,
+                 arxiv_latency=0.0, pdf_latency=0.0, llm_latency=0.0, files_latency=0.0, llm_rpm=None):
+        """
+        :param paper_number: 合成论文的总数
+        :param query_number: 关键词数量，论文按关键词分组，相邻分组之间有overlap比例的重叠
+        :param overlap: 相邻关键词结果的重叠比例
+        :param pdf_size: 每个pdf的字节数
+        :param text_size: 文件抽取文本的字符数
+        :param arxiv_latency: arXiv API 每次请求的延迟（秒）
+        :param pdf_latency: pdf下载的延迟（秒）
+        :param llm_latency: chat.completions 每次请求的延迟（秒）
+        :param files_latency: files 接口每次请求的延迟（秒）
+        :param llm_rpm: chat.completions 每分钟允许的请求数，超过时返回429，为空时不限制
+        """
+        self.paper_number = paper_number
+        self.query_number = query_number
+        self.overlap = overlap
+        self.pdf_size = pdf_size
+        self.text_size = text_size
+        self.arxiv_latency = arxiv_latency
+        self.pdf_latency = pdf_latency
+        self.llm_latency = llm_latency
+        self.files_latency = files_latency
+        self.llm_rpm = llm_rpm
+
+
+def get_paper_id(index):
+    """
+    合成论文的id
+    :param index: 论文序号
+    :return: 论文id，例如 2401.00001v1
+    """
+    return f"24{1 + index // 100000:02d}.{index % 100000:05d}v1"
+
+
+def get_query_indexes(config, query_index):
+    """
+    关键词对应的论文序号，按提交时间从新到旧排列
+    :param config: FakeConfig
+    :param query_index: 关键词序号
+    :return: 论文序号列表
+    """
+    per_query = max(1, config.paper_number // config.query_number)
+    step = max(1, int(per_query * (1 - config.overlap)))
+    start = query_index * step
+    return [i % config.paper_number for i in range(start, start + per_query)]
+
+
+def _words(seed, number):
+    digest = hashlib.sha256(seed.encode()).digest()
+    vocabulary = TOPIC_WORDS + OTHER_WORDS if digest[0] % 2 else OTHER_WORDS
+    return " ".join(vocabulary[digest[i % len(digest)] % len(vocabulary)] for i in range(number))
+
+
+def build_entry(base_url, index):
+    """
+    构造单篇论文的Atom条目
+    :param base_url: 替身服务地址
+    :param index: 论文序号
+    :return: xml字符串
+    """
+    paper_id = get_paper_id(index)
+    published = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(1704067200 - index * 60))
+    return f"""<entry>
+<id>http://arxiv.org/abs/{paper_id}</id>
+<updated>{published}</updated>
+<published>{published}</published>
+<title>{escape(_words(paper_id + "title", 8))}</title>
+<summary>{escape(_words(paper_id + "abstract", 150))}</summary>
+<author><name>Author {index}</name></author>
+<author><name>Coauthor {index}</name></author>
+<link href="http://arxiv.org/abs/{paper_id}" rel="alternate" type="text/html"/>
+<link title="pdf" href="{base_url}/pdf/{paper_id}" rel="related" type="application/pdf"/>
+<arxiv:primary_category xmlns:arxiv="http://arxiv.org/schemas/atom" term="cs.CE" scheme="http://arxiv.org/schemas/atom"/>
+<category term="cs.CE" scheme="http://arxiv.org/schemas/atom"/>
+</entry>"""
+
+
+def build_feed(base_url, index_list, total_results):
+    """
+    构造arXiv API的Atom响应
+    :param base_url: 替身服务地址
+    :param index_list: 当前页的论文序号
+    :param total_results: 总结果数
+    :return: xml字符串
+    """
+    entries = "\n".join(build_entry(base_url, index) for index in index_list)
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom" xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/">
+<title>ArXiv Query</title>
+<id>http://arxiv.org/api/fake</id>
+<updated>2024-01-01T00:00:00Z</updated>
+<opensearch:totalResults>{total_results}</opensearch:totalResults>
+<opensearch:startIndex>0</opensearch:startIndex>
+<opensearch:itemsPerPage>{len(index_list)}</opensearch:itemsPerPage>
+{entries}
+</feed>"""
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    """
+    同时提供 arXiv API、pdf下载以及 OpenAI 兼容的 chat.completions 与 files 接口
+    """
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def config(self):
+        return self.server.config
+
+    def _send(self, status, body, content_type="application/json", headers=None):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, data, status=200):
+        self._send(status, json.dumps(data, ensure_ascii=False))
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length) if length else b""
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/api/query":
+            self._handle_query(parse_qs(url.query))
+        elif url.path.startswith("/pdf/"):
+            self._handle_pdf(url.path[len("/pdf/"):])
+        elif url.path == "/v1/files":
+            time.sleep(self.config.files_latency)
+            with self.server.lock:
+                file_list = list(self.server.file_dict.values())
+            self._send_json({"object": "list", "data": file_list})
+        elif re.fullmatch(r"/v1/files/[^/]+/content", url.path):
+            time.sleep(self.config.files_latency)
+            file_id = url.path.split("/")[3]
+            if file_id not in self.server.file_dict:
+                self._send_json({"error": {"message": "file not found", "type": "not_found"}}, 404)
+                return
+            text = _words(file_id, self.config.text_size // 8)
+            self._send(200, json.dumps({"content": text, "file_type": "application/pdf"}), "text/plain")
+        else:
+            self._send_json({"error": {"message": "not found"}}, 404)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        body = self._read_body()
+        if url.path == "/v1/chat/completions":
+            self._handle_chat(json.loads(body))
+        elif url.path == "/v1/files":
+            time.sleep(self.config.files_latency)
+            match = re.search(rb'filename="([^"]+)"', body)
+            file_object = {"id": uuid.uuid4().hex, "object": "file", "bytes": len(body),
+                           "created_at": int(time.time()), "filename": match.group(1).decode() if match else "file",
+                           "purpose": "file-extract", "status": "ok"}
+            with self.server.lock:
+                self.server.file_dict[file_object["id"]] = file_object
+            self._send_json(file_object)
+        else:
+            self._send_json({"error": {"message": "not found"}}, 404)
+
+    def _handle_query(self, params):
+        time.sleep(self.config.arxiv_latency)
+        start = int(params.get("start", ["0"])[0])
+        page_size = int(params.get("max_results", ["100"])[0])
+
+        if params.get("id_list", [""])[0]:
+            id_set = {paper_id.split("v")[0] for paper_id in params["id_list"][0].split(",")}
+            index_list = [i for i in range(self.config.paper_number) if get_paper_id(i).split("v")[0] in id_set]
+        else:
+            # 关键词中的数字作为关键词序号，例如 all:"bench3"
+            match = re.search(r"(\d+)", params.get("search_query", ["0"])[0])
+            query_index = int(match.group(1)) % self.config.query_number if match else 0
+            index_list = get_query_indexes(self.config, query_index)
+
+        page = index_list[start:start + page_size]
+        self._send(200, build_feed(self.server.base_url, page, len(index_list)), "application/atom+xml")
+
+    def _handle_pdf(self, paper_id):
+        time.sleep(self.config.pdf_latency)
+        content = b"%PDF-1.4\n" + hashlib.sha256(paper_id.encode()).digest() * (self.config.pdf_size // 32)
+        range_match = re.match(r"bytes=(\d+)-", self.headers.get("Range", ""))
+        if range_match:
+            offset = int(range_match.group(1))
+            if offset >= len(content):
+                self._send(416, b"", "application/pdf")
+                return
+            self._send(206, content[offset:], "application/pdf",
+                       {"Content-Range": f"bytes {offset}-{len(content) - 1}/{len(content)}"})
+        else:
+            self._send(200, content, "application/pdf")
+
+    def _handle_chat(self, request):
+        if self.server.llm_bucket is not None and not self.server.llm_bucket.try_acquire():
+            self._send_json({"error": {"message": "rate limit reached", "type": "rate_limit_reached_error"}}, 429)
+            return
+        time.sleep(self.config.llm_latency)
+
+        prompt = "\n".join(message["content"] for message in request["messages"])
+        user_content = request["messages"][-1]["content"]
+        if "score" in user_content:
+            paper_id_list = re.findall(r'"paper_id": "([^"]+)"', user_content)
+            score_list = [{"paper_id": paper_id, "score": hashlib.sha256(paper_id.encode()).digest()[0] % 11}
+                          for paper_id in paper_id_list]
+            # JSON模式下只能返回对象
+            content = json.dumps({"scores": score_list} if request.get("response_format") else score_list)
+        else:
+            content = json.dumps({"summary": "这是一段合成的论文总结。", "keypoints_1": "创新点一",
+                                  "keypoints_2": "创新点二"}, ensure_ascii=False)
+
+        prompt_tokens = len(prompt) // 4
+        completion_tokens = len(content) // 2
+        self._send_json({
+            "id": uuid.uuid4().hex, "object": "chat.completion", "created": int(time.time()),
+            "model": request["model"],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        })
+
+
+class NonBlockingBucket(TokenBucket):
+    """
+    不阻塞的令牌桶，令牌不足时直接返回False，用于模拟服务端的速率限制
+    """
+
+    def try_acquire(self, amount=1):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last_time) * self.refill_per_second)
+            self._last_time = now
+            if self._tokens >= amount:
+                self._tokens -= amount
+                return True
+            return False
+
+
+def start_fake_server(config, host="127.0.0.1", port=0):
+    """
+    在后台线程中启动本地替身服务
+    :param config: FakeConfig
+    :param host: 监听地址
+    :param port: 端口，为0时自动选择
+    :return: ThreadingHTTPServer，base_url属性为服务地址
+    """
+    server = ThreadingHTTPServer((host, port), FakeHandler)
+    server.daemon_threads = True
+    server.config = config
+    server.base_url = f"http://{host}:{server.server_address[1]}"
+    server.file_dict = dict()
+    server.lock = threading.Lock()
+    server.llm_bucket = NonBlockingBucket(config.llm_rpm, config.llm_rpm / 60) if config.llm_rpm else None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
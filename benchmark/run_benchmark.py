@@ -0,0 +1,140 @@
+"""
+离线性能测试：使用本地的 arXiv 与 Moonshot AI 替身服务运行完整的 paper_process，
+输出端到端以及各阶段的耗时，不需要网络
+
+使用方法（在仓库根目录下）：
+    python benchmark/run_benchmark.py --sizes 10 100 1000
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import arxiv
+
+import main
+from llm_tool import arxiv_tool
+from benchmark.fake_server import FakeConfig, start_fake_server
+
+# 报告中展示的阶段顺序
+STAGE_LIST = ["fetch", "save", "dedup", "prefilter", "judge", "download", "summary", "render", "index"]
+
+
+def read_stage_summary(root_dir):
+    """
+    读取本次运行写入的性能报告
+    :param root_dir: 运行的根目录
+    :return: 阶段名称到汇总计数的字典
+    """
+    daily_dir = os.path.join(root_dir, "paper", datetime.datetime.now().strftime("%Y%m%d"))
+    report_path = os.path.join(daily_dir, os.path.basename(daily_dir) + "_metrics.jsonl")
+    stage_summary_dict = dict()
+    with open(report_path, "r", encoding="utf-8") as f:
+        for line in f:
+            event = json.loads(line)
+            if event["type"] == "stage_summary":
+                stage_summary_dict[event["stage"]] = event
+    return stage_summary_dict
+
+
+def run_workload(args, paper_number):
+    """
+    运行一组合成负载
+    :param args: 命令行参数
+    :param paper_number: 合成论文的数量
+    :return: 测试结果
+    """
+    config = FakeConfig(paper_number=paper_number, query_number=args.queries, overlap=args.overlap,
+                        pdf_size=args.pdf_size, arxiv_latency=args.arxiv_latency, pdf_latency=args.pdf_latency,
+                        llm_latency=args.llm_latency, files_latency=args.files_latency, llm_rpm=args.server_rpm)
+    server = start_fake_server(config)
+
+    # 将 arXiv 与 Moonshot AI 的地址指向替身服务
+    arxiv.Client.query_url_format = server.base_url + "/api/query?{}"
+    os.environ["KIMI_API_KEY"] = "benchmark"
+    os.environ["KIMI_BASE_URL"] = server.base_url + "/v1"
+    arxiv_tool.API_RATE_LIMITER.min_interval = args.arxiv_interval
+    arxiv_tool.PDF_RATE_LIMITER.min_interval = args.pdf_interval
+
+    query_list = [f'all:"bench{i}"' for i in range(args.queries)]
+    judge_number = max(1, int(paper_number * args.judge_ratio))
+
+    with tempfile.TemporaryDirectory() as root_dir:
+        start = time.perf_counter()
+        main.paper_process(
+            topic="green building low carbon",
+            query_list=query_list,
+            max_results_per_query=max(1, paper_number // args.queries),
+            judge_number=judge_number,
+            root_dir=root_dir,
+            is_free_account=False,
+            download_workers=args.download_workers,
+            concurrent_fetch=args.concurrent_fetch,
+            llm_limits={"rpm": args.llm_rpm, "tpm": args.llm_tpm, "max_workers": args.llm_workers},
+            prefilter_top_k=args.prefilter_top_k,
+            streaming=args.streaming,
+        )
+        wall_time = time.perf_counter() - start
+        stage_summary_dict = read_stage_summary(root_dir)
+
+    server.shutdown()
+    server.server_close()
+
+    return {"paper_number": paper_number, "judge_number": judge_number, "wall_time": round(wall_time, 3),
+            "stages": stage_summary_dict}
+
+
+def print_report(result_list):
+    """
+    打印测试结果表格
+    :param result_list: 测试结果列表
+    :return: 无返回
+    """
+    header = f"{'papers':>8} {'total(s)':>9}" + "".join(f" {stage + '(s)':>13}" for stage in STAGE_LIST)
+    print(header)
+    print("-" * len(header))
+    for result in result_list:
+        line = f"{result['paper_number']:>8} {result['wall_time']:>9.2f}"
+        for stage in STAGE_LIST:
+            stage_summary = result["stages"].get(stage)
+            line += f" {stage_summary['wall_time']:>13.2f}" if stage_summary else f" {'-':>13}"
+        print(line)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="paper_process 离线性能测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000], help="合成论文数量")
+    parser.add_argument("--queries", type=int, default=5, help="关键词数量")
+    parser.add_argument("--overlap", type=float, default=0.1, help="相邻关键词结果的重叠比例")
+    parser.add_argument("--judge-ratio", type=float, default=0.1, help="筛选保留的论文比例")
+    parser.add_argument("--pdf-size", type=int, default=200 * 1024, help="每个pdf的字节数")
+    parser.add_argument("--arxiv-latency", type=float, default=0.2, help="arXiv API 延迟（秒）")
+    parser.add_argument("--pdf-latency", type=float, default=0.1, help="pdf下载延迟（秒）")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="大模型接口延迟（秒）")
+    parser.add_argument("--files-latency", type=float, default=0.1, help="files接口延迟（秒）")
+    parser.add_argument("--server-rpm", type=int, default=None, help="替身服务每分钟允许的大模型请求数")
+    parser.add_argument("--arxiv-interval", type=float, default=0.0, help="arXiv API 请求的最小间隔（秒）")
+    parser.add_argument("--pdf-interval", type=float, default=0.0, help="pdf下载的最小间隔（秒）")
+    parser.add_argument("--download-workers", type=int, default=8, help="并发下载数")
+    parser.add_argument("--llm-workers", type=int, default=8, help="大模型并发数")
+    parser.add_argument("--llm-rpm", type=int, default=6000, help="客户端的每分钟请求数限制")
+    parser.add_argument("--llm-tpm", type=int, default=100000000, help="客户端的每分钟token数限制")
+    parser.add_argument("--concurrent-fetch", action="store_true", help="并发检索多个关键词")
+    parser.add_argument("--prefilter-top-k", type=int, default=None, help="本地预筛选保留的论文数量")
+    parser.add_argument("--streaming", action="store_true", help="以流式方式执行")
+    parser.add_argument("--output", default=None, help="将结果保存为json文件")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    result_list = [run_workload(args, paper_number) for paper_number in args.sizes]
+    print_report(result_list)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result_list, f, ensure_ascii=False, indent=4)
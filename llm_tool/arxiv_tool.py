@@ -0,0 +1,324 @@
+import contextlib
+import datetime
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import arxiv
+import requests
+from requests.adapters import HTTPAdapter
+
+from llm_tool.gen_tool import print_with_timestamp, RateLimiter
+from llm_tool.metrics_tool import get_metrics
+
+# arXiv API 要求每3秒最多发起一次请求，所有线程共享同一个限速器
+API_RATE_LIMITER = RateLimiter(min_interval=3.0)
+# arXiv 对批量下载有频率要求，所有线程共享同一个限速器
+PDF_RATE_LIMITER = RateLimiter(min_interval=1.0)
+
+# 共享的HTTP会话，复用连接池
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_http_session(pool_size=8):
+    """
+    获取全局共享的HTTP会话
+    :param pool_size: 连接池大小
+    :return: requests.Session
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=3)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+            _session.headers.update({"user-agent": "paper_tool (arxiv.py compatible)"})
+    return _session
+
+
+class RateLimitedClient(arxiv.Client):
+    """
+    可在多线程间共享的arxiv客户端，由全局限速器控制请求的发起频率，
+    已发出的请求之间互不阻塞
+    """
+
+    def __init__(self, page_size=100, num_retries=3, rate_limiter=API_RATE_LIMITER):
+        """
+        :param page_size: 每页的结果数量
+        :param num_retries: 失败重试次数
+        :param rate_limiter: 限速器
+        """
+        # 由限速器代替客户端自带的单线程延时，依赖的内部方法不存在时不再限速，直接报错
+        if not callable(getattr(arxiv.Client, "_parse_feed", None)):
+            raise RuntimeError("当前arxiv版本不支持限速，请安装requirements.txt中固定的版本")
+        super().__init__(page_size=page_size, delay_seconds=0, num_retries=num_retries)
+        self.rate_limiter = rate_limiter
+        # 记录每次API请求的字节数
+        self._session.hooks["response"].append(
+            lambda response, *args, **kwargs: get_metrics().record(http_calls=1, bytes=len(response.content)))
+
+    def _parse_feed(self, *args, **kwargs):
+        # 每页请求与其重试都经过 arxiv.Client._parse_feed，这是 arxiv 2.1.3 的内部方法，
+        # requirements.txt 中固定了版本，升级前需确认该方法与 _session 仍然存在
+        self.rate_limiter.wait()
+        return super()._parse_feed(*args, **kwargs)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_arxiv_client():
+    """
+    获取全局共享的arxiv客户端
+    :return: RateLimitedClient
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = RateLimitedClient()
+    return _client
+
+
+def merge_query_results(query_result_dict):
+    """
+    按paper_id对多个关键词的检索结果去重，论文只保留在第一个命中的关键词下，
+    并在paper_queries字段中记录所有命中的关键词
+    :param query_result_dict: 关键词到检索结果的字典（按关键词顺序）
+    :return: 去重后的关键词到检索结果的字典
+    """
+    merged_dict = dict()
+    paper_dict = dict()
+
+    for query, paper_content in query_result_dict.items():
+        merged_dict[query] = dict()
+        for paper_id, paper in paper_content.items():
+            if paper_id in paper_dict:
+                paper_dict[paper_id]["paper_queries"].append(query)
+                continue
+            paper = dict(paper, paper_queries=[query])
+            paper_dict[paper_id] = paper
+            merged_dict[query][paper_id] = paper
+
+    duplicate_number = sum(len(paper_content) for paper_content in query_result_dict.values()) - len(paper_dict)
+    if duplicate_number:
+        print_with_timestamp(f"多个关键词共检索到 {duplicate_number} 篇重复论文，已去重...")
+
+    return merged_dict
+
+
+def get_paper_version(paper_id):
+    """
+    从paper_id中解析版本号
+    :param paper_id: 论文id，例如 2404.01234v2
+    :return: 版本号，例如 v2，没有版本号时返回None
+    """
+    match = re.search(r"(v\d+)$", paper_id)
+    return match.group(1) if match else None
+
+
+def get_base_id(paper_id):
+    """
+    去掉paper_id中的版本号
+    :param paper_id: 论文id，例如 2404.01234v2
+    :return: 不含版本号的id，例如 2404.01234
+    """
+    return re.sub(r"v\d+$", "", paper_id)
+
+
+def load_watermarks(root_dir):
+    """
+    读取各关键词的增量检索水位线
+    :param root_dir: 根目录
+    :return: 关键词到水位线的字典，水位线包括最新的提交时间published和该时间下已见过的paper_ids
+    """
+    watermark_path = os.path.join(root_dir, "watermark.json")
+    if not os.path.exists(watermark_path):
+        return dict()
+    with open(watermark_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_watermarks(root_dir, watermark_dict):
+    """
+    保存各关键词的增量检索水位线，先写临时文件再替换，避免写入中断损坏文件
+    :param root_dir: 根目录
+    :param watermark_dict: 关键词到水位线的字典
+    :return: 无返回
+    """
+    watermark_path = os.path.join(root_dir, "watermark.json")
+    with open(watermark_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(watermark_dict, f, ensure_ascii=False, indent=4)
+    os.replace(watermark_path + ".tmp", watermark_path)
+
+
+def compare_watermark(result, watermark):
+    """
+    判断检索结果相对于水位线的位置
+    :param result: arxiv检索结果
+    :param watermark: 水位线，为空代表首次检索
+    :return: "new" 为新论文，"seen" 为水位线时刻已见过的论文，"older" 为早于水位线的论文
+    """
+    if not watermark:
+        return "new"
+    watermark_time = datetime.datetime.fromisoformat(watermark["published"])
+    if result.published > watermark_time:
+        return "new"
+    if result.published == watermark_time:
+        return "seen" if get_base_id(result.get_short_id()) in watermark["paper_ids"] else "new"
+    return "older"
+
+
+def advance_watermark(watermark, result):
+    """
+    用新的检索结果推进水位线（原地修改）
+    :param watermark: 水位线
+    :param result: arxiv检索结果
+    :return: 无返回
+    """
+    published = result.published.isoformat()
+    base_id = get_base_id(result.get_short_id())
+    if not watermark or result.published > datetime.datetime.fromisoformat(watermark["published"]):
+        watermark["published"] = published
+        watermark["paper_ids"] = [base_id]
+    elif result.published == datetime.datetime.fromisoformat(watermark["published"]):
+        if base_id not in watermark["paper_ids"]:
+            watermark["paper_ids"].append(base_id)
+
+
+def resolve_pdf_urls(paper_id_list, paper_info=None, client=None):
+    """
+    获取论文的pdf地址，优先使用检索结果中保存的地址，缺失的论文合并为一次id_list查询
+    :param paper_id_list: 论文id列表
+    :param paper_info: extract_paper_data 返回的论文信息列表
+    :param client: arxiv客户端
+    :return: paper_id 到 pdf 地址的字典
+    """
+    known_url_dict = {item["paper_id"]: item.get("paper_pdf_url") for item in (paper_info or [])}
+
+    pdf_url_dict = dict()
+    missing_id_list = []
+    for paper_id in paper_id_list:
+        if known_url_dict.get(paper_id):
+            pdf_url_dict[paper_id] = known_url_dict[paper_id]
+        else:
+            missing_id_list.append(paper_id)
+
+    if missing_id_list:
+        print_with_timestamp(f"{len(missing_id_list)} 篇论文缺少pdf地址，合并查询arXiv...")
+        client = client or get_arxiv_client()
+        search = arxiv.Search(id_list=missing_id_list, max_results=len(missing_id_list))
+        for result in client.results(search):
+            result_id = result.get_short_id()
+            # 查询时未带版本号的id，返回结果会带版本号
+            for paper_id in missing_id_list:
+                if result_id == paper_id or result_id.startswith(paper_id + "v"):
+                    pdf_url_dict[paper_id] = result.pdf_url
+
+    return pdf_url_dict
+
+
+def download_pdf(url, file_path, session=None, rate_limiter=PDF_RATE_LIMITER, chunk_size=64 * 1024, timeout=60):
+    """
+    以流式方式下载单个pdf，先写入.part文件，完成后原子替换为目标文件，
+    若存在未完成的.part文件则通过Range请求断点续传
+    :param url: pdf地址
+    :param file_path: 保存的文件路径
+    :param session: HTTP会话
+    :param rate_limiter: 限速器
+    :param chunk_size: 每次写入的块大小
+    :param timeout: 超时时间（秒）
+    :return: 本次下载的字节数
+    """
+    session = session or get_http_session()
+    part_path = file_path + ".part"
+
+    # 已下载的部分
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+
+    if rate_limiter is not None:
+        rate_limiter.wait()
+
+    response = session.get(url, headers=headers, stream=True, timeout=timeout)
+    if response.status_code == 416 and offset:
+        # 续传位置无效（例如.part已经完整或服务器上的文件已变化），删除.part后不带Range重新请求一次
+        response.close()
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(part_path)
+        offset = 0
+        if rate_limiter is not None:
+            rate_limiter.wait()
+        response = session.get(url, stream=True, timeout=timeout)
+
+    downloaded = 0
+    with response:
+        response.raise_for_status()
+        # 服务器不支持断点续传时返回200，从头写入
+        mode = "ab" if offset and response.status_code == 206 else "wb"
+
+        with open(part_path, mode) as f:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                if chunk:
+                    f.write(chunk)
+                    downloaded += len(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+
+    # 原子替换，避免产生不完整的pdf
+    os.replace(part_path, file_path)
+
+    return downloaded
+
+
+def download_papers(pdf_url_dict, dir_path, max_workers=4, rate_limiter=PDF_RATE_LIMITER):
+    """
+    使用线程池并发下载论文pdf
+    :param pdf_url_dict: paper_id 到 pdf 地址的字典
+    :param dir_path: 保存论文pdf的路径
+    :param max_workers: 最大并发数
+    :param rate_limiter: 限速器
+    :return: 下载失败的paper_id列表
+    """
+    if not os.path.exists(dir_path):
+        os.makedirs(dir_path)
+
+    session = get_http_session(pool_size=max_workers)
+
+    def _task(paper_id, url):
+        # 限速等待不计入下载用时
+        if rate_limiter is not None:
+            rate_limiter.wait()
+        start = time.perf_counter()
+        size = download_pdf(url, os.path.join(dir_path, paper_id + ".pdf"), session=session, rate_limiter=None)
+        return size, time.perf_counter() - start
+
+    total_start = time.perf_counter()
+    total_bytes = 0
+    failed_list = []
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        future_dict = {executor.submit(_task, paper_id, url): paper_id for paper_id, url in pdf_url_dict.items()}
+        for future in as_completed(future_dict):
+            paper_id = future_dict[future]
+            try:
+                size, elapsed = future.result()
+            except Exception as e:
+                print_with_timestamp(f"下载 {paper_id}.pdf 失败：{e}")
+                failed_list.append(paper_id)
+                continue
+            total_bytes += size
+            get_metrics().record(paper_id=paper_id, http_calls=1, bytes=size, wall_time=elapsed)
+            speed = size / 1024 / elapsed if elapsed > 0 else 0
+            print_with_timestamp(f"下载 {paper_id}.pdf 完成，{size / 1024:.1f} KB，用时 {elapsed:.2f} 秒，{speed:.1f} KB/s...")
+
+    total_elapsed = time.perf_counter() - total_start
+    print_with_timestamp(f"共下载 {len(pdf_url_dict) - len(failed_list)} 篇论文，"
+                         f"{total_bytes / 1024:.1f} KB，总用时 {total_elapsed:.2f} 秒...")
+
+    return failed_list
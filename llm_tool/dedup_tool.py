@@ -0,0 +1,226 @@
+import re
+import threading
+import zlib
+
+import numpy as np
+
+from llm_tool.arxiv_tool import get_base_id
+from llm_tool.gen_tool import print_with_timestamp
+from llm_tool.store_tool import MinHashStore, SummaryStore, JudgeCache
+
+# MinHash签名的长度，分为LSH_BANDS段，每段LSH_ROWS行，相似度约0.7以上的论文大概率落入同一分桶
+MINHASH_PERMUTATIONS = 128
+LSH_BANDS = 16
+LSH_ROWS = MINHASH_PERMUTATIONS // LSH_BANDS
+
+# 按连续3个词切分标题与摘要
+SHINGLE_SIZE = 3
+
+# 估计的Jaccard相似度不低于该值时视为重复，同一论文的新版本低于该值时视为有实质修改
+DUPLICATE_THRESHOLD = 0.8
+
+# 一次计算签名时的最多分片数，控制 分片数 x 签名长度 的矩阵大小
+MINHASH_CHUNK_SHINGLES = 16384
+
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+
+# 固定随机种子，不同运行之间的签名可以比较
+_random_state = np.random.RandomState(1)
+PERMUTATION_A = _random_state.randint(1, 1 << 31, size=MINHASH_PERMUTATIONS).astype(np.uint64)
+PERMUTATION_B = _random_state.randint(0, 1 << 31, size=MINHASH_PERMUTATIONS).astype(np.uint64)
+
+
+def get_shingles(paper):
+    """
+    将论文的标题与摘要切分为词的3-gram，中文按字切分
+    :param paper: 论文信息
+    :return: 分片哈希值的集合
+    """
+    token_list = re.findall(r"[a-z0-9]+|[\u4e00-\u9fff]",
+                            f"{paper.get('paper_title', '')} {paper.get('paper_abstract', '')}".lower())
+    if len(token_list) < SHINGLE_SIZE:
+        return {zlib.crc32(" ".join(token_list).encode("utf-8"))} if token_list else set()
+    return {zlib.crc32(" ".join(token_list[i:i + SHINGLE_SIZE]).encode("utf-8"))
+            for i in range(len(token_list) - SHINGLE_SIZE + 1)}
+
+
+def compute_signatures(shingle_set_list):
+    """
+    批量计算MinHash签名，按分片数分块进行向量化计算
+    :param shingle_set_list: 每篇论文的分片集合
+    :return: 论文数 x MINHASH_PERMUTATIONS 的uint32数组，没有分片的论文签名全为最大值
+    """
+    signatures = np.full((len(shingle_set_list), MINHASH_PERMUTATIONS), MAX_HASH, dtype=np.uint64)
+    start = 0
+    while start < len(shingle_set_list):
+        # 取若干篇论文拼接为一块，至少包含一篇
+        end = start
+        shingle_number = 0
+        while end < len(shingle_set_list) and (end == start or
+                                               shingle_number + len(shingle_set_list[end]) <= MINHASH_CHUNK_SHINGLES):
+            shingle_number += len(shingle_set_list[end])
+            end += 1
+
+        length_list = [len(shingle_set) for shingle_set in shingle_set_list[start:end]]
+        if shingle_number:
+            shingles = np.fromiter((shingle for shingle_set in shingle_set_list[start:end] for shingle in shingle_set),
+                                   dtype=np.uint64, count=shingle_number)
+            hash_values = (shingles[:, None] * PERMUTATION_A + PERMUTATION_B) % MERSENNE_PRIME & MAX_HASH
+            # 按论文分段取最小值，跳过没有分片的论文
+            offsets = np.cumsum([0] + length_list[:-1])
+            non_empty = np.array(length_list) > 0
+            signatures[start:end][non_empty] = np.minimum.reduceat(hash_values, offsets[non_empty], axis=0)
+        start = end
+    return signatures.astype(np.uint32)
+
+
+def get_buckets(signature):
+    """
+    :param signature: 单篇论文的签名
+    :return: [(band, bucket)] 列表
+    """
+    return [(band, zlib.crc32(signature[band * LSH_ROWS:(band + 1) * LSH_ROWS].tobytes()))
+            for band in range(LSH_BANDS)]
+
+
+def estimate_similarity(signature, other_signature):
+    """
+    :return: 由签名估计的Jaccard相似度
+    """
+    return float(np.mean(signature == other_signature))
+
+
+class PaperDeduplicator:
+    """
+    在大模型筛选之前去除重复论文：本次运行中同一论文的多个版本与近似重复的论文只保留第一篇；
+    与之前运行中已处理过的论文（其他版本或近似重复）相似时复用其打分与总结，有实质修改的新版本重新筛选与总结
+    """
+
+    def __init__(self, root_paper_path, threshold=DUPLICATE_THRESHOLD):
+        """
+        :param root_paper_path: 论文根目录，签名保存在该目录的数据库中
+        :param threshold: 视为重复的相似度
+        """
+        self.threshold = threshold
+        self.minhash_store = MinHashStore(root_paper_path)
+        self.summary_store = SummaryStore(root_paper_path)
+        self.judge_cache = JudgeCache(root_paper_path)
+        self._lock = threading.Lock()
+        # 本次运行已保留的论文
+        self._base_id_dict = dict()
+        self._bucket_dict = dict()
+        self._signature_dict = dict()
+
+    def _find_similar(self, signature, candidate_id_set, signature_dict):
+        """
+        :return: 相似度最高且不低于阈值的 (paper_id, 相似度)，没有时返回 (None, 相似度)
+        """
+        best_id, best_similarity = None, 0.0
+        for candidate_id in sorted(candidate_id_set):
+            if candidate_id not in signature_dict:
+                continue
+            similarity = estimate_similarity(signature, signature_dict[candidate_id])
+            if similarity > best_similarity:
+                best_id, best_similarity = candidate_id, similarity
+        return (best_id, best_similarity) if best_similarity >= self.threshold else (None, best_similarity)
+
+    def filter(self, papers_info):
+        """
+        去除重复论文，并为已处理过的论文复用打分与总结
+        :param papers_info: extract_paper_data 返回的论文信息列表
+        :return: 保留的论文信息列表，保持原有顺序
+        """
+        if not papers_info:
+            return []
+        signatures = compute_signatures([get_shingles(paper) for paper in papers_info])
+        bucket_list = [get_buckets(signature) for signature in signatures]
+        paper_id_list = [paper["paper_id"] for paper in papers_info]
+
+        # 批量查询之前运行中的同一论文的其他版本与同分桶的论文
+        version_dict = self.minhash_store.find_versions({get_base_id(paper_id) for paper_id in paper_id_list})
+        archive_bucket_dict = self.minhash_store.find_buckets({bucket for buckets in bucket_list
+                                                               for bucket in buckets})
+        archive_id_set = {paper_id for id_list in version_dict.values() for paper_id in id_list} | \
+                         {paper_id for id_list in archive_bucket_dict.values() for paper_id in id_list}
+        archive_id_set -= set(paper_id_list)
+        archive_signature_dict = {paper_id: np.frombuffer(signature, dtype=np.uint32) for paper_id, signature
+                                  in self.minhash_store.get_signatures(archive_id_set).items()}
+        summarized_id_set = self.summary_store.summarized_ids(archive_id_set)
+
+        kept_list = []
+        alias_dict = dict()
+        record_list = []
+        with self._lock:
+            for paper, paper_id, signature, buckets in zip(papers_info, paper_id_list, signatures, bucket_list):
+                # 没有标题与摘要的论文无法比较
+                if (signature == np.uint32(MAX_HASH)).all():
+                    kept_list.append(paper)
+                    continue
+                base_id = get_base_id(paper_id)
+                record_list.append((paper_id, base_id, signature.tobytes(), buckets))
+
+                # 本次运行中同一论文的其他版本或近似重复的论文
+                kept_id = self._base_id_dict.get(base_id)
+                if kept_id is None:
+                    run_id_set = {candidate_id for bucket in buckets for candidate_id in self._bucket_dict.get(bucket, [])}
+                    kept_id, _ = self._find_similar(signature, run_id_set, self._signature_dict)
+                if kept_id is not None and kept_id != paper_id:
+                    print_with_timestamp(f"论文 {paper_id} 与 {kept_id} 重复，跳过...")
+                    continue
+
+                # 之前运行中处理过的同一论文的其他版本，或近似重复的论文，优先复用已有总结的论文
+                version_id_set = set(version_dict.get(base_id, [])) - {paper_id}
+                similar_id_set = version_id_set | {candidate_id for bucket in buckets
+                                                   for candidate_id in archive_bucket_dict.get(bucket, [])
+                                                   if candidate_id != paper_id}
+                source_id, similarity = self._find_similar(signature, similar_id_set & summarized_id_set,
+                                                           archive_signature_dict)
+                if source_id is None:
+                    source_id, similarity = self._find_similar(signature, similar_id_set, archive_signature_dict)
+                if source_id is not None:
+                    alias_dict[paper_id] = source_id
+                    print_with_timestamp(f"论文 {paper_id} 与之前的 {source_id} 相似度 {similarity:.2f}，"
+                                         f"复用其筛选与总结结果...")
+                elif version_id_set:
+                    print_with_timestamp(f"论文 {paper_id} 是 {', '.join(sorted(version_id_set))} 的新版本，"
+                                         f"内容有实质修改（相似度 {similarity:.2f}），重新筛选与总结...")
+
+                self._base_id_dict[base_id] = paper_id
+                self._signature_dict[paper_id] = signature
+                for bucket in buckets:
+                    self._bucket_dict.setdefault(bucket, []).append(paper_id)
+                kept_list.append(paper)
+
+        self.minhash_store.put_many(record_list)
+        if alias_dict:
+            self.judge_cache.alias(alias_dict)
+            self.summary_store.alias(alias_dict)
+        if len(kept_list) < len(papers_info) or alias_dict:
+            print_with_timestamp(f"去重完成，{len(papers_info)} 篇论文中跳过 {len(papers_info) - len(kept_list)} "
+                                 f"篇重复论文，{len(alias_dict)} 篇复用之前的结果...")
+        return kept_list
+
+    def close(self):
+        """
+        关闭数据库连接
+        :return: 无返回
+        """
+        self.minhash_store.close()
+        self.summary_store.close()
+        self.judge_cache.close()
+
+
+def dedup_papers(root_paper_path, papers_info, threshold=DUPLICATE_THRESHOLD):
+    """
+    对一次检索的论文去重
+    :param root_paper_path: 论文根目录
+    :param papers_info: extract_paper_data 返回的论文信息列表
+    :param threshold: 视为重复的相似度
+    :return: 保留的论文信息列表
+    """
+    deduplicator = PaperDeduplicator(root_paper_path, threshold)
+    try:
+        return deduplicator.filter(papers_info)
+    finally:
+        deduplicator.close()
@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+import openai
+
+from llm_tool.gen_tool import print_with_timestamp
+from llm_tool.metrics_tool import get_metrics
+
+
+def get_file_hash(file_path):
+    """
+    计算文件的sha256
+    :param file_path: 文件路径
+    :return: sha256的十六进制字符串
+    """
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+class MoonshotFileCache:
+    """
+    Moonshot AI 上传文件的本地缓存，包括：
+    1. moonshot_files.json：paper_id 与文件sha256到云端file_id的映射
+    2. text_cache目录：按文件sha256保存云端抽取的文本
+    每次运行最多请求一次云端文件列表用于与本地映射对账，文本命中缓存时不产生任何请求
+    """
+
+    def __init__(self, root_paper_path):
+        """
+        :param root_paper_path: 论文根目录
+        """
+        self.manifest_path = os.path.join(root_paper_path, "moonshot_files.json")
+        self.text_cache_dir = os.path.join(root_paper_path, "text_cache")
+        if not os.path.exists(self.text_cache_dir):
+            os.makedirs(self.text_cache_dir)
+
+        self.manifest = dict()
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                self.manifest = json.load(f)
+
+        self._lock = threading.Lock()
+        self._reconcile_lock = threading.Lock()
+        self._reconciled = False
+
+    def _save_manifest(self):
+        """
+        保存映射文件，先写临时文件再替换
+        :return: 无返回
+        """
+        with open(self.manifest_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=4)
+        os.replace(self.manifest_path + ".tmp", self.manifest_path)
+
+    def _text_cache_path(self, file_hash):
+        return os.path.join(self.text_cache_dir, file_hash + ".txt")
+
+    def get_cached_text(self, file_hash):
+        """
+        读取缓存的文本
+        :param file_hash: 文件的sha256
+        :return: 文本，不存在时返回None
+        """
+        text_path = self._text_cache_path(file_hash)
+        if not os.path.exists(text_path):
+            return None
+        with open(text_path, "r", encoding="utf-8") as f:
+            return f.read()
+
+    def save_text(self, file_hash, text):
+        """
+        缓存文本
+        :param file_hash: 文件的sha256
+        :param text: 文本
+        :return: 无返回
+        """
+        text_path = self._text_cache_path(file_hash)
+        with open(text_path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(text_path + ".tmp", text_path)
+
+    def reconcile(self, client):
+        """
+        请求一次云端文件列表，与本地映射对账：删除云端已不存在的记录，补充云端已有但本地没有记录的文件
+        :param client: 客户端
+        :return: 无返回
+        """
+        cloud_file_list = client.files.list().data
+        get_metrics().record(http_calls=1)
+        cloud_file_dict = {file.id: file for file in cloud_file_list}
+
+        with self._lock:
+            # 云端已删除的文件
+            for paper_id in [paper_id for paper_id, entry in self.manifest.items()
+                             if entry["file_id"] not in cloud_file_dict]:
+                del self.manifest[paper_id]
+
+            # 旧版本上传、尚未记录的文件，文件内容的sha256在首次使用时补充
+            known_file_id_set = {entry["file_id"] for entry in self.manifest.values()}
+            for file in cloud_file_list:
+                if file.id in known_file_id_set or not file.filename.endswith(".pdf"):
+                    continue
+                paper_id = file.filename[:-len(".pdf")]
+                self.manifest.setdefault(paper_id, {"file_id": file.id, "filename": file.filename, "sha256": None})
+
+            self._save_manifest()
+            self._reconciled = True
+
+        print_with_timestamp(f"云端共有 {len(cloud_file_list)} 个文件，本地记录 {len(self.manifest)} 个文件...")
+
+    def get_text(self, client, pdf_path, paper_id):
+        """
+        获取论文的抽取文本，依次尝试本地缓存、云端已上传的文件、重新上传
+        :param client: 客户端
+        :param pdf_path: 论文pdf的路径
+        :param paper_id: 论文id
+        :return: 文本
+        """
+        file_hash = get_file_hash(pdf_path)
+        text = self.get_cached_text(file_hash)
+        if text is not None:
+            print_with_timestamp(f"论文 {paper_id} 的文本命中本地缓存...")
+            get_metrics().record(paper_id=paper_id, cache_hits=1)
+            return text
+
+        # 首次需要访问云端时对账一次
+        with self._reconcile_lock:
+            if not self._reconciled:
+                self.reconcile(client)
+
+        with self._lock:
+            entry = self.manifest.get(paper_id)
+        if entry is not None and entry["sha256"] in (file_hash, None):
+            try:
+                text = client.files.content(file_id=entry["file_id"]).text
+                get_metrics().record(paper_id=paper_id, http_calls=1, bytes=len(text.encode("utf-8")))
+            except openai.NotFoundError:
+                text = None
+
+        if text is None:
+            file_object = client.files.create(file=Path(str(pdf_path)), purpose="file-extract")
+            entry = {"file_id": file_object.id, "filename": paper_id + ".pdf"}
+            text = client.files.content(file_id=file_object.id).text
+            get_metrics().record(paper_id=paper_id, http_calls=2,
+                                 bytes=os.path.getsize(pdf_path) + len(text.encode("utf-8")))
+
+        with self._lock:
+            self.manifest[paper_id] = dict(entry, sha256=file_hash)
+            self._save_manifest()
+        self.save_text(file_hash, text)
+
+        return text
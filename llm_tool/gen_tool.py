@@ -1,4 +1,11 @@
 import datetime
+import random
+import threading
+import time
+
+# Moonshot AI 的系统提示词，总结与筛选共用，修改后筛选的历史打分不再复用
+MOONSHOT_SYSTEM_PROMPT = "你是 Kimi，由 Moonshot AI 提供的人工智能助手，你更擅长中文和英文的对话。你会为用户提供安全，有帮助，准确的回答。" \
+                         "同时，你会拒绝一切涉及恐怖主义，种族歧视，黄色暴力等问题的回答。Moonshot AI 为专有名词，不可翻译成其他语言。"
 
 
 def print_with_timestamp(*args, **kwargs):
@@ -9,4 +16,99 @@ def print_with_timestamp(*args, **kwargs):
     :return:
     """
     current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    print(current_time, *args, **kwargs)
\ No newline at end of file
+    print(current_time, *args, **kwargs)
+
+
+class RateLimiter:
+    """
+    线程安全的限速器，保证相邻两次请求的开始时间间隔不小于 min_interval 秒
+    """
+
+    def __init__(self, min_interval=3.0):
+        """
+        :param min_interval: 两次请求之间的最小间隔（秒）
+        """
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._next_time = 0.0
+
+    def wait(self):
+        """
+        阻塞直到允许发送下一次请求
+        :return: 无返回
+        """
+        with self._lock:
+            now = time.monotonic()
+            wait_time = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.min_interval
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+
+class TokenBucket:
+    """
+    线程安全的令牌桶，按固定速率补充令牌，用于限制每分钟的请求数或token数
+    """
+
+    def __init__(self, capacity, refill_per_second):
+        """
+        :param capacity: 桶的容量
+        :param refill_per_second: 每秒补充的令牌数
+        """
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self._tokens = capacity
+        self._last_time = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        """
+        阻塞直到取得指定数量的令牌，超过容量的请求按容量计算
+        :param amount: 令牌数量
+        :return: 无返回
+        """
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last_time) * self.refill_per_second)
+                self._last_time = now
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                wait_time = (amount - self._tokens) / self.refill_per_second
+            time.sleep(wait_time)
+
+
+def retry_with_backoff(func, exceptions, max_retries=5, base_delay=2.0, max_delay=60.0, on_retry=None):
+    """
+    调用函数，遇到指定异常时按带随机抖动的指数退避重试
+    :param func: 无参数的函数
+    :param exceptions: 需要重试的异常类型
+    :param max_retries: 最大重试次数
+    :param base_delay: 初始等待时间（秒）
+    :param max_delay: 最大等待时间（秒）
+    :param on_retry: 每次重试前调用的无参数函数，用于记录重试次数
+    :return: 函数的返回值
+    """
+    for retry in range(max_retries + 1):
+        try:
+            return func()
+        except exceptions as e:
+            if retry == max_retries:
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** retry))
+            print_with_timestamp(f"调用失败（{type(e).__name__}），{delay:.1f} 秒后进行第 {retry + 1} 次重试...")
+            if on_retry is not None:
+                on_retry()
+            time.sleep(delay)
+
+
+def estimate_tokens(text):
+    """
+    粗略估计文本的token数量，中文按每字1个token，其他字符按每4个字符1个token
+    :param text: 文本
+    :return: token数量
+    """
+    cjk_number = sum(1 for char in text if "一" <= char <= "鿿")
+    return cjk_number + (len(text) - cjk_number) // 4 + 1
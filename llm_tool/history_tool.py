@@ -0,0 +1,128 @@
+import json
+import os
+
+from llm_tool.moonshot_tool import MOONSHOT_MODELS, MOONSHOT_PRICES
+from llm_tool.render_tool import DAY_DIR_PATTERN, load_paper_data
+
+# 没有记录模型的调用（较早的性能报告）按最小的模型计算费用
+DEFAULT_PRICE = MOONSHOT_PRICES[MOONSHOT_MODELS[0][0]]
+
+
+def get_day_mtime(day_dir):
+    """
+    每日目录及其主题子目录中文件的最近修改时间，只读取文件状态，不读取内容
+    :param day_dir: 每日目录
+    :return: 修改时间
+    """
+    mtime = os.stat(day_dir).st_mtime
+    with os.scandir(day_dir) as entry_iter:
+        for entry in entry_iter:
+            # 下载的pdf不影响统计
+            if entry.name.endswith(".pdf"):
+                continue
+            mtime = max(mtime, entry.stat().st_mtime)
+            if entry.is_dir():
+                mtime = max(mtime, get_day_mtime(entry.path))
+    return mtime
+
+
+def list_days(root_paper_path):
+    """
+    :param root_paper_path: 论文根目录
+    :return: 日期到每日目录修改时间的字典，按日期排序
+    """
+    day_dict = dict()
+    if not os.path.exists(root_paper_path):
+        return day_dict
+    for day in sorted(os.listdir(root_paper_path)):
+        day_dir = os.path.join(root_paper_path, day)
+        if DAY_DIR_PATTERN.match(day) and os.path.isdir(day_dir):
+            day_dict[day] = get_day_mtime(day_dir)
+    return day_dict
+
+
+def load_runs(metrics_path):
+    """
+    从性能报告中汇总每次运行的用时、token数与费用，中断的运行没有汇总记录，按事件计算
+    :param metrics_path: <日期>_metrics.jsonl 文件路径
+    :return: 运行列表，每次运行包含run_id、wall_time、http_calls、prompt_tokens、completion_tokens、cost与各阶段用时stage_dict
+    """
+    run_dict = dict()
+    with open(metrics_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                event = json.loads(line)
+            except json.JSONDecodeError:
+                # 写入中断的最后一行
+                continue
+            run = run_dict.setdefault(event.get("run_id"), {
+                "run_id": event.get("run_id"), "wall_time": None, "http_calls": 0, "prompt_tokens": 0,
+                "completion_tokens": 0, "cost": 0.0, "stage_dict": dict()})
+            if event["type"] == "stage_end":
+                run["stage_dict"][event["stage"]] = run["stage_dict"].get(event["stage"], 0) + event["wall_time"]
+            elif event["type"] == "run_summary":
+                run["wall_time"] = event["wall_time"]
+            elif event["type"] in ("paper", "stage_counter"):
+                tokens = event.get("prompt_tokens", 0) + event.get("completion_tokens", 0)
+                run["http_calls"] += event.get("http_calls", 0)
+                run["prompt_tokens"] += event.get("prompt_tokens", 0)
+                run["completion_tokens"] += event.get("completion_tokens", 0)
+                run["cost"] += tokens * MOONSHOT_PRICES.get(event.get("model"), DEFAULT_PRICE) / 1e6
+
+    run_list = sorted(run_dict.values(), key=lambda run: run["run_id"] or "")
+    for run in run_list:
+        if run["wall_time"] is None:
+            run["wall_time"] = round(sum(run["stage_dict"].values()), 3)
+    return run_list
+
+
+def load_reports(day_dir, day):
+    """
+    读取每日目录中的简报统计，多主题运行的简报保存在主题子目录中
+    :param day_dir: 每日目录
+    :param day: 日期
+    :return: 简报列表，每份简报包含topic、papers（检索数量）、accepted（筛选保留数量）、summarized（总结数量）与html_path
+    """
+    report_list = []
+    for dir_path in [day_dir] + sorted(os.path.join(day_dir, name) for name in os.listdir(day_dir)
+                                       if os.path.isdir(os.path.join(day_dir, name))):
+        paper_data_path = os.path.join(dir_path, day + ".json")
+        if not os.path.exists(paper_data_path):
+            continue
+        topic_paper_dict = load_paper_data(paper_data_path)
+        report = {"topic": "、".join(topic_paper_dict), "accepted": None, "summarized": None, "html_path": None,
+                  "papers": len({paper["paper_id"] for paper_list in topic_paper_dict.values()
+                                 for paper in paper_list})}
+
+        judge_result_path = os.path.join(dir_path, day + "_judge_result.json")
+        if os.path.exists(judge_result_path):
+            with open(judge_result_path, "r", encoding="utf-8") as f:
+                report["accepted"] = len(json.load(f))
+        summary_path = os.path.join(dir_path, day + "_summary.json")
+        if os.path.exists(summary_path):
+            with open(summary_path, "r", encoding="utf-8") as f:
+                report["summarized"] = len(json.load(f))
+        html_path = os.path.join(dir_path, day + ".html")
+        if os.path.exists(html_path):
+            report["html_path"] = html_path
+        report_list.append(report)
+    return report_list
+
+
+def load_day(root_paper_path, day):
+    """
+    读取一天的简报统计与运行记录
+    :param root_paper_path: 论文根目录
+    :param day: 日期，格式为YYYYMMDD
+    :return: {"day": 日期, "reports": load_reports 的结果, "runs": load_runs 的结果}
+    """
+    day_dir = os.path.join(root_paper_path, day)
+    metrics_path = os.path.join(day_dir, day + "_metrics.jsonl")
+    return {
+        "day": day,
+        "reports": load_reports(day_dir, day),
+        "runs": load_runs(metrics_path) if os.path.exists(metrics_path) else [],
+    }
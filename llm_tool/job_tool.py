@@ -0,0 +1,214 @@
+import asyncio
+import datetime
+import os
+import threading
+import time
+
+from llm_tool import metrics_tool
+from llm_tool.gen_tool import print_with_timestamp
+from llm_tool.scheduler_tool import RunLock, ScheduleDaemon, next_run_time, read_last_run
+
+# 运行的状态
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_SKIPPED = "skipped"
+
+
+class JobManager:
+    """
+    在界面进程内管理论文任务：一个后台线程运行事件循环，定时任务与立即运行都交给其中的 ScheduleDaemon 执行，
+    与命令行启动的定时任务共用运行锁，同一时间只运行一个任务。立即运行使用调用时传入的配置，
+    定时任务使用启动时的配置，修改配置后需要重新启动定时任务。
+    运行中各阶段的进度、耗时与token数由性能记录的事件收集，供界面轮询显示
+    """
+
+    def __init__(self, state_dir):
+        """
+        :param state_dir: 保存运行状态与锁文件的目录，即配置中的root_dir
+        """
+        self.state_dir = state_dir
+        self._lock = threading.Lock()
+        self._daemon = None
+        self._scheduler_future = None
+        self._scheduler_error = None
+        self._run = None
+
+        # 唯一的后台线程，进程退出时随之结束
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="paper-job", daemon=True)
+        self._thread.start()
+        metrics_tool.add_run_listener(self._on_event)
+
+    def _new_daemon(self, job, config):
+        """
+        :param job: 任务函数，以配置字典为参数
+        :param config: 配置字典
+        :return: ScheduleDaemon，运行前后记录本次运行的状态
+        """
+        def run_job():
+            self._begin_run()
+            try:
+                job(config)
+            except Exception as e:
+                self._end_run(JOB_FAILED, str(e))
+                raise
+            self._end_run(JOB_DONE)
+
+        return ScheduleDaemon(run_job, config.get("selected_days", []), config["daily_time"][0],
+                              config["daily_time"][1], state_dir=self.state_dir)
+
+    # region 运行状态
+    def _begin_run(self):
+        with self._lock:
+            # 定时触发的运行没有经过 run_now，在这里新建状态
+            if self._run is None or self._run["status"] != JOB_PENDING:
+                self._run = self._new_run("定时")
+            self._run["status"] = JOB_RUNNING
+            self._run["started_at"] = datetime.datetime.now()
+            self._run["start"] = time.perf_counter()
+
+    def _end_run(self, status, error=None):
+        with self._lock:
+            self._run["status"] = status
+            self._run["error"] = error
+            self._run["finished_at"] = datetime.datetime.now()
+            self._run["wall_time"] = time.perf_counter() - self._run["start"]
+
+    @staticmethod
+    def _new_run(trigger):
+        return {"trigger": trigger, "status": JOB_PENDING, "error": None, "started_at": None, "finished_at": None,
+                "start": None, "wall_time": 0.0, "stage_dict": dict()}
+
+    def _on_event(self, event):
+        """
+        性能记录的事件监听函数，在任务线程中调用，只更新内存中的状态
+        :param event: 事件字典，见 metrics_tool.RunMetrics
+        :return: 无返回
+        """
+        with self._lock:
+            if self._run is None or self._run["status"] != JOB_RUNNING or not event.get("stage"):
+                return
+            stage = self._run["stage_dict"].setdefault(event["stage"], {
+                "status": JOB_RUNNING, "start": time.perf_counter(), "wall_time": 0.0, "papers": 0,
+                "http_calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "retries": 0, "cache_hits": 0})
+            if event["type"] == "stage_start":
+                # 多主题运行中同名阶段会多次开始，耗时累加
+                stage["status"] = JOB_RUNNING
+                stage["start"] = time.perf_counter()
+            elif event["type"] == "stage_end":
+                stage["status"] = JOB_DONE
+                stage["wall_time"] += event.get("wall_time", 0)
+            else:
+                if event["type"] == "paper":
+                    stage["papers"] += 1
+                for key in ("http_calls", "prompt_tokens", "completion_tokens", "retries", "cache_hits"):
+                    stage[key] += event.get(key, 0)
+    # endregion
+
+    def is_locked(self):
+        """
+        :return: 运行锁是否被占用，包括本进程与其他进程中正在运行的任务。
+        检查时会短暂持有运行锁，只在手动操作时调用，避免界面刷新时与定时任务争抢
+        """
+        os.makedirs(self.state_dir, exist_ok=True)
+        run_lock = RunLock(os.path.join(self.state_dir, "scheduler.lock"))
+        if not run_lock.acquire():
+            return True
+        run_lock.release()
+        return False
+
+    def is_running(self):
+        """
+        :return: 本进程中是否有任务等待或正在运行
+        """
+        with self._lock:
+            return self._run is not None and self._run["status"] in (JOB_PENDING, JOB_RUNNING)
+
+    def is_scheduling(self):
+        """
+        :return: 定时任务是否已启动
+        """
+        return self._scheduler_future is not None and not self._scheduler_future.done()
+
+    def run_now(self, job, config):
+        """
+        立即运行一次任务，已有任务在运行时拒绝
+        :param job: 任务函数，以配置字典为参数
+        :param config: 配置字典
+        :return: 是否已开始运行
+        """
+        with self._lock:
+            if self._run is not None and self._run["status"] in (JOB_PENDING, JOB_RUNNING):
+                return False
+            if self.is_locked():
+                return False
+            self._run = self._new_run("手动")
+
+        # 每次都按本次传入的配置运行，定时任务仍使用启动时的配置，两者共用运行锁，不会同时运行
+        future = asyncio.run_coroutine_threadsafe(self._new_daemon(job, config).run_job(), self._loop)
+        future.add_done_callback(self._on_run_now_done)
+        return True
+
+    def _on_run_now_done(self, future):
+        # 获取运行锁失败时任务不会开始
+        with self._lock:
+            if self._run is not None and self._run["status"] == JOB_PENDING:
+                self._run["status"] = JOB_SKIPPED
+                self._run["error"] = "已有任务正在运行"
+
+    def start_scheduler(self, job, config):
+        """
+        启动定时任务，已启动时拒绝
+        :param job: 任务函数，以配置字典为参数
+        :param config: 配置字典
+        :return: 是否已启动
+        """
+        with self._lock:
+            if self.is_scheduling():
+                return False
+            self._daemon = self._new_daemon(job, config)
+            self._scheduler_error = None
+            self._scheduler_future = asyncio.run_coroutine_threadsafe(self._daemon.run(), self._loop)
+            self._scheduler_future.add_done_callback(self._on_scheduler_done)
+        print_with_timestamp("定时任务已在界面中启动...")
+        return True
+
+    def _on_scheduler_done(self, future):
+        if not future.cancelled() and future.exception() is not None:
+            self._scheduler_error = str(future.exception())
+            print_with_timestamp(f"定时任务异常退出：{self._scheduler_error}")
+
+    def stop_scheduler(self):
+        """
+        停止定时任务，正在运行的任务会继续运行到结束
+        :return: 无返回
+        """
+        if self.is_scheduling():
+            self._daemon.stop()
+
+    def status(self):
+        """
+        :return: 定时任务与最近一次运行的状态，各阶段按开始的顺序排列
+        """
+        now = time.perf_counter()
+        daemon = self._daemon
+        scheduler = {"running": self.is_scheduling(), "error": self._scheduler_error, "next_run": None,
+                     "last_run": read_last_run(self.state_dir) if os.path.exists(self.state_dir) else None}
+        if scheduler["running"] and daemon.weekdays:
+            scheduler["next_run"] = next_run_time(daemon.weekdays, daemon.hour, daemon.minute,
+                                                  datetime.datetime.now())
+
+        with self._lock:
+            if self._run is None:
+                return {"scheduler": scheduler, "run": None}
+            run = dict(self._run)
+            run["stage_dict"] = {name: dict(stage) for name, stage in self._run["stage_dict"].items()}
+        # 正在运行的任务与阶段按当前时间计算耗时
+        if run["status"] == JOB_RUNNING:
+            run["wall_time"] = now - run["start"]
+            for stage in run["stage_dict"].values():
+                if stage["status"] == JOB_RUNNING:
+                    stage["wall_time"] += now - stage["start"]
+        return {"scheduler": scheduler, "run": run}
@@ -0,0 +1,146 @@
+import datetime
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+from llm_tool.gen_tool import print_with_timestamp
+
+
+def get_inputs_hash(*values):
+    """
+    计算阶段输入的哈希，输入变化后该阶段需要重新运行
+    :param values: 输入，需要可以序列化为json
+    :return: sha256的前16位
+    """
+    content = json.dumps(values, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+
+
+class RunManifest:
+    """
+    单日运行的检查点文件 <日期>_manifest.json，记录每个阶段的状态、输入哈希与输出，以及每篇论文在各阶段的状态，
+    每次更新都先写临时文件再替换。使用 --resume 运行时，已完成且输入未变化的阶段直接复用输出
+    """
+
+    def __init__(self, daily_dir, resume=False):
+        """
+        :param daily_dir: 每日信息保存目录
+        :param resume: 是否从已有的检查点继续，为False时重新开始记录
+        """
+        if not os.path.exists(daily_dir):
+            os.makedirs(daily_dir)
+        self.manifest_path = os.path.join(daily_dir, os.path.basename(daily_dir) + "_manifest.json")
+        self.resume = resume
+        self._lock = threading.Lock()
+
+        self.data = None
+        if resume and os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                self.data = json.load(f)
+            print_with_timestamp(f"从检查点 {self.manifest_path} 继续运行...")
+        if self.data is None:
+            self.data = {"created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+                         "stages": dict(), "papers": dict()}
+            self._save()
+
+    def _save(self):
+        with open(self.manifest_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=4)
+        os.replace(self.manifest_path + ".tmp", self.manifest_path)
+
+    def completed_outputs(self, stage, inputs_hash):
+        """
+        查询可以复用的阶段输出，只有以 --resume 运行、该阶段已完成且输入未变化时才会复用
+        :param stage: 阶段名称
+        :param inputs_hash: 本次的输入哈希
+        :return: 阶段的输出，不能复用时返回None
+        """
+        with self._lock:
+            entry = self.data["stages"].get(stage)
+        if not self.resume or entry is None or entry["status"] != "done" or entry["inputs_hash"] != inputs_hash:
+            return None
+        print_with_timestamp(f"阶段 {stage} 已在之前的运行中完成，跳过...")
+        return entry["outputs"]
+
+    def start_stage(self, stage, inputs_hash):
+        """
+        记录阶段开始
+        :param stage: 阶段名称
+        :param inputs_hash: 输入哈希
+        :return: 无返回
+        """
+        self._update_stage(stage, status="running", inputs_hash=inputs_hash, outputs=dict(), error=None)
+
+    def complete_stage(self, stage, **outputs):
+        """
+        记录阶段完成
+        :param stage: 阶段名称
+        :param outputs: 阶段的输出，例如生成的文件路径
+        :return: 无返回
+        """
+        self._update_stage(stage, status="done", outputs=outputs)
+
+    def fail_stage(self, stage, error):
+        """
+        记录阶段失败
+        :param stage: 阶段名称
+        :param error: 错误信息
+        :return: 无返回
+        """
+        self._update_stage(stage, status="failed", error=str(error))
+
+    @contextmanager
+    def checkpoint(self, stage, inputs_hash):
+        """
+        记录一个阶段的运行，正常结束时记为完成，抛出异常时记为失败
+        :param stage: 阶段名称
+        :param inputs_hash: 输入哈希
+        :return: 阶段输出的字典，在阶段内填写
+        """
+        self.start_stage(stage, inputs_hash)
+        outputs = dict()
+        try:
+            yield outputs
+        except BaseException as e:
+            self.fail_stage(stage, e)
+            raise
+        self.complete_stage(stage, **outputs)
+
+    def _update_stage(self, stage, **fields):
+        with self._lock:
+            entry = self.data["stages"].setdefault(stage, dict())
+            entry.update(fields, updated_at=datetime.datetime.now().isoformat(timespec="seconds"))
+            self._save()
+
+    def set_paper(self, paper_id, stage, status, error=None):
+        """
+        记录单篇论文在某个阶段的状态
+        :param paper_id: 论文id
+        :param stage: 阶段名称
+        :param status: 状态，done或failed
+        :param error: 错误信息
+        :return: 无返回
+        """
+        with self._lock:
+            entry = self.data["papers"].setdefault(paper_id, dict())
+            entry[stage] = {"status": status, "error": None if error is None else str(error),
+                            "updated_at": datetime.datetime.now().isoformat(timespec="seconds")}
+            self._save()
+
+    def set_papers(self, paper_id_list, stage, status, error=None):
+        """
+        批量记录论文在某个阶段的状态
+        :param paper_id_list: 论文id列表
+        :param stage: 阶段名称
+        :param status: 状态，done或failed
+        :param error: 错误信息
+        :return: 无返回
+        """
+        current_time = datetime.datetime.now().isoformat(timespec="seconds")
+        with self._lock:
+            for paper_id in paper_id_list:
+                self.data["papers"].setdefault(paper_id, dict())[stage] = {
+                    "status": status, "error": None if error is None else str(error), "updated_at": current_time}
+            self._save()
@@ -0,0 +1,218 @@
+import datetime
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from llm_tool.gen_tool import print_with_timestamp
+
+# 记录的计数项
+COUNTER_KEYS = ("wall_time", "http_calls", "bytes", "prompt_tokens", "completion_tokens", "retries", "cache_hits")
+
+
+class RunMetrics:
+    """
+    单次运行的性能记录，按阶段和论文记录耗时、HTTP请求数与字节数、大模型token数、重试次数和缓存命中次数，
+    运行结束后以JSONL格式追加写入每日目录下的 <日期>_metrics.jsonl
+    """
+
+    def __init__(self, report_path=None):
+        """
+        :param report_path: 报告文件路径，为空时不写文件
+        """
+        self.report_path = report_path
+        self.run_id = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+        self._global_stage = None
+        self._local = threading.local()
+        self._event_list = []
+        self._stage_time_dict = dict()
+        self._listener_list = []
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+
+    @property
+    def current_stage(self):
+        """
+        当前线程所属的阶段，线程未绑定阶段时使用最近开始的阶段
+        """
+        return getattr(self._local, "stage", None) or self._global_stage
+
+    def bind_stage(self, name):
+        """
+        将当前线程的记录绑定到指定阶段，用于多个阶段同时进行的流式执行
+        :param name: 阶段名称
+        :return: 无返回
+        """
+        self._local.stage = name
+
+    def add_listener(self, listener):
+        """
+        添加事件监听函数，每条记录产生时以事件字典为参数调用
+        :param listener: 监听函数
+        :return: 无返回
+        """
+        self._listener_list.append(listener)
+
+    def _emit(self, event):
+        with self._lock:
+            self._event_list.append(event)
+        for listener in self._listener_list:
+            listener(event)
+
+    @contextmanager
+    def stage(self, name):
+        """
+        记录一个阶段的耗时，阶段内未指定阶段的记录都归入该阶段
+        :param name: 阶段名称
+        """
+        previous_stage = self._global_stage
+        previous_local_stage = getattr(self._local, "stage", None)
+        self._global_stage = name
+        self._local.stage = name
+        self._emit({"type": "stage_start", "run_id": self.run_id, "stage": name,
+                    "time": datetime.datetime.now().isoformat(timespec="seconds")})
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._stage_time_dict[name] = self._stage_time_dict.get(name, 0) + elapsed
+            self._emit({"type": "stage_end", "run_id": self.run_id, "stage": name, "wall_time": round(elapsed, 3),
+                        "time": datetime.datetime.now().isoformat(timespec="seconds")})
+            self._global_stage = previous_stage
+            self._local.stage = previous_local_stage
+
+    def record(self, stage=None, paper_id=None, model=None, **counters):
+        """
+        记录一次计数
+        :param stage: 阶段名称，为空时使用当前阶段
+        :param paper_id: 论文id
+        :param model: 大模型调用使用的模型，用于按模型计算费用
+        :param counters: 计数项，见COUNTER_KEYS
+        :return: 无返回
+        """
+        event = {"type": "paper" if paper_id else "stage_counter", "run_id": self.run_id,
+                 "stage": stage or self.current_stage, "paper_id": paper_id}
+        if model:
+            event["model"] = model
+        event.update({key: round(value, 3) if isinstance(value, float) else value
+                      for key, value in counters.items() if key in COUNTER_KEYS})
+        self._emit(event)
+
+    def summary(self):
+        """
+        按阶段汇总计数
+        :return: 阶段名称到汇总计数的字典
+        """
+        summary_dict = dict()
+        with self._lock:
+            event_list = list(self._event_list)
+            stage_time_dict = dict(self._stage_time_dict)
+        for event in event_list:
+            # 按阶段开始的顺序汇总
+            if event["type"] == "stage_start":
+                summary_dict.setdefault(event["stage"], {key: 0 for key in COUNTER_KEYS})
+            if event["type"] not in ("paper", "stage_counter"):
+                continue
+            stage_summary = summary_dict.setdefault(event["stage"], {key: 0 for key in COUNTER_KEYS})
+            for key in COUNTER_KEYS:
+                if key != "wall_time":
+                    stage_summary[key] += event.get(key, 0)
+        for stage, elapsed in stage_time_dict.items():
+            summary_dict.setdefault(stage, {key: 0 for key in COUNTER_KEYS})["wall_time"] = round(elapsed, 3)
+        return summary_dict
+
+    def finish(self):
+        """
+        结束本次运行，打印各阶段汇总并写入报告文件
+        :return: 各阶段的汇总
+        """
+        summary_dict = self.summary()
+        total_time = time.perf_counter() - self._start
+
+        for stage, stage_summary in summary_dict.items():
+            print_with_timestamp(
+                f"阶段 {stage}：用时 {stage_summary['wall_time']:.2f} 秒，HTTP请求 {stage_summary['http_calls']} 次，"
+                f"{stage_summary['bytes'] / 1024:.1f} KB，tokens {stage_summary['prompt_tokens']}+"
+                f"{stage_summary['completion_tokens']}，重试 {stage_summary['retries']} 次，"
+                f"缓存命中 {stage_summary['cache_hits']} 次")
+        print_with_timestamp(f"本次运行总用时 {total_time:.2f} 秒...")
+
+        if self.report_path:
+            with self._lock:
+                line_list = [json.dumps(event, ensure_ascii=False) for event in self._event_list]
+            line_list += [json.dumps(dict(type="stage_summary", run_id=self.run_id, stage=stage, **stage_summary),
+                                     ensure_ascii=False) for stage, stage_summary in summary_dict.items()]
+            line_list.append(json.dumps({"type": "run_summary", "run_id": self.run_id,
+                                         "wall_time": round(total_time, 3)}))
+            os.makedirs(os.path.dirname(self.report_path), exist_ok=True)
+            with open(self.report_path, "a", encoding="utf-8") as f:
+                f.write("\n".join(line_list) + "\n")
+            print_with_timestamp(f"性能报告已写入 {self.report_path}...")
+
+        return summary_dict
+
+
+# 当前运行的性能记录，未开始运行时使用不写文件的记录
+_current_metrics = RunMetrics()
+
+# 每次新的运行都会添加的事件监听函数，例如界面上的进度显示
+_run_listener_list = []
+
+
+def add_run_listener(listener):
+    """
+    添加对之后每次运行都生效的事件监听函数
+    :param listener: 监听函数，以事件字典为参数
+    :return: 无返回
+    """
+    if listener not in _run_listener_list:
+        _run_listener_list.append(listener)
+
+
+def remove_run_listener(listener):
+    """
+    移除 add_run_listener 添加的监听函数，已开始的运行不受影响
+    :param listener: 监听函数
+    :return: 无返回
+    """
+    if listener in _run_listener_list:
+        _run_listener_list.remove(listener)
+
+
+def start_run(daily_dir):
+    """
+    开始一次新的运行
+    :param daily_dir: 每日信息保存目录
+    :return: RunMetrics
+    """
+    global _current_metrics
+    report_path = os.path.join(daily_dir, os.path.basename(daily_dir) + "_metrics.jsonl")
+    _current_metrics = RunMetrics(report_path)
+    for listener in list(_run_listener_list):
+        _current_metrics.add_listener(listener)
+    return _current_metrics
+
+
+def get_metrics():
+    """
+    获取当前运行的性能记录
+    :return: RunMetrics
+    """
+    return _current_metrics
+
+
+def record_completion(completion, paper_id=None, stage=None):
+    """
+    记录一次大模型调用的token消耗
+    :param completion: chat.completions 的返回结果
+    :param paper_id: 论文id
+    :param stage: 阶段名称
+    :return: 无返回
+    """
+    usage = getattr(completion, "usage", None)
+    get_metrics().record(stage=stage, paper_id=paper_id, model=getattr(completion, "model", None), http_calls=1,
+                         prompt_tokens=getattr(usage, "prompt_tokens", 0) or 0,
+                         completion_tokens=getattr(usage, "completion_tokens", 0) or 0)
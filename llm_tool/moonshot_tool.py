@@ -1,19 +1,61 @@
+import hashlib
 import json
 import os
-import re
-from pathlib import Path
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from openai import OpenAI
 import openai
-import time
 
-from llm_tool.gen_tool import print_with_timestamp
+from llm_tool.gen_tool import print_with_timestamp, TokenBucket, retry_with_backoff, estimate_tokens, \
+    MOONSHOT_SYSTEM_PROMPT
+from llm_tool.metrics_tool import get_metrics, record_completion
+from llm_tool.file_cache_tool import MoonshotFileCache, get_file_hash
+from llm_tool.manifest_tool import get_inputs_hash
+from llm_tool.pdf_text_tool import get_text_extractor
+from llm_tool.screen_tool import score_papers, select_top_papers, get_prompt_hash
+from llm_tool.parse_tool import parse_response, ResponseParseError, SUMMARY_SCHEMA, JSON_MODE
+from llm_tool.store_tool import SummaryStore, JudgeCache, TokenCountStore, ResponseStore
+
+# Moonshot AI 各账户等级的速率限制，免费账户每分钟仅能请求3次且只能单并发
+MOONSHOT_ACCOUNT_LIMITS = {
+    "free": {"rpm": 3, "tpm": 32000, "max_workers": 1},
+    "paid": {"rpm": 200, "tpm": 128000, "max_workers": 8},
+}
+
+# 总结使用的模型及其上下文长度，从小到大排列
+MOONSHOT_MODELS = [("moonshot-v1-8k", 8 * 1024), ("moonshot-v1-32k", 32 * 1024), ("moonshot-v1-128k", 128 * 1024)]
+
+# 各模型的价格（元/百万tokens），输入与输出相同
+MOONSHOT_PRICES = {"moonshot-v1-8k": 12, "moonshot-v1-32k": 24, "moonshot-v1-128k": 60}
+
+# 总结回复预留的token数
+SUMMARY_OUTPUT_TOKENS = 1000
+
+# 本地估计的token数可能偏小，选择模型时预留的余量
+TOKEN_ESTIMATE_MARGIN = 1.15
+
+# 分段总结时每段的token数
+MAP_CHUNK_TOKENS = 24 * 1024
 
 # from dotenv import load_dotenv
 #
 # load_dotenv()
 
 
+def get_moonshot_client():
+    """
+    构造 Moonshot AI 客户端，重试由调用方的退避逻辑负责
+    :return: OpenAI 客户端
+    """
+    return OpenAI(
+        api_key=os.getenv("KIMI_API_KEY"),
+        base_url=os.getenv("KIMI_BASE_URL"),
+        max_retries=0,
+    )
+
+
 def extract_paper_data(paper_data_path):
     """
     从json中读取数据，并仅保留paper_id、paper_title、paper_abstract字段
@@ -24,9 +66,14 @@ def extract_paper_data(paper_data_path):
         paper_data = json.load(f)
     # 提取每篇文章的信息
     papers_info = []
+    # 旧版本的文件中同一篇论文可能出现在多个关键词下
+    seen_id_set = set()
     for category, subcategories in paper_data.items():
         for subcategory, papers in subcategories.items():
             for paper_id, paper_info in papers.items():
+                if paper_info["paper_id"] in seen_id_set:
+                    continue
+                seen_id_set.add(paper_info["paper_id"])
                 article = {
                     "paper_id": paper_info["paper_id"],
                     "paper_title": paper_info["paper_title"],
@@ -35,6 +82,9 @@ def extract_paper_data(paper_data_path):
                     "paper_primary_category": paper_info["paper_primary_category"],
                     "paper_published_time": paper_info["paper_published_time"],
                     "paper_entry_id": paper_info["paper_entry_id"],
+                    # 旧版本的文件中没有以下字段
+                    "paper_pdf_url": paper_info.get("paper_pdf_url"),
+                    "paper_version": paper_info.get("paper_version"),
                 }
                 papers_info.append(article)
 
@@ -45,164 +95,414 @@ def update_judge_results(paper_data_path, judge_results):
     """
     更新筛选结果
     :param paper_data_path: 论文信息地址
-    :param judge_results: 判别结果
+    :param judge_results: 判别结果，[{"paper_id": , "score": }] 列表
     :return: none
     """
     judge_result_path = paper_data_path.replace(".json", "_judge_result.json")
     with open(judge_result_path, "w", encoding="utf-8") as f:
-        # 去除首尾的```json
-        print(judge_results)
-        pattern = re.compile(r'`json\s*(.*?)\s*`', re.DOTALL)
-        json_results = json.loads(pattern.findall(judge_results)[0])
-        if type(json_results) is not list:
-            json_results = [json_results]
-        json.dump(json_results, f, ensure_ascii=False, indent=4)
+        json.dump(judge_results, f, ensure_ascii=False, indent=4)
+
+    # 筛选结果已经变化，之前记录的输入哈希不再对应
+    judge_hash_path = get_judge_hash_path(judge_result_path)
+    if os.path.exists(judge_hash_path):
+        os.remove(judge_hash_path)
 
     return judge_result_path
 
 
-def judge_paper(paper_data_path, paper_number, judge_number=2, llm="openai"):
+def get_judge_hash_path(judge_result_path):
+    """
+    :param judge_result_path: 筛选结果文件路径
+    :return: 记录筛选输入哈希的文件路径
+    """
+    return judge_result_path.replace(".json", ".hash")
+
+
+def read_judge_hash(judge_result_path):
+    """
+    读取生成筛选结果时的输入哈希
+    :param judge_result_path: 筛选结果文件路径
+    :return: 输入哈希，没有记录时返回None
+    """
+    judge_hash_path = get_judge_hash_path(judge_result_path)
+    if not os.path.exists(judge_hash_path):
+        return None
+    with open(judge_hash_path, "r", encoding="utf-8") as f:
+        return f.read().strip()
+
+
+def judge_paper(paper_data_path, paper_number, judge_number=2, llm="openai", is_free_account=True, rpm=None,
+                tpm=None, max_workers=None, token_budget=4000, candidate_ids=None, topic="", root_paper_path=None):
     """
-    使用 Kimi 对论文进行筛选
+    使用 Kimi 对论文进行筛选，论文按token预算分批并发打分后取全局前judge_number篇
     :param judge_number: 筛选得到的论文数量
     :param llm: 大模型选择
     :param paper_data_path: 论文数据的地址
+    :param is_free_account: 是否是免费账户
+    :param rpm: 每分钟请求数，为空时按账户类型取默认值
+    :param tpm: 每分钟token数，为空时按账户类型取默认值
+    :param max_workers: 并发数，为空时按账户类型取默认值
+    :param token_budget: 每批论文的token上限
+    :param candidate_ids: 本地预筛选保留的paper_id列表，为空时对全部论文进行筛选
+    :param topic: 主题，用于跨天复用历史打分
+    :param root_paper_path: 论文根目录，历史打分保存在该目录的数据库中，为空时不复用
     :return: 筛选后论文的id，并保存为文件
     """
+    # 论文信息、候选论文、筛选数量或提示词变化后，之前的筛选结果不再复用，重新筛选时历史打分仍从缓存中读取
     judge_result_path = paper_data_path.replace(".json", "_judge_result.json")
-    if os.path.exists(judge_result_path):
+    candidate_key = sorted(candidate_ids) if candidate_ids is not None else None
+    judge_hash = get_inputs_hash(get_file_hash(paper_data_path), candidate_key, judge_number, llm, get_prompt_hash())
+    if os.path.exists(judge_result_path) and read_judge_hash(judge_result_path) == judge_hash:
         print_with_timestamp("论文筛选结果已经存在，从本地文件中读取...")
         return judge_result_path
 
-    # 从论文json中提取paper_id、paper_title、paper_abstract字段
+    # 从论文json中提取论文信息，打分时只发送paper_id、paper_title、paper_abstract字段
     papers_info = extract_paper_data(paper_data_path)
+    if candidate_ids is not None:
+        candidate_id_set = set(candidate_ids)
+        papers_info = [paper for paper in papers_info if paper["paper_id"] in candidate_id_set]
 
     if len(papers_info) < judge_number:
         judge_number = len(papers_info)
 
     if llm == "moonshot":
-        client = OpenAI(
-            api_key=os.getenv("KIMI_API_KEY"),
-            base_url=os.getenv("KIMI_BASE_URL"),
-        )
-        completion = client.chat.completions.create(
-            model="moonshot-v1-8k",
-            messages=[
-                {"role": "system",
-                 "content": "你是 Kimi，由 Moonshot AI 提供的人工智能助手，你更擅长中文和英文的对话。你会为用户提供安全，有帮助，准确的回答。"
-                            "同时，你会拒绝一切涉及恐怖主义，种族歧视，黄色暴力等问题的回答。Moonshot AI 为专有名词，不可翻译成其他语言。"},
-                {"role": "user",
-                 "content": f"{papers_info} \n " + f"从用户提供的论文列表中选择{judge_number}" + "篇适合建筑领域人士阅读的论文，必须以[{\"paper_id\": ""}]的json格式返回结果，禁止添加其他内容"}
-            ],
-            temperature=0,
-        )
+        client = get_moonshot_client()
+        model = "moonshot-v1-8k"
+        rate_limiter, max_workers = get_rate_limiter(is_free_account, rpm, tpm, max_workers)
     else:
         client = OpenAI(
             api_key=os.getenv("OPENAI_API_KEY"),
             base_url=os.getenv("OPENAI_BASE_URL"),
         )
-        completion = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system",
-                 "content": ""},
-                {"role": "user",
-                 "content": f"{papers_info} \n " + f"从用户提供的论文列表中选择{judge_number}" + "篇适合建筑领域人士阅读的论文，只需要以[{\"paper_id\": ""}]的json格式返回论文的paper_id，不需要其他内容"}
-            ],
-            temperature=0,
-        )
-    judge_results = completion.choices[0].message.content
+        model = "gpt-3.5-turbo"
+        rate_limiter, max_workers = None, max_workers or 4
+
+    # 读取历史打分，只对未打过分的论文调用大模型
+    score_dict = dict()
+    judge_cache = JudgeCache(root_paper_path) if root_paper_path else None
+    prompt_hash = get_prompt_hash()
+    if judge_cache is not None:
+        score_dict = judge_cache.get_scores([paper["paper_id"] for paper in papers_info], topic, prompt_hash, model)
+        print_with_timestamp(f"{len(score_dict)} 篇论文已有历史打分，无需重新筛选...")
+        get_metrics().record(cache_hits=len(score_dict))
+
+    uncached_papers_info = [paper for paper in papers_info if paper["paper_id"] not in score_dict]
+    if uncached_papers_info:
+        response_store = ResponseStore(root_paper_path) if root_paper_path else None
+        new_score_dict = score_papers(client, model, uncached_papers_info, token_budget=token_budget,
+                                      max_workers=max_workers, rate_limiter=rate_limiter,
+                                      response_store=response_store)
+        if response_store is not None:
+            response_store.close()
+        if judge_cache is not None:
+            judge_cache.put_scores(new_score_dict, topic, prompt_hash, model)
+        score_dict.update(new_score_dict)
+
+    if judge_cache is not None:
+        judge_cache.close()
+
+    judge_results = select_top_papers(papers_info, score_dict, judge_number)
     judge_result_path = update_judge_results(paper_data_path, judge_results)
+    with open(get_judge_hash_path(judge_result_path), "w", encoding="utf-8") as f:
+        f.write(judge_hash)
     print_with_timestamp(f"论文筛选完成，从总共 {paper_number} 篇论文中保留了 {judge_number} 篇论文...")
 
     return judge_result_path
 
 
-def get_summary_from_moonshot(client, dir_path, paper_id):
+def build_summary_messages(paper_id, file_content):
+    """
+    构造总结的对话
+    :param paper_id: 论文id
+    :param file_content: 论文文本
+    :return: messages
+    """
+    return [
+        {"role": "system", "content": MOONSHOT_SYSTEM_PROMPT},
+        {
+            "role": "system",
+            "content": file_content,
+        },
+        {
+            "role": "user",
+            "content": f"请用中文对{paper_id}.pdf进行总结归纳，不超过400字，并且列举2个创新点，以json格式返回,格式为"
+                       + '{"summary": 在这里填写总结归纳内容, "keypoints_1": 在这里填写第一个创新点内容, '
+                         '"keypoints_2": 在这里填写第二个创新点内容}'
+        }
+    ]
+
+
+def route_model(prompt_tokens, exact=False):
+    """
+    选择能容纳提示词与回复的最小模型
+    :param prompt_tokens: 提示词的token数
+    :param exact: token数是否为接口返回的实际值，估计值会预留余量
+    :return: 模型名称，没有能容纳的模型时返回None
+    """
+    required_tokens = (prompt_tokens if exact else int(prompt_tokens * TOKEN_ESTIMATE_MARGIN)) + SUMMARY_OUTPUT_TOKENS
+    for model, context_tokens in MOONSHOT_MODELS:
+        if required_tokens <= context_tokens:
+            return model
+    return None
+
+
+def split_text(text, chunk_tokens):
     """
-    从Moonshot AI获取论文总结
+    按段落将文本切分为token数不超过chunk_tokens的片段，过长的段落按字符切分
+    :param text: 文本
+    :param chunk_tokens: 每个片段的token上限
+    :return: 片段列表
+    """
+    chunk_list = []
+    line_list = []
+    current_tokens = 0
+    for line in text.splitlines():
+        line_tokens = estimate_tokens(line)
+        if line_tokens > chunk_tokens:
+            # 超长的一行按token数的比例切分
+            step = max(1, len(line) * chunk_tokens // line_tokens)
+            line_piece_list = [line[i:i + step] for i in range(0, len(line), step)]
+        else:
+            line_piece_list = [line]
+        for piece in line_piece_list:
+            piece_tokens = estimate_tokens(piece)
+            if line_list and current_tokens + piece_tokens > chunk_tokens:
+                chunk_list.append("\n".join(line_list))
+                line_list = []
+                current_tokens = 0
+            line_list.append(piece)
+            current_tokens += piece_tokens
+    if line_list:
+        chunk_list.append("\n".join(line_list))
+    return chunk_list
+
+
+def call_moonshot(client, model, messages, paper_id, rate_limiter=None, estimated_tokens=None, response_format=None):
+    """
+    调用一次Moonshot AI并记录token消耗
+    :param client: 客户端
+    :param model: 模型名称
+    :param messages: 对话
+    :param paper_id: 论文id
+    :param rate_limiter: 请求数与token数的限速器
+    :param estimated_tokens: 预计消耗的token数，为空时按对话内容估计
+    :param response_format: 回复格式，例如JSON模式，为空时不限制
+    :return: completion
+    """
+    # 按预计消耗的token数进行限速
+    if rate_limiter is not None:
+        if estimated_tokens is None:
+            estimated_tokens = sum(estimate_tokens(message["content"]) for message in messages) + SUMMARY_OUTPUT_TOKENS
+        rate_limiter.acquire(estimated_tokens)
+
+    if response_format is not None:
+        completion = client.chat.completions.create(model=model, messages=messages, temperature=0,
+                                                    response_format=response_format)
+    else:
+        completion = client.chat.completions.create(model=model, messages=messages, temperature=0)
+    record_completion(completion, paper_id=paper_id)
+    return completion
+
+
+def map_reduce_summary(client, paper_id, file_content, rate_limiter=None):
+    """
+    文本超过所有模型的上下文长度时，先分段概括，再对各段的概括进行总结
+    :param client: 客户端
+    :param paper_id: 论文id
+    :param file_content: 论文文本
+    :param rate_limiter: 请求数与token数的限速器
+    :return: completion
+    """
+    chunk_list = split_text(file_content, MAP_CHUNK_TOKENS)
+    print_with_timestamp(f"论文 {paper_id} 超过模型的上下文长度，分为 {len(chunk_list)} 段分别概括...")
+
+    partial_summary_list = []
+    for i, chunk in enumerate(chunk_list):
+        messages = [
+            {"role": "system", "content": MOONSHOT_SYSTEM_PROMPT},
+            {"role": "system", "content": chunk},
+            {"role": "user", "content": f"以上是{paper_id}.pdf的第{i + 1}/{len(chunk_list)}部分，"
+                                        f"请用中文概括这一部分的主要内容与创新之处，不超过300字"},
+        ]
+        # 单段失败时只重试该段
+        completion = retry_with_backoff(
+            lambda: call_moonshot(client, route_model(estimate_tokens(chunk)) or MOONSHOT_MODELS[-1][0], messages,
+                                  paper_id, rate_limiter),
+            exceptions=(openai.RateLimitError, openai.APIConnectionError),
+            on_retry=lambda: get_metrics().record(paper_id=paper_id, retries=1))
+        partial_summary_list.append(f"第{i + 1}部分：{completion.choices[0].message.content}")
+
+    messages = build_summary_messages(paper_id, "\n\n".join(partial_summary_list))
+    prompt_tokens = sum(estimate_tokens(message["content"]) for message in messages)
+    return call_moonshot(client, route_model(prompt_tokens) or MOONSHOT_MODELS[-1][0], messages, paper_id,
+                         rate_limiter, response_format=JSON_MODE)
+
+
+def get_summary_from_moonshot(client, dir_path, paper_id, rate_limiter=None, file_cache=None, text_extractor=None,
+                              token_store=None, response_store=None):
+    """
+    从Moonshot AI获取论文总结，按文本的token数选择能容纳的最小模型，都无法容纳时分段总结
     :param client: 客户端
     :param dir_path: 保存目录
     :param paper_id: 论文id
+    :param rate_limiter: 请求数与token数的限速器
+    :param file_cache: 上传文件与抽取文本的本地缓存，为空时在保存目录下新建
+    :param text_extractor: 本地文本抽取器，不为空时优先在本地抽取，失败时再通过Moonshot AI抽取
+    :param token_store: 每篇论文token数的缓存
+    :param response_store: 保存原始回复的ResponseStore，之前解析失败的回复会先尝试修复
     :return:
     """
-    # 请求文件列表
-    cloud_file_list = client.files.list().data  # 从服务端获取文件列表
+    def _repair(repair_messages):
+        # 修复时只发送原始回复，使用最小的模型
+        repair_completion = retry_with_backoff(
+            lambda: call_moonshot(client, MOONSHOT_MODELS[0][0], repair_messages, paper_id, rate_limiter,
+                                  response_format=JSON_MODE),
+            exceptions=(openai.RateLimitError, openai.APIConnectionError),
+            on_retry=lambda: get_metrics().record(paper_id=paper_id, retries=1))
+        return repair_completion.choices[0].message.content
+
+    # 之前的运行中已经付费但未能解析的回复，先尝试修复，不再重新总结
+    latest_response = response_store.latest("summary", paper_id) if response_store is not None else None
+    if latest_response is not None and not latest_response[1]:
+        try:
+            summary_content = parse_response(latest_response[0], SUMMARY_SCHEMA, repair=_repair,
+                                             response_store=response_store, kind="summary", item_key=paper_id)
+            print_with_timestamp(f"论文 {paper_id} 的总结从之前保存的回复中恢复...")
+            return summary_content
+        except ResponseParseError as e:
+            print_with_timestamp(f"论文 {paper_id} 之前保存的回复仍无法解析（{e}），重新总结...")
+
+    if file_cache is None:
+        file_cache = MoonshotFileCache(dir_path)
 
     # 文件地址
     paper_pdf = os.path.join(dir_path, paper_id + ".pdf")
 
-    # 使用列表解析来查找文件名，并提取对应的id
-    result = [file.id for file in cloud_file_list if file.filename == (paper_id + ".pdf")]
-
-    # 若云端已有该论文，则直接从云端提问，否则需要上传
-    if result:
-        file_content = client.files.content(file_id=result[0]).text
-
-        # 调用kimi对论文进行摘要
-        try:
-            completion = client.chat.completions.create(
-                model="moonshot-v1-32k",
-                messages=[
-                    {"role": "system",
-                     "content": "你是 Kimi，由 Moonshot AI 提供的人工智能助手，你更擅长中文和英文的对话。你会为用户提供安全，有帮助，准确的回答。"
-                                "同时，你会拒绝一切涉及恐怖主义，种族歧视，黄色暴力等问题的回答。Moonshot AI 为专有名词，不可翻译成其他语言。"},
-                    {
-                        "role": "system",
-                        "content": file_content,
-                    },
-                    {
-                        "role": "user",
-                        "content": f"请用中文对{paper_id}.pdf进行总结归纳，不超过400字，并且列举2个创新点，以json格式返回,格式为"
-                                   + '{"summary": 在这里填写总结归纳内容, "keypoints_1": 在这里填写第一个创新点内容, '
-                                     '"keypoints_2": 在这里填写第二个创新点内容}'
-                    }
-                ],
-                temperature=0,
-            )
-        except openai.RateLimitError as e:
-            print_with_timestamp("触发速率限制，重新调用总结程序...")
-            get_summary_from_moonshot(client, dir_path, paper_id)
+    file_content = None
+    if text_extractor is not None:
+        file_content = text_extractor.get_text(paper_pdf, paper_id)
+    if file_content is None:
+        # 依次从本地缓存、云端已上传的文件中获取文本，都没有时再上传
+        file_content = file_cache.get_text(client, paper_pdf, paper_id)
+
+    messages = build_summary_messages(paper_id, file_content)
+
+    # 读取缓存的token数，没有时在本地估计
+    text_hash = hashlib.sha256(file_content.encode("utf-8")).hexdigest()
+    token_count = token_store.get(paper_id, text_hash) if token_store is not None else None
+    if token_count is None:
+        token_count = (sum(estimate_tokens(message["content"]) for message in messages), False)
+        if token_store is not None:
+            token_store.put(paper_id, text_hash, *token_count)
+    prompt_tokens, exact = token_count
+
+    model = route_model(prompt_tokens, exact)
+    if model is None:
+        completion = map_reduce_summary(client, paper_id, file_content, rate_limiter)
     else:
-        # 文件对象
-        file_object = client.files.create(file=Path(str(paper_pdf)), purpose="file-extract")
-        file_content = client.files.content(file_id=file_object.id).text
-
-        # 调用kimi对论文进行摘要
-        completion = client.chat.completions.create(
-            model="moonshot-v1-32k",
-            messages=[
-                {"role": "system",
-                 "content": "你是 Kimi，由 Moonshot AI 提供的人工智能助手，你更擅长中文和英文的对话。你会为用户提供安全，有帮助，准确的回答。"
-                            "同时，你会拒绝一切涉及恐怖主义，种族歧视，黄色暴力等问题的回答。Moonshot AI 为专有名词，不可翻译成其他语言。"},
-                {
-                    "role": "system",
-                    "content": file_content,
-                },
-                {
-                    "role": "user",
-                    "content": f"请用中文对{paper_id}.pdf进行总结归纳，不超过400字，并且列举2个创新点，以json格式返回,格式为"
-                               + '{"summary": 在这里填写总结归纳内容, "keypoints_1": 在这里填写第一个创新点内容, '
-                                 '"keypoints_2": 在这里填写第二个创新点内容}'
-                }
-            ],
-            temperature=0,
-        )
-
-    summary_content = json.loads(completion.choices[0].message.content.strip("```json"))
+        print_with_timestamp(f"论文 {paper_id} 约 {prompt_tokens} 个token，使用 {model} 总结...")
+        completion = call_moonshot(client, model, messages, paper_id, rate_limiter,
+                                   prompt_tokens + SUMMARY_OUTPUT_TOKENS, response_format=JSON_MODE)
+        # 保存接口返回的实际token数，之后的运行可以更准确地选择模型
+        usage_tokens = getattr(completion.usage, "prompt_tokens", None)
+        if token_store is not None and usage_tokens:
+            token_store.put(paper_id, text_hash, usage_tokens, exact=True)
+
+    summary_content = parse_response(completion.choices[0].message.content, SUMMARY_SCHEMA, repair=_repair,
+                                     response_store=response_store, kind="summary", item_key=paper_id)
     print_with_timestamp(f"论文 {paper_id} 的总结共计消耗tokens：{completion.usage.total_tokens}")
 
     return summary_content
 
 
-def summary_paper(judge_result_path, root_paper_path, daily_dir, is_free_account=True):
+def summarize_with_retry(client, dir_path, paper_id, rate_limiter=None, file_cache=None, stage=None,
+                         text_extractor=None, token_store=None, response_store=None):
+    """
+    获取单篇论文的总结，触发速率限制或连接失败时按指数退避重试，并记录耗时与重试次数
+    :param client: 客户端
+    :param dir_path: 论文pdf所在目录
+    :param paper_id: 论文id
+    :param rate_limiter: 请求数与token数的限速器
+    :param file_cache: 上传文件与抽取文本的本地缓存
+    :param stage: 记录所属的阶段，为空时使用当前阶段
+    :param text_extractor: 本地文本抽取器
+    :param token_store: 每篇论文token数的缓存
+    :param response_store: 保存原始回复的ResponseStore
+    :return: 总结内容
+    """
+    print_with_timestamp(f"论文 {paper_id} 未经总结，调用Moonshot AI总结...")
+    start = time.perf_counter()
+    summary_content = retry_with_backoff(
+        lambda: get_summary_from_moonshot(client, dir_path, paper_id, rate_limiter, file_cache, text_extractor,
+                                          token_store, response_store),
+        exceptions=(openai.RateLimitError, openai.APIConnectionError),
+        on_retry=lambda: get_metrics().record(stage=stage, paper_id=paper_id, retries=1))
+    get_metrics().record(stage=stage, paper_id=paper_id, wall_time=time.perf_counter() - start)
+    return summary_content
+
+
+class MoonshotRateLimiter:
+    """
+    Moonshot AI 的限速器，同时限制每分钟的请求数（RPM）和token数（TPM）
+    """
+
+    def __init__(self, rpm, tpm):
+        """
+        :param rpm: 每分钟请求数
+        :param tpm: 每分钟token数
+        """
+        self.request_bucket = TokenBucket(capacity=rpm, refill_per_second=rpm / 60)
+        self.token_bucket = TokenBucket(capacity=tpm, refill_per_second=tpm / 60)
+
+    def acquire(self, tokens):
+        """
+        阻塞直到允许发送一次消耗tokens个token的请求
+        :param tokens: 预计消耗的token数
+        :return: 无返回
+        """
+        self.request_bucket.acquire(1)
+        self.token_bucket.acquire(tokens)
+
+
+# 同一账户的筛选与总结共享限速器
+_rate_limiter_dict = dict()
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter(is_free_account=True, rpm=None, tpm=None, max_workers=None):
+    """
+    按账户等级获取共享的限速器与并发数
+    :param is_free_account: 是否是免费账户
+    :param rpm: 每分钟请求数，为空时按账户类型取默认值
+    :param tpm: 每分钟token数，为空时按账户类型取默认值
+    :param max_workers: 并发数，为空时按账户类型取默认值
+    :return: 限速器, 并发数
+    """
+    account_limit = MOONSHOT_ACCOUNT_LIMITS["free" if is_free_account else "paid"]
+    rpm = rpm or account_limit["rpm"]
+    tpm = tpm or account_limit["tpm"]
+    # 界面的任务线程与流水线的工作线程可能同时获取，同一速率限制只能创建一个限速器
+    with _rate_limiter_lock:
+        if (rpm, tpm) not in _rate_limiter_dict:
+            _rate_limiter_dict[(rpm, tpm)] = MoonshotRateLimiter(rpm=rpm, tpm=tpm)
+        rate_limiter = _rate_limiter_dict[(rpm, tpm)]
+    return rate_limiter, max_workers or account_limit["max_workers"]
+
+
+def summary_paper(judge_result_path, root_paper_path, daily_dir, is_free_account=True, rpm=None, tpm=None,
+                  max_workers=None, local_extract=None, on_result=None):
     """
-    对论文进行总结
+    对论文进行总结，未总结的论文按账户的速率限制并发调用Moonshot AI
     :param is_free_account: 是否是免费账户
     :param daily_dir: 每日信息保存目录
     :param root_paper_path: 论文根目录
     :param judge_result_path: 筛选后论文id的json文件
-    :return: 无返回
+    :param rpm: 每分钟请求数，为空时按账户类型取默认值
+    :param tpm: 每分钟token数，为空时按账户类型取默认值
+    :param max_workers: 并发数，为空时按账户类型取默认值
+    :param local_extract: 本地抽取pdf文本的配置，见 pdf_text_tool.get_text_extractor
+    :param on_result: 每篇论文完成后的回调，见 summarize_papers
+    :return: 总结文件路径
     """
     # 读取json文件
     with open(judge_result_path, "r") as f:
@@ -211,47 +511,105 @@ def summary_paper(judge_result_path, root_paper_path, daily_dir, is_free_account
     # 获取论文的id
     paper_id_list = [paper_id_dict["paper_id"] for paper_id_dict in paper_id_dict_list]
 
-    # 初始化kimi引擎
-    client = OpenAI(
-        api_key=os.getenv("KIMI_API_KEY"),
-        base_url=os.getenv("KIMI_BASE_URL"),
-    )
+    current_paper_summary_dict = summarize_papers(paper_id_list, root_paper_path, daily_dir,
+                                                  is_free_account=is_free_account, rpm=rpm, tpm=tpm,
+                                                  max_workers=max_workers, local_extract=local_extract,
+                                                  on_result=on_result)
+    return save_summary(judge_result_path, current_paper_summary_dict)
 
-    # 初始化summary_dict和current_paper_summary_dict
-    # 前者是全部论文的总结，后者是当前任务论文的集合
-    paper_summary_dict = dict()
-    current_paper_summary_dict = dict()
 
-    # 包含全部总结文件的路径
-    total_summary_json_path = os.path.join(root_paper_path, "total_summary.json")
+def summarize_papers(paper_id_list, root_paper_path, daily_dir, is_free_account=True, rpm=None, tpm=None,
+                     max_workers=None, local_extract=None, on_result=None):
+    """
+    获取论文的总结，已总结的论文从数据库读取，其余的按账户的速率限制并发调用Moonshot AI，总结失败的论文跳过
+    :param paper_id_list: 论文id列表
+    :param root_paper_path: 论文根目录
+    :param daily_dir: 论文pdf所在目录
+    :param is_free_account: 是否是免费账户
+    :param rpm: 每分钟请求数，为空时按账户类型取默认值
+    :param tpm: 每分钟token数，为空时按账户类型取默认值
+    :param max_workers: 并发数，为空时按账户类型取默认值
+    :param local_extract: 本地抽取pdf文本的配置，见 pdf_text_tool.get_text_extractor
+    :param on_result: 每篇论文完成后的回调 on_result(paper_id, error)，成功时error为None，用于记录检查点
+    :return: paper_id 到总结内容的字典
+    """
+    # 初始化kimi引擎
+    client = get_moonshot_client()
 
+    # 全部论文的总结保存在数据库中，current_paper_summary_dict是当前任务论文的集合
+    summary_store = SummaryStore(root_paper_path)
+    current_paper_summary_dict = summary_store.get_many(paper_id_list)
+
+    # 检查是否已经总结过
     for paper_id in paper_id_list:
-        # 打开全部论文总结的json文件，如果不存在则创建，如果存在则查找是否有paper_id字段
-        if not os.path.exists(os.path.join(root_paper_path, "total_summary.json")):
-            with open(total_summary_json_path, "w", encoding="utf-8") as f:
-                json.dump(paper_summary_dict, f, ensure_ascii=False, indent=4)
-        else:
-            with open(total_summary_json_path, "r", encoding="utf-8") as f:
-                # 判断是否为空
-                if os.path.getsize(os.path.join(root_paper_path, "total_summary.json")) != 0:
-                    paper_summary_dict = json.load(f)
-            # 检查是否存在 paper_id 字段
-            if f"{paper_id}" in paper_summary_dict:
-                print_with_timestamp(f"论文 {paper_id} 已总结，从本地文件中拉取...")
-                current_paper_summary_dict[paper_id] = paper_summary_dict[paper_id]
-            else:
-                print_with_timestamp(f"论文 {paper_id} 未经总结，调用Moonshot AI总结...")
-                # 是否是免费账户
-                if is_free_account:
-                    print_with_timestamp("由于您使用的是免费账户，Moonshot AI 限制了每分钟的请求次数，因此需要等待120秒...")
-                    time.sleep(120)
-                # 调用Moonshot AI获取论文总结
-                summary_content = get_summary_from_moonshot(client, daily_dir, paper_id)
-                current_paper_summary_dict[paper_id] = summary_content
-                paper_summary_dict[paper_id] = summary_content
-                with open(total_summary_json_path, "w", encoding='utf-8') as f:
-                    json.dump(paper_summary_dict, f, ensure_ascii=False, indent=4)
-                print_with_timestamp(f"论文 {paper_id} 总结完成...")
+        if paper_id in current_paper_summary_dict:
+            print_with_timestamp(f"论文 {paper_id} 已总结，从本地文件中拉取...")
+            get_metrics().record(paper_id=paper_id, cache_hits=1)
+            if on_result is not None:
+                on_result(paper_id, None)
+    todo_id_list = [paper_id for paper_id in paper_id_list if paper_id not in current_paper_summary_dict]
+
+    # 按账户等级设置速率限制
+    rate_limiter, max_workers = get_rate_limiter(is_free_account, rpm, tpm, max_workers)
+
+    # 所有论文共享同一个文件缓存，每次运行最多请求一次云端文件列表
+    file_cache = MoonshotFileCache(root_paper_path)
+
+    # 本地抽取时先将全部pdf提交到进程池，与大模型调用同时进行
+    text_extractor = get_text_extractor(file_cache, local_extract) if todo_id_list else None
+    if text_extractor is not None:
+        text_extractor.prefetch([os.path.join(daily_dir, paper_id + ".pdf") for paper_id in todo_id_list])
+
+    # 每篇论文的token数缓存，用于选择模型
+    token_store = TokenCountStore(root_paper_path)
+
+    # 保存大模型的原始回复
+    response_store = ResponseStore(root_paper_path)
+
+    # 线程池中的记录归入当前阶段
+    stage = get_metrics().current_stage
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        future_dict = {executor.submit(summarize_with_retry, client, daily_dir, paper_id, rate_limiter, file_cache,
+                                       stage, text_extractor, token_store, response_store): paper_id
+                       for paper_id in todo_id_list}
+        for future in as_completed(future_dict):
+            paper_id = future_dict[future]
+            try:
+                summary_content = future.result()
+            except Exception as e:
+                print_with_timestamp(f"论文 {paper_id} 总结失败：{e}")
+                if on_result is not None:
+                    on_result(paper_id, e)
+                continue
+            current_paper_summary_dict[paper_id] = summary_content
+            summary_store.put(paper_id, summary_content)
+            print_with_timestamp(f"论文 {paper_id} 总结完成...")
+            if on_result is not None:
+                on_result(paper_id, None)
+
+    summary_store.close()
+    token_store.close()
+    response_store.close()
+    if text_extractor is not None:
+        text_extractor.close()
+
+    return current_paper_summary_dict
+
+
+def save_summary(judge_result_path, summary_dict):
+    """
+    按筛选结果的顺序保存总结，文件保存在筛选结果旁
+    :param judge_result_path: 筛选后论文id的json文件
+    :param summary_dict: paper_id 到总结内容的字典，可以包含其他论文
+    :return: 总结文件路径
+    """
+    with open(judge_result_path, "r") as f:
+        paper_id_list = [paper_id_dict["paper_id"] for paper_id_dict in json.load(f)]
+
+    # 按筛选结果的顺序保存
+    current_paper_summary_dict = {paper_id: summary_dict[paper_id] for paper_id in paper_id_list
+                                  if paper_id in summary_dict}
 
     # 保存总结信息
     paper_summary_json_path = judge_result_path.replace("_judge_result.json", "_summary.json")
@@ -260,6 +618,8 @@ def summary_paper(judge_result_path, root_paper_path, daily_dir, is_free_account
 
     print_with_timestamp("所有总结已完成...")
 
+    return paper_summary_json_path
+
 
 if __name__ == "__main__":
     from gen_tool import print_with_timestamp
@@ -0,0 +1,222 @@
+import json
+import re
+
+from llm_tool.gen_tool import print_with_timestamp
+
+# 支持JSON模式的接口要求回复为json对象
+JSON_MODE = {"type": "json_object"}
+
+# 论文总结的格式
+SUMMARY_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "summary": {"type": "string"},
+        "keypoints_1": {"type": "string"},
+        "keypoints_2": {"type": "string"},
+    },
+    "required": ["summary", "keypoints_1", "keypoints_2"],
+}
+
+# 论文筛选打分的格式
+SCORE_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "paper_id": {"type": "string"},
+            "score": {"type": "number"},
+        },
+        "required": ["paper_id", "score"],
+    },
+}
+
+REPAIR_SYSTEM_PROMPT = "你是一个json格式修复工具，只返回修正后的json，不添加任何解释或其他内容。"
+
+CODE_FENCE_PATTERN = re.compile(r"```(?:json)?\s*(.*?)\s*```", re.DOTALL | re.IGNORECASE)
+
+TRAILING_COMMA_PATTERN = re.compile(r",(\s*[}\]])")
+
+
+class ResponseParseError(ValueError):
+    """
+    大模型的回复无法解析为符合格式的json
+    """
+
+    def __init__(self, message, content):
+        """
+        :param message: 失败原因
+        :param content: 原始回复
+        """
+        super().__init__(message)
+        self.content = content
+
+
+def close_json(text):
+    """
+    补全被截断的json末尾未闭合的字符串与括号
+    :param text: json文本
+    :return: 补全后的文本
+    """
+    stack = []
+    in_string = False
+    escaped = False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]" and stack:
+            stack.pop()
+    return text + ('"' if in_string else "") + "".join(reversed(stack))
+
+
+def repair_json(text):
+    """
+    修复常见的格式问题：多余的逗号、Python风格的取值、被截断的末尾
+    :param text: json文本
+    :return: 修复后的文本
+    """
+    text = TRAILING_COMMA_PATTERN.sub(r"\1", text)
+    text = re.sub(r"\bTrue\b", "true", re.sub(r"\bFalse\b", "false", re.sub(r"\bNone\b", "null", text)))
+    return TRAILING_COMMA_PATTERN.sub(r"\1", close_json(text.rstrip().rstrip(",")))
+
+
+def find_json(text):
+    """
+    从文本中找出第一个完整的json对象或数组，忽略前后的说明文字
+    :param text: 文本
+    :return: 解析结果，找不到时返回None
+    """
+    decoder = json.JSONDecoder(strict=False)
+    for match in re.finditer(r"[{\[]", text):
+        try:
+            value, _ = decoder.raw_decode(text, match.start())
+        except json.JSONDecodeError:
+            continue
+        return value
+    return None
+
+
+def extract_json(content):
+    """
+    从大模型的回复中提取json，依次尝试直接解析、去除代码块标记、查找json片段与修复后再查找
+    :param content: 大模型的回复
+    :return: 解析结果
+    """
+    if content is None or not content.strip():
+        raise ResponseParseError("回复为空", content)
+    text = content.strip()
+    fence_match = CODE_FENCE_PATTERN.search(text)
+    if fence_match:
+        text = fence_match.group(1)
+    elif text.startswith("```"):
+        # 被截断的回复没有结束的代码块标记
+        text = re.sub(r"^```(?:json)?", "", text, flags=re.IGNORECASE)
+
+    try:
+        return json.loads(text, strict=False)
+    except json.JSONDecodeError:
+        pass
+
+    # 从第一个括号开始解析，失败时修复后再解析，都失败时再查找其中的json片段
+    start = min([i for i in (text.find("{"), text.find("[")) if i >= 0], default=-1)
+    if start >= 0:
+        decoder = json.JSONDecoder(strict=False)
+        for candidate in (text[start:], repair_json(text[start:])):
+            try:
+                return decoder.raw_decode(candidate)[0]
+            except json.JSONDecodeError:
+                continue
+    value = find_json(text)
+    if value is None:
+        raise ResponseParseError("回复中没有可解析的json", content)
+    return value
+
+
+def validate(value, schema, path="$"):
+    """
+    按json schema的子集（type、properties、required、items）校验
+    :param value: 解析结果
+    :param schema: json schema
+    :param path: 当前位置，用于错误信息
+    :return: 错误信息列表，为空时表示校验通过
+    """
+    type_name = schema.get("type")
+    type_dict = {"object": dict, "array": list, "string": str, "boolean": bool}
+    if type_name in ("number", "integer"):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return [f"{path} 应为数字"]
+    elif type_name in type_dict and not isinstance(value, type_dict[type_name]):
+        return [f"{path} 应为{type_name}"]
+
+    error_list = []
+    if type_name == "object":
+        for key in schema.get("required", []):
+            if key not in value:
+                error_list.append(f"{path} 缺少字段 {key}")
+        for key, property_schema in schema.get("properties", {}).items():
+            if key in value:
+                error_list.extend(validate(value[key], property_schema, f"{path}.{key}"))
+    elif type_name == "array" and "items" in schema:
+        for i, item in enumerate(value):
+            error_list.extend(validate(item, schema["items"], f"{path}[{i}]"))
+    return error_list
+
+
+def build_repair_messages(content, error, schema):
+    """
+    构造修复回复的对话，只发送原始回复，不重复发送论文内容
+    :param content: 原始回复
+    :param error: 失败原因
+    :param schema: 要求的json schema
+    :return: messages
+    """
+    return [
+        {"role": "system", "content": REPAIR_SYSTEM_PROMPT},
+        {"role": "user", "content": f"下面的回复不符合要求（{error}），请将其修正为符合以下json schema的json，"
+                                    f"保留原有内容：\n{json.dumps(schema, ensure_ascii=False)}\n\n回复：\n{content}"},
+    ]
+
+
+def parse_response(content, schema, normalize=None, repair=None, max_repairs=1, response_store=None, kind=None,
+                   item_key=None):
+    """
+    解析并校验大模型的回复，失败时用修复提示词重试，每次的原始回复都会保存
+    :param content: 大模型的回复
+    :param schema: 要求的json schema
+    :param normalize: 校验前对解析结果的整理，例如去掉外层的包装
+    :param repair: 修复函数，以修复的对话为参数，返回新的回复，为空时不修复
+    :param max_repairs: 最多修复的次数
+    :param response_store: ResponseStore，为空时不保存原始回复
+    :param kind: 回复的类型，例如summary、judge
+    :param item_key: 回复对应的对象，例如paper_id
+    :return: 解析结果
+    """
+    for attempt in range(max_repairs + 1):
+        # 修复后的回复单独记录，之后的运行从大模型最初的回复开始修复
+        record_kind = kind if attempt == 0 else f"{kind}_repair"
+        try:
+            value = extract_json(content)
+            if normalize is not None:
+                value = normalize(value)
+            error_list = validate(value, schema)
+            if error_list:
+                raise ResponseParseError("；".join(error_list[:5]), content)
+        except ResponseParseError as e:
+            if response_store is not None:
+                response_store.put(record_kind, item_key, content or "", False, str(e))
+            if repair is None or attempt == max_repairs:
+                raise
+            print_with_timestamp(f"{kind} {item_key} 的回复解析失败（{e}），请求修复...")
+            content = repair(build_repair_messages(content, str(e), schema))
+            continue
+        if response_store is not None:
+            response_store.put(record_kind, item_key, content, True)
+        return value
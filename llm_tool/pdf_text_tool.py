@@ -0,0 +1,179 @@
+import os
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from llm_tool.file_cache_tool import get_file_hash
+from llm_tool.gen_tool import print_with_timestamp
+from llm_tool.metrics_tool import get_metrics
+
+# 本地抽取使用PyMuPDF，未安装时不可用，仍通过Moonshot AI抽取
+try:
+    import pymupdf
+except ImportError:
+    try:
+        # 旧版本的PyMuPDF只提供fitz
+        import fitz as pymupdf
+    except ImportError:
+        pymupdf = None
+
+# 可选择的章节及其标题的写法
+SECTION_PATTERNS = {
+    "abstract": r"abstract",
+    "introduction": r"introduction",
+    "conclusion": r"conclusions?(?:\s+and\s+future\s+work)?|concluding\s+remarks|summary\s+and\s+conclusions?",
+}
+
+# 带编号的章节标题行，例如 "1 Introduction"、"II. METHODS"、"5. Conclusion"
+NUMBERED_HEADING_PATTERN = re.compile(r"^\s*(?:\d+|[IVX]+)\.?\s+([A-Z][A-Za-z ]{2,60})\s*$")
+
+# 不带编号时只识别常见的章节标题，避免把换行后的正文当作标题
+PLAIN_HEADING_PATTERN = re.compile(
+    r"^\s*(abstract|introduction|related\s+work|background|methods?|methodology|experiments?|results|discussion|"
+    r"conclusions?(?:\s+and\s+future\s+work)?|concluding\s+remarks|references|acknowledge?ments?|appendix)\s*$",
+    re.IGNORECASE)
+
+# 本地抽取的文本在缓存中的后缀，与Moonshot AI抽取的文本区分
+LOCAL_TEXT_SUFFIX = ".local"
+
+
+def is_available():
+    """
+    :return: 本地抽取是否可用
+    """
+    return pymupdf is not None
+
+
+def extract_pdf_text(pdf_path):
+    """
+    使用PyMuPDF抽取pdf的全文，在进程池中执行
+    :param pdf_path: pdf路径
+    :return: 文本
+    """
+    with pymupdf.open(pdf_path) as document:
+        return "\n".join(page.get_text() for page in document)
+
+
+def split_sections(text):
+    """
+    按章节标题将全文切分
+    :param text: 全文
+    :return: [(标题, 内容)] 列表，第一个标题之前的内容标题为空字符串
+    """
+    section_list = [["", []]]
+    for line in text.splitlines():
+        match = NUMBERED_HEADING_PATTERN.match(line) or PLAIN_HEADING_PATTERN.match(line)
+        if match:
+            section_list.append([match.group(1).strip(), []])
+        else:
+            section_list[-1][1].append(line)
+    return [(title, "\n".join(line_list).strip()) for title, line_list in section_list]
+
+
+def select_sections(text, sections):
+    """
+    只保留指定的章节
+    :param text: 全文
+    :param sections: 章节名称列表，见SECTION_PATTERNS，为空时返回全文
+    :return: 选中章节的文本，一个章节都没有识别出来时返回全文
+    """
+    if not sections:
+        return text
+    pattern_list = [re.compile(rf"^(?:{SECTION_PATTERNS[section]})$", re.IGNORECASE) for section in sections]
+
+    part_list = []
+    for title, content in split_sections(text):
+        if any(pattern.match(title) for pattern in pattern_list):
+            part_list.append(f"{title}\n{content}")
+    return "\n\n".join(part_list) if part_list else text
+
+
+class LocalTextExtractor:
+    """
+    在本地的进程池中抽取pdf文本，抽取的全文按文件sha256保存在文本缓存中，
+    读取时再按需选择章节，同一份缓存可以用于不同的提示词
+    """
+
+    def __init__(self, file_cache, sections=None, max_workers=None):
+        """
+        :param file_cache: MoonshotFileCache，复用其文本缓存目录
+        :param sections: 保留的章节，例如 ["abstract", "introduction", "conclusion"]，为空时使用全文
+        :param max_workers: 进程数，为空时使用CPU核数
+        """
+        self.file_cache = file_cache
+        self.sections = sections
+        self._executor = ProcessPoolExecutor(max_workers=max_workers)
+        self._future_dict = dict()
+        self._lock = threading.Lock()
+
+    def prefetch(self, pdf_path_list):
+        """
+        提前将未缓存的pdf提交到进程池
+        :param pdf_path_list: pdf路径列表
+        :return: 无返回
+        """
+        for pdf_path in pdf_path_list:
+            if os.path.exists(pdf_path):
+                self._get_future(pdf_path, get_file_hash(pdf_path))
+
+    def _get_future(self, pdf_path, file_hash):
+        with self._lock:
+            if file_hash not in self._future_dict and \
+                    self.file_cache.get_cached_text(file_hash + LOCAL_TEXT_SUFFIX) is None:
+                self._future_dict[file_hash] = self._executor.submit(extract_pdf_text, pdf_path)
+            return self._future_dict.get(file_hash)
+
+    def get_text(self, pdf_path, paper_id):
+        """
+        获取pdf的文本，依次尝试本地缓存、进程池抽取
+        :param pdf_path: pdf路径
+        :param paper_id: 论文id
+        :return: 选中章节的文本，抽取失败或没有文本（例如扫描版pdf）时返回None
+        """
+        file_hash = get_file_hash(pdf_path)
+        text = self.file_cache.get_cached_text(file_hash + LOCAL_TEXT_SUFFIX)
+        if text is not None:
+            print_with_timestamp(f"论文 {paper_id} 的本地抽取文本命中缓存...")
+            get_metrics().record(paper_id=paper_id, cache_hits=1)
+        else:
+            start = time.perf_counter()
+            future = self._get_future(pdf_path, file_hash)
+            try:
+                # 其他线程已抽取完成并写入缓存时不会再提交
+                text = future.result() if future is not None else \
+                    self.file_cache.get_cached_text(file_hash + LOCAL_TEXT_SUFFIX)
+            except Exception as e:
+                print_with_timestamp(f"论文 {paper_id} 本地抽取失败：{e}")
+                return None
+            if not text or not text.strip():
+                return None
+            self.file_cache.save_text(file_hash + LOCAL_TEXT_SUFFIX, text)
+            print_with_timestamp(f"论文 {paper_id} 本地抽取完成，用时 {time.perf_counter() - start:.2f} 秒...")
+
+        return select_sections(text, self.sections)
+
+    def close(self):
+        """
+        关闭进程池
+        :return: 无返回
+        """
+        self._executor.shutdown(cancel_futures=True)
+
+
+def get_text_extractor(file_cache, local_extract=None):
+    """
+    按配置创建本地抽取器
+    :param file_cache: MoonshotFileCache
+    :param local_extract: 本地抽取的配置，可包含sections、max_workers，为true时使用默认配置，为空时不使用本地抽取
+    :return: LocalTextExtractor，未配置或PyMuPDF未安装时返回None
+    """
+    if local_extract is None or local_extract is False:
+        return None
+    if local_extract is True:
+        local_extract = dict()
+    if not is_available():
+        print_with_timestamp("未安装PyMuPDF，无法在本地抽取pdf文本，仍通过Moonshot AI抽取...")
+        return None
+    return LocalTextExtractor(file_cache, sections=local_extract.get("sections"),
+                              max_workers=local_extract.get("max_workers"))
@@ -0,0 +1,439 @@
+import datetime
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import arxiv
+
+from llm_tool import arxiv_tool, dedup_tool, metrics_tool, moonshot_tool, rank_tool, render_tool, search_tool
+from llm_tool.gen_tool import print_with_timestamp
+from llm_tool.store_tool import PdfStore
+
+
+def get_authors(authors, first_author=False):
+    """
+    用于对文章作者进行处理
+    :param authors: 作者列表
+    :param first_author: 是否只需要第一作者
+    :return: 作者名称
+    """
+    output = str()
+    if not first_author:
+        output = ", ".join(str(author) for author in authors)
+    else:
+        output = authors[0]
+    return output
+
+
+def iter_query_paper(query="", max_results=2, client=None, watermark=None):
+    """
+    根据关键词逐条获取论文信息，每翻到一条结果就立即返回
+    :param query: 关键词
+    :param max_results: 最大数量
+    :param client: arxiv客户端，为空时使用全局共享的客户端
+    :param watermark: 增量检索的水位线，不为空时只检索水位线之后的新论文，不限制数量，
+                      并原地更新水位线；为空字典时代表首次检索，仍按max_results检索
+    :return: 论文信息的生成器
+    """
+    # 构造客户端，默认使用全局共享的限速客户端
+    if client is None:
+        client = arxiv_tool.get_arxiv_client()
+
+    # 增量检索时按提交时间从新到旧翻页，直到遇到已见过的论文
+    incremental = watermark is not None
+    last_watermark = dict(watermark) if incremental else None
+
+    # 发送请求，获取论文信息
+    search = arxiv.Search(
+        query=query,
+        max_results=None if incremental and last_watermark else max_results,
+        sort_by=arxiv.SortCriterion.SubmittedDate
+    )
+    results = client.results(search)
+
+    for result in results:
+        if incremental:
+            position = arxiv_tool.compare_watermark(result, last_watermark)
+            if position == "older":
+                break
+            if position == "seen":
+                continue
+            arxiv_tool.advance_watermark(watermark, result)
+
+        paper_title = result.title  # 文章标题
+        paper_entry_id = result.entry_id  # URL
+        paper_authors = get_authors(result.authors)  # 作者
+        """
+        包括了这些类型
+        Computer Science,
+        Economics,
+        Electrical Engineering and Systems Science,
+        Mathematics,
+        Physics,
+        Quantitative Biology,
+        Quantitative Finance,
+        Statistics
+        """
+        paper_primary_category = result.primary_category  # 所属的主要分类
+        paper_pdf_url = result.pdf_url  # pdf地址
+        paper_published_time = result.published.date().strftime("%Y-%m-%d")  # 首次出版时间
+        paper_abstract = result.summary.replace('\n', " ")  # 论文的摘要
+
+        # paper的id，用于识别唯一性
+        paper_id = result.get_short_id()
+        # 版本号，例如v2
+        paper_version = arxiv_tool.get_paper_version(paper_id)
+
+        yield {
+            "paper_id": paper_id,
+            "paper_title": paper_title,
+            "paper_entry_id": paper_entry_id,
+            "paper_authors": paper_authors,
+            "paper_primary_category": paper_primary_category,
+            "paper_published_time": paper_published_time,
+            "paper_abstract": paper_abstract,
+            "paper_pdf_url": paper_pdf_url,
+            "paper_version": paper_version,
+        }
+
+
+def get_query_paper(query="", max_results=2, client=None, watermark=None):
+    """
+    根据关键词获取论文信息
+    :param query: 关键词
+    :param max_results: 最大数量
+    :param client: arxiv客户端，为空时使用全局共享的客户端
+    :param watermark: 增量检索的水位线，见 iter_query_paper
+    :return: 检索结果
+    """
+    # 存放信息的字典
+    paper_content = dict()
+
+    for paper in iter_query_paper(query, max_results, client, watermark):
+        paper_content[paper["paper_id"]] = paper
+
+    print_with_timestamp(f"关键词 {query} 检索到 {len(paper_content)} 个结果...")
+
+    return paper_content
+
+
+def fetch_queries(query_max_results_dict, concurrent=False, max_workers=4, watermark_dict=None):
+    """
+    检索多个关键词，所有关键词共享同一个限速客户端
+    :param query_max_results_dict: 关键词到单关键词最大论文数量的字典
+    :param concurrent: 是否并发检索多个关键词
+    :param max_workers: 并发检索的线程数
+    :param watermark_dict: 关键词到水位线的字典，不为空时进行增量检索，并原地更新水位线
+    :return: 去掉引号的关键词到检索结果的字典
+    """
+    client = arxiv_tool.get_arxiv_client()
+    query_list = list(query_max_results_dict)
+    # 水位线在主线程中取出，检索线程只修改各自关键词的水位线
+    watermark_list = [None if watermark_dict is None else watermark_dict.setdefault(query.strip('"'), dict())
+                      for query in query_list]
+
+    with ThreadPoolExecutor(max_workers=max_workers if concurrent else 1) as executor:
+        paper_content_list = list(executor.map(
+            lambda query, watermark: get_query_paper(query, query_max_results_dict[query], client, watermark),
+            query_list, watermark_list))
+
+    return {query.strip('"'): paper_content for query, paper_content in zip(query_list, paper_content_list)}
+
+
+def get_topic_paper(topic, query_list=None, max_results=2, concurrent=False, max_workers=4, watermark_dict=None):
+    """
+    根据主题对论文进行检索
+    :param topic: 主题
+    :param query_list: 关键词列表
+    :param max_results: 单关键词最大论文数量
+    :param concurrent: 是否并发检索多个关键词
+    :param max_workers: 并发检索的线程数
+    :param watermark_dict: 关键词到水位线的字典，不为空时进行增量检索，并原地更新水位线
+    :return: 检索结果
+    """
+    # 如果没有提供query，则返回，并报错
+    if query_list is None:
+        raise ValueError("没有提供关键词列表...")
+
+    query_result_dict = fetch_queries({query: max_results for query in query_list}, concurrent=concurrent,
+                                      max_workers=max_workers, watermark_dict=watermark_dict)
+
+    # 同一篇论文命中多个关键词时只保留一份
+    topic_paper = arxiv_tool.merge_query_results(query_result_dict)
+
+    return {topic: topic_paper}
+
+
+def save_json_file(dir_name, topic_paper, merge=False, overwrite=False):
+    """
+    用于将检索的论文信息保存为json文件
+    :param dir_name: 保存文件的目录
+    :param topic_paper: 论文信息
+    :param merge: 文件已存在时是否将新的论文信息合并进去（增量检索时使用）
+    :param overwrite: 文件已存在时是否用本次的检索结果覆盖
+    :return: 论文信息文件路径
+    """
+    # 如果不存在目录就创建
+    if not os.path.exists(dir_name):
+        os.makedirs(dir_name)
+    # 以当前的时间点为文件名称
+    file_name = os.path.join(dir_name, datetime.datetime.now().strftime("%Y%m%d")+".json")
+
+    if not os.path.exists(file_name):
+        with open(file_name, "w") as f:
+            json.dump(topic_paper, f)
+
+        print_with_timestamp(f"保存论文信息文件 {file_name} 完成...")
+    elif merge:
+        with open(file_name, "r") as f:
+            saved_topic_paper = json.load(f)
+        for topic, query_dict in topic_paper.items():
+            for query, paper_content in query_dict.items():
+                saved_topic_paper.setdefault(topic, dict()).setdefault(query, dict()).update(paper_content)
+        with open(file_name + ".tmp", "w") as f:
+            json.dump(saved_topic_paper, f)
+        os.replace(file_name + ".tmp", file_name)
+
+        print_with_timestamp(f"论文信息文件 {file_name} 已经存在，合并新检索的论文完成...")
+    elif overwrite:
+        with open(file_name + ".tmp", "w") as f:
+            json.dump(topic_paper, f)
+        os.replace(file_name + ".tmp", file_name)
+
+        print_with_timestamp(f"论文信息文件 {file_name} 已经存在，使用本次检索的论文覆盖...")
+    else:
+        print_with_timestamp(f"论文信息文件 {file_name} 已经存在...")
+
+    return file_name
+
+
+def save_topic_paper(dir_name, topic_paper, incremental=False, root_dir=None, watermark_dict=None):
+    """
+    保存检索结果，非增量检索时覆盖当天之前的检索结果，增量检索时合并，并在论文信息保存后再推进水位线
+    :param dir_name: 保存文件的目录
+    :param topic_paper: 论文信息
+    :param incremental: 是否为增量检索
+    :param root_dir: 保存水位线的根目录
+    :param watermark_dict: 本次检索更新后的水位线，为空时不保存
+    :return: 论文信息文件路径
+    """
+    paper_data_path = save_json_file(dir_name=dir_name, topic_paper=topic_paper, merge=incremental,
+                                     overwrite=not incremental)
+    if incremental and watermark_dict is not None:
+        arxiv_tool.save_watermarks(root_dir, watermark_dict)
+    return paper_data_path
+
+
+def select_candidates(root_paper_path, paper_data_path, paper_info, topic, query_list, prefilter_top_k=None):
+    """
+    去除重复论文并进行本地预筛选，确定交给大模型筛选的论文，之前处理过的论文复用打分与总结
+    :param root_paper_path: 论文根目录
+    :param paper_data_path: 论文信息文件路径
+    :param paper_info: extract_paper_data 返回的论文信息列表
+    :param topic: 主题
+    :param query_list: 检索式列表
+    :param prefilter_top_k: 本地BM25预筛选保留的论文数量，为空时不进行预筛选
+    :return: 候选论文的paper_id列表，为空时代表全部论文参与筛选
+    """
+    metrics = metrics_tool.get_metrics()
+    candidate_ids = None
+    with metrics.stage("dedup"):
+        dedup_paper_info = dedup_tool.dedup_papers(root_paper_path, paper_info)
+    if len(dedup_paper_info) < len(paper_info):
+        paper_info = dedup_paper_info
+        candidate_ids = [paper["paper_id"] for paper in paper_info]
+
+    # 本地预筛选，只将相关性最高的论文交给大模型
+    if prefilter_top_k and len(paper_info) > prefilter_top_k:
+        with metrics.stage("prefilter"):
+            candidate_ids = rank_tool.prefilter_papers(paper_data_path, paper_info, topic, query_list,
+                                                       prefilter_top_k)
+    return candidate_ids
+
+
+def judge_topic(paper_data_path, topic, max_results_per_query, judge_number, root_paper_path, candidate_ids=None,
+                is_free_account=True, llm_limits=None):
+    """
+    通过大模型筛选一个主题的论文，之前运行留下的筛选结果与本次的输入不一致时重新筛选
+    :param paper_data_path: 论文信息文件路径
+    :param topic: 主题
+    :param max_results_per_query: 单关键词最大论文数量
+    :param judge_number: 筛选得到的论文数量
+    :param root_paper_path: 论文根目录
+    :param candidate_ids: 候选论文的paper_id列表，见 select_candidates
+    :param is_free_account: 是否是免费账户
+    :param llm_limits: Moonshot AI 的速率限制，可包含rpm、tpm、max_workers，为空时按账户类型取默认值
+    :return: 筛选结果文件路径
+    """
+    return moonshot_tool.judge_paper(paper_data_path=paper_data_path, paper_number=max_results_per_query,
+                                     judge_number=judge_number, llm="moonshot", is_free_account=is_free_account,
+                                     candidate_ids=candidate_ids, topic=topic, root_paper_path=root_paper_path,
+                                     **(llm_limits or {}))
+
+
+def read_judge_ids(judge_result_path):
+    """
+    :param judge_result_path: 筛选结果文件路径
+    :return: 按分数从高到低排序的paper_id列表
+    """
+    with open(judge_result_path, "r") as f:
+        return [paper_id_dict["paper_id"] for paper_id_dict in json.load(f)]
+
+
+def get_pdf_store_max_bytes(pdf_store_max_mb):
+    """
+    :param pdf_store_max_mb: pdf存储的大小上限（MB），为空时不淘汰
+    :return: 大小上限（字节）
+    """
+    return None if pdf_store_max_mb is None else int(pdf_store_max_mb * 1024 * 1024)
+
+
+def link_existing_pdf(paper_id, pdf_path, pdf_store=None):
+    """
+    每日目录中已存在或pdf存储中已有的论文不再下载
+    :param paper_id: 论文id
+    :param pdf_path: 每日目录下的pdf路径
+    :param pdf_store: 按内容寻址的pdf存储，不为空时从存储中链接，旧版本下载的论文补充到存储中
+    :return: 已有pdf时返回True
+    """
+    if os.path.exists(pdf_path):
+        print_with_timestamp(f"{paper_id}.pdf 已经存在，无需下载...")
+        # 旧版本下载的论文补充到存储中
+        if pdf_store is not None and pdf_store.lookup(paper_id) is None:
+            pdf_store.add(paper_id, pdf_path)
+    elif pdf_store is not None and pdf_store.link(paper_id, pdf_path):
+        print_with_timestamp(f"{paper_id}.pdf 已在pdf存储中，无需下载...")
+    else:
+        return False
+    metrics_tool.get_metrics().record(paper_id=paper_id, cache_hits=1)
+    return True
+
+
+def download_paper(judge_result_path, dir_path, max_workers=4, paper_data_path=None, pdf_store=None):
+    """
+    下载论文
+    :param dir_path: 保存论文pdf的路径
+    :param judge_result_path: 论文id的json文件路径
+    :param max_workers: 并发下载的线程数
+    :param paper_data_path: 论文信息文件路径，用于直接读取检索时保存的pdf地址
+    :param pdf_store: 按内容寻址的pdf存储，见 download_paper_ids
+    :return: 下载失败的论文id列表
+    """
+    # 获取论文的id
+    paper_id_list = read_judge_ids(judge_result_path)
+
+    if len(paper_id_list) == 0:
+        print_with_timestamp("筛选结果为空，没有需要下载的论文...")
+        return []
+
+    paper_info = moonshot_tool.extract_paper_data(paper_data_path) if paper_data_path else []
+    return download_paper_ids(paper_id_list, dir_path, max_workers=max_workers, paper_info=paper_info,
+                              pdf_store=pdf_store)
+
+
+def download_paper_ids(paper_id_list, dir_path, max_workers=4, paper_info=None, pdf_store=None):
+    """
+    按paper_id下载论文，已存在的pdf不再下载
+    :param paper_id_list: 论文id列表
+    :param dir_path: 保存论文pdf的路径
+    :param max_workers: 并发下载的线程数
+    :param paper_info: 论文信息列表，用于直接读取检索时保存的pdf地址
+    :param pdf_store: 按内容寻址的pdf存储，不为空时先从存储中链接，新下载的论文加入存储
+    :return: 下载失败（包括在arXiv上找不到）的论文id列表，单篇论文失败不影响其他论文
+    """
+    # 对论文进行检测是否存在
+    download_id_list = [paper_id for paper_id in paper_id_list
+                        if not link_existing_pdf(paper_id, os.path.join(dir_path, paper_id + ".pdf"), pdf_store)]
+
+    if not download_id_list:
+        return []
+
+    if not os.path.exists(dir_path):
+        os.makedirs(dir_path)
+
+    # 优先使用检索时保存的pdf地址，缺失的再统一查询
+    pdf_url_dict = arxiv_tool.resolve_pdf_urls(download_id_list, paper_info or [])
+    unresolved_list = [paper_id for paper_id in download_id_list if paper_id not in pdf_url_dict]
+    if unresolved_list:
+        print_with_timestamp(f"未能在arXiv上找到论文 {', '.join(unresolved_list)}...")
+
+    print_with_timestamp(f"开始下载 {len(pdf_url_dict)} 篇论文...")
+    failed_list = arxiv_tool.download_papers(pdf_url_dict, dir_path, max_workers=max_workers)
+
+    if pdf_store is not None:
+        for paper_id in pdf_url_dict:
+            if paper_id not in failed_list:
+                pdf_store.add(paper_id, os.path.join(dir_path, paper_id + ".pdf"))
+        pdf_store.evict()
+
+    if failed_list:
+        print_with_timestamp(f"论文 {', '.join(failed_list)} 下载失败...")
+
+    return unresolved_list + list(failed_list)
+
+
+def download_with_store(paper_id_list, dir_path, root_paper_path, pdf_store_max_mb=2048, max_workers=4,
+                        paper_info=None):
+    """
+    通过论文根目录下的pdf存储下载论文，已下载过的论文直接链接，单篇论文下载失败时不影响其他论文
+    :param paper_id_list: 论文id列表
+    :param dir_path: 保存论文pdf的路径
+    :param root_paper_path: 论文根目录
+    :param pdf_store_max_mb: pdf存储的大小上限（MB），为空时不淘汰
+    :param max_workers: 并发下载的线程数
+    :param paper_info: 论文信息列表，用于直接读取检索时保存的pdf地址
+    :return: 下载失败的论文id列表
+    """
+    if not paper_id_list:
+        print_with_timestamp("筛选结果为空，没有需要下载的论文...")
+        return []
+
+    pdf_store = PdfStore(root_paper_path, get_pdf_store_max_bytes(pdf_store_max_mb))
+    try:
+        return download_paper_ids(paper_id_list, dir_path, max_workers=max_workers, paper_info=paper_info,
+                                  pdf_store=pdf_store)
+    finally:
+        pdf_store.close()
+
+
+def output_md_and_pdf(paper_data_path, topic, query_list):
+    """
+    用于生成markdown文件和html文件
+    :return: none
+    """
+    print_with_timestamp("开始生成markdown文件...")
+
+    # 按paper_id建立论文信息的索引
+    paper_index = render_tool.build_paper_index(moonshot_tool.extract_paper_data(paper_data_path))
+
+    # 总结文件
+    with open(paper_data_path.replace(".json", "_summary.json"), "r", encoding='utf-8') as f:
+        summary_data = json.load(f)
+
+    # 在内存中生成markdown和html，再分别写入文件
+    md_text, html_text = render_tool.render_report(topic, query_list, summary_data, paper_index)
+    render_tool.write_report(paper_data_path.replace(".json", ".md"), md_text, html_text)
+
+    print_with_timestamp("生成markdown文件完成...")
+
+
+def render_and_index(root_paper_path, paper_data_path, summary_path, topic, query_list):
+    """
+    输出简报并更新全文索引
+    :param root_paper_path: 论文根目录
+    :param paper_data_path: 论文信息文件路径
+    :param summary_path: 总结文件路径
+    :param topic: 主题
+    :param query_list: 检索式列表
+    :return: markdown文件路径
+    """
+    metrics = metrics_tool.get_metrics()
+    with metrics.stage("render"):
+        # 输出md和html
+        output_md_and_pdf(paper_data_path, topic, query_list)
+
+    with metrics.stage("index"):
+        # 更新全文索引
+        search_tool.update_search_index(root_paper_path, paper_data_path, summary_path)
+
+    return paper_data_path.replace(".json", ".md")
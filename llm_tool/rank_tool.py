@@ -0,0 +1,115 @@
+import json
+import re
+
+import numpy as np
+
+from llm_tool.gen_tool import print_with_timestamp
+
+# 常见的英文停用词
+STOP_WORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "is", "it", "of", "on", "or", "that",
+    "the", "this", "to", "we", "with", "which", "our", "these", "their", "can", "has", "have", "was", "were",
+}
+
+
+def tokenize(text):
+    """
+    英文分词，转为小写并去除停用词
+    :param text: 文本
+    :return: 词列表
+    """
+    return [word for word in re.findall(r"[a-z0-9]+", text.lower()) if len(word) > 1 and word not in STOP_WORDS]
+
+
+def get_query_terms(topic, query_list):
+    """
+    从主题和检索式中提取查询词，作者字段不参与排序
+    :param topic: 主题
+    :param query_list: process_keywords 生成的检索式列表
+    :return: 去重后的查询词列表
+    """
+    text_list = [topic]
+    for query in query_list:
+        field_list = re.findall(r'(all|ti|abs|au):"([^"]+)"', query)
+        if field_list:
+            text_list.extend(keyword for field, keyword in field_list if field != "au")
+        else:
+            text_list.append(query.strip('"'))
+    return list(dict.fromkeys(tokenize(" ".join(text_list))))
+
+
+def bm25_scores(doc_token_list, query_terms, k1=1.5, b=0.75):
+    """
+    使用向量化的BM25计算每篇文档与查询词的相关性
+    :param doc_token_list: 每篇文档的词列表
+    :param query_terms: 查询词列表
+    :param k1: BM25参数
+    :param b: BM25参数
+    :return: 每篇文档的分数，numpy数组
+    """
+    doc_number = len(doc_token_list)
+    if doc_number == 0 or not query_terms:
+        return np.zeros(doc_number)
+
+    term_index = {term: i for i, term in enumerate(query_terms)}
+    doc_length = np.array([len(tokens) for tokens in doc_token_list], dtype=float)
+
+    # 只统计查询词的词频，得到 文档数 x 查询词数 的矩阵
+    doc_idx = []
+    term_idx = []
+    for i, tokens in enumerate(doc_token_list):
+        for token in tokens:
+            j = term_index.get(token)
+            if j is not None:
+                doc_idx.append(i)
+                term_idx.append(j)
+    tf = np.zeros((doc_number, len(query_terms)))
+    np.add.at(tf, (np.array(doc_idx, dtype=int), np.array(term_idx, dtype=int)), 1)
+
+    df = np.count_nonzero(tf, axis=0)
+    idf = np.log(1 + (doc_number - df + 0.5) / (df + 0.5))
+
+    avg_length = doc_length.mean() if doc_length.mean() > 0 else 1
+    norm = k1 * (1 - b + b * doc_length / avg_length)
+    return (tf * (k1 + 1) / (tf + norm[:, None])) @ idf
+
+
+def rank_papers(papers_info, topic, query_list, title_weight=2):
+    """
+    按标题和摘要与主题、关键词的BM25相关性对论文排序
+    :param papers_info: extract_paper_data 返回的论文信息列表
+    :param topic: 主题
+    :param query_list: 检索式列表
+    :param title_weight: 标题的权重（标题重复的次数）
+    :return: 按分数从高到低排序的 [{"paper_id": , "score": }] 列表
+    """
+    query_terms = get_query_terms(topic, query_list)
+    doc_token_list = [tokenize(" ".join([paper["paper_title"]] * title_weight + [paper["paper_abstract"]]))
+                      for paper in papers_info]
+    scores = bm25_scores(doc_token_list, query_terms)
+
+    # 稳定排序，分数相同时保持原有顺序
+    order = np.argsort(-scores, kind="stable")
+    return [{"paper_id": papers_info[i]["paper_id"], "score": round(float(scores[i]), 4)} for i in order]
+
+
+def prefilter_papers(paper_data_path, papers_info, topic, query_list, top_k):
+    """
+    本地预筛选，只保留BM25分数最高的top_k篇论文，排序结果保存在论文信息文件旁
+    :param paper_data_path: 论文信息文件路径
+    :param papers_info: extract_paper_data 返回的论文信息列表
+    :param topic: 主题
+    :param query_list: 检索式列表
+    :param top_k: 保留的论文数量
+    :return: 保留的paper_id列表
+    """
+    rank_list = rank_papers(papers_info, topic, query_list)
+
+    rank_path = paper_data_path.replace(".json", "_local_rank.json")
+    with open(rank_path, "w", encoding="utf-8") as f:
+        json.dump(rank_list, f, ensure_ascii=False, indent=4)
+
+    candidate_id_list = [item["paper_id"] for item in rank_list[:top_k]]
+    print_with_timestamp(f"本地预筛选完成，从 {len(papers_info)} 篇论文中保留了 {len(candidate_id_list)} 篇交给大模型筛选...")
+
+    return candidate_id_list
@@ -0,0 +1,309 @@
+import argparse
+import datetime
+import html
+import json
+import os
+import re
+
+from llm_tool.gen_tool import print_with_timestamp
+
+# 简报模板，markdown与html在同一次遍历中生成，标题与段落的结构与此前使用markdown2转换的结果一致。
+# 与markdown2不同的是：值中的html标签会被转义而不是原样输出；只有大模型生成的总结字段按行内markdown转换，
+# 标题、作者等字段中的 * 与 _（例如LaTeX公式）按原文输出
+REPORT_HEADER_MD = "## {title}\n### 更新时间：{current_time}\n\n"
+REPORT_HEADER_HTML = "<h2>{title}</h2>\n\n<h3>更新时间：{current_time}</h3>\n\n"
+
+TOPIC_MD = "### 主题：{topic}\n"
+TOPIC_HTML = "<h3>主题：{topic}</h3>\n\n"
+
+QUERY_MD = "#### 关键词：{query}\n"
+QUERY_HTML = "<h4>关键词：{query}</h4>\n\n"
+
+SECTION_MD = "### {section}\n"
+SECTION_HTML = "<h3>{section}</h3>\n\n"
+
+COUNT_MD = "\n\n#### 共总结论文数量：{count}\n"
+COUNT_HTML = "<h4>共总结论文数量：{count}</h4>\n\n"
+
+PAPER_MD = "#### 论文序号：{number}\n" \
+           "**论文标题**：{paper_title}\n\n" \
+           "**论文作者**：{paper_authors}\n\n" \
+           "**论文发表时间**：{paper_published_time}\n\n" \
+           "**论文总结**：{summary}\n\n" \
+           "**论文关键点1**：{keypoints_1}\n\n" \
+           "**论文关键点2**：{keypoints_2}\n\n" \
+           "**论文地址**：{paper_entry_id}\n\n"
+PAPER_HTML = "<h4>论文序号：{number}</h4>\n\n" \
+             "<p><strong>论文标题</strong>：{paper_title}</p>\n\n" \
+             "<p><strong>论文作者</strong>：{paper_authors}</p>\n\n" \
+             "<p><strong>论文发表时间</strong>：{paper_published_time}</p>\n\n" \
+             "<p><strong>论文总结</strong>：{summary}</p>\n\n" \
+             "<p><strong>论文关键点1</strong>：{keypoints_1}</p>\n\n" \
+             "<p><strong>论文关键点2</strong>：{keypoints_2}</p>\n\n" \
+             "<p><strong>论文地址</strong>：{paper_entry_id}</p>\n\n"
+
+# 按行内markdown转换的字段
+INLINE_MARKDOWN_FIELDS = ("summary", "keypoints_1", "keypoints_2")
+
+# 行内markdown：代码、加粗与斜体，下划线只用于加粗，避免拆开变量名等带下划线的词
+INLINE_CODE_PATTERN = re.compile(r"(`[^`\n]+`)")
+INLINE_STRONG_PATTERN = re.compile(r"\*\*(?=\S)([^*]+?)(?<=\S)\*\*|__(?=\S)([^_]+?)(?<=\S)__")
+INLINE_EM_PATTERN = re.compile(r"\*(?=\S)([^*]+?)(?<=\S)\*")
+INLINE_MARKDOWN_CHARS = re.compile(r"[*_`\n]")
+
+# 汇总简报的周期
+DIGEST_PERIODS = {"week": ("论文周报", 7), "month": ("论文月报", 30)}
+
+# 每日目录的名称
+DAY_DIR_PATTERN = re.compile(r"^\d{8}$")
+
+
+def get_safe_name(name):
+    """
+    将主题等名称转为可用作文件名的字符串
+    :param name: 名称
+    :return: 文件名
+    """
+    return re.sub(r'[\\/:*?"<>|\s]+', "_", name.strip()) or "topic"
+
+
+def build_paper_index(paper_info):
+    """
+    按paper_id建立论文信息的索引
+    :param paper_info: extract_paper_data 返回的论文信息列表
+    :return: paper_id 到论文信息的字典
+    """
+    return {paper["paper_id"]: paper for paper in paper_info}
+
+
+def atomic_write(file_path, content):
+    """
+    先写临时文件再替换，避免读取到写了一半的文件
+    :param file_path: 文件路径
+    :param content: 文本内容
+    :return: 无返回
+    """
+    with open(file_path + ".tmp", "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(file_path + ".tmp", file_path)
+
+
+def render_inline(text):
+    """
+    将大模型回复中的行内markdown转换为html，其余内容转义，空行分隔的多段文字拆分为多个段落
+    :param text: 文本
+    :return: 用于<p>标签内的html
+    """
+    # 大多数总结不含markdown，直接转义
+    if not INLINE_MARKDOWN_CHARS.search(text):
+        return html.escape(text.strip(), quote=False)
+
+    paragraph_list = []
+    for paragraph in re.split(r"\n[ \t]*\n", text.replace("\r\n", "\n").strip()):
+        part_list = []
+        for i, part in enumerate(INLINE_CODE_PATTERN.split(paragraph.strip())):
+            if i % 2:
+                part_list.append("<code>" + html.escape(part[1:-1], quote=False) + "</code>")
+                continue
+            part = html.escape(part, quote=False)
+            part = INLINE_STRONG_PATTERN.sub(
+                lambda match: "<strong>" + (match.group(1) or match.group(2)) + "</strong>", part)
+            part_list.append(INLINE_EM_PATTERN.sub(r"<em>\1</em>", part))
+        paragraph_list.append("".join(part_list))
+    return "</p>\n\n<p>".join(paragraph_list)
+
+
+class ReportBuilder:
+    """
+    同时拼接简报的markdown与html
+    """
+
+    def __init__(self):
+        self._md_parts = []
+        self._html_parts = []
+
+    def add(self, md_template, html_template, **values):
+        """
+        按模板添加一段内容，html中的内容会被转义，总结字段按行内markdown转换
+        :param md_template: markdown模板
+        :param html_template: html模板
+        :param values: 模板中的值
+        :return: 无返回
+        """
+        self._md_parts.append(md_template.format(**values))
+        html_values = {key: render_inline(str(value)) if key in INLINE_MARKDOWN_FIELDS
+                       else html.escape(str(value), quote=False) for key, value in values.items()}
+        self._html_parts.append(html_template.format(**html_values))
+
+    def add_papers(self, paper_id_list, summary_dict, paper_index, start_number=1):
+        """
+        按顺序添加论文，索引中不存在的论文跳过
+        :param paper_id_list: 论文id列表
+        :param summary_dict: paper_id 到总结内容的字典
+        :param paper_index: paper_id 到论文信息的字典
+        :param start_number: 起始序号
+        :return: 下一篇论文的序号
+        """
+        number = start_number
+        for paper_id in paper_id_list:
+            paper = paper_index.get(paper_id)
+            if paper is None:
+                continue
+            summary = summary_dict[paper_id]
+            self.add(PAPER_MD, PAPER_HTML, number=number, paper_title=paper["paper_title"],
+                     paper_authors=paper["paper_authors"], paper_published_time=paper["paper_published_time"],
+                     summary=summary["summary"], keypoints_1=summary["keypoints_1"],
+                     keypoints_2=summary["keypoints_2"], paper_entry_id=paper["paper_entry_id"])
+            number += 1
+        return number
+
+    def render(self):
+        """
+        :return: markdown文本, html文本，html与markdown2的输出一样以单个换行结尾
+        """
+        return "".join(self._md_parts), "".join(self._html_parts).rstrip("\n") + "\n"
+
+
+def render_report(topic, query_list, summary_dict, paper_index, current_time=None):
+    """
+    生成单次运行的简报
+    :param topic: 主题
+    :param query_list: 检索式列表
+    :param summary_dict: paper_id 到总结内容的字典，按筛选结果排序
+    :param paper_index: paper_id 到论文信息的字典
+    :param current_time: 更新时间，为空时使用当前时间
+    :return: markdown文本, html文本
+    """
+    builder = ReportBuilder()
+    builder.add(REPORT_HEADER_MD, REPORT_HEADER_HTML, title="论文自动化结果",
+                current_time=current_time or datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    builder.add(TOPIC_MD, TOPIC_HTML, topic=topic)
+    for query in query_list:
+        builder.add(QUERY_MD, QUERY_HTML, query=query)
+    builder.add(COUNT_MD, COUNT_HTML, count=len(summary_dict))
+    builder.add_papers(list(summary_dict), summary_dict, paper_index)
+    return builder.render()
+
+
+def write_report(md_path, md_text, html_text):
+    """
+    写入markdown与同名的html文件
+    :param md_path: markdown文件路径
+    :param md_text: markdown文本
+    :param html_text: html文本
+    :return: html文件路径
+    """
+    html_path = md_path.replace(".md", ".html")
+    atomic_write(md_path, md_text)
+    atomic_write(html_path, html_text)
+    return html_path
+
+
+def load_paper_data(paper_data_path):
+    """
+    读取论文信息文件，按主题返回论文信息
+    :param paper_data_path: 论文信息文件路径
+    :return: 主题到论文信息列表的字典
+    """
+    with open(paper_data_path, "r", encoding="utf-8") as f:
+        paper_data = json.load(f)
+    topic_paper_dict = dict()
+    for topic, query_dict in paper_data.items():
+        paper_list = topic_paper_dict.setdefault(topic, [])
+        for paper_content in query_dict.values():
+            paper_list.extend(paper_content.values())
+    return topic_paper_dict
+
+
+def iter_daily_reports(root_paper_path, start_date, end_date):
+    """
+    遍历时间范围内每日目录中的简报数据，包括单主题运行保存在每日目录中的文件与多主题运行保存在主题子目录中的文件
+    :param root_paper_path: 论文根目录
+    :param start_date: 开始日期（包含）
+    :param end_date: 结束日期（包含）
+    :return: (日期, 论文信息文件路径, 总结文件路径) 的生成器，按日期排序
+    """
+    if not os.path.exists(root_paper_path):
+        return
+    for day in sorted(os.listdir(root_paper_path)):
+        if not DAY_DIR_PATTERN.match(day) or not start_date.strftime("%Y%m%d") <= day <= end_date.strftime("%Y%m%d"):
+            continue
+        day_dir = os.path.join(root_paper_path, day)
+        for dir_path in [day_dir] + sorted(os.path.join(day_dir, name) for name in os.listdir(day_dir)
+                                           if os.path.isdir(os.path.join(day_dir, name))):
+            paper_data_path = os.path.join(dir_path, day + ".json")
+            summary_path = os.path.join(dir_path, day + "_summary.json")
+            if os.path.exists(paper_data_path) and os.path.exists(summary_path):
+                yield day, paper_data_path, summary_path
+
+
+def render_digest(root_paper_path, period="week", end_date=None, topic=None):
+    """
+    将一段时间内的每日简报汇总为周报或月报，保存在论文根目录的digest目录下
+    :param root_paper_path: 论文根目录
+    :param period: 汇总周期，week或month
+    :param end_date: 结束日期，为空时使用今天
+    :param topic: 只汇总该主题，为空时汇总全部主题
+    :return: markdown文件路径，时间范围内没有简报时返回None
+    """
+    title, days = DIGEST_PERIODS[period]
+    end_date = end_date or datetime.date.today()
+    start_date = end_date - datetime.timedelta(days=days - 1)
+
+    # 按日期与主题整理论文，同一篇论文只在第一次出现时列出
+    paper_index = dict()
+    summary_dict = dict()
+    section_list = []
+    seen_id_set = set()
+    for day, paper_data_path, summary_path in iter_daily_reports(root_paper_path, start_date, end_date):
+        with open(summary_path, "r", encoding="utf-8") as f:
+            day_summary_dict = json.load(f)
+        for day_topic, paper_list in load_paper_data(paper_data_path).items():
+            if topic is not None and day_topic != topic:
+                continue
+            day_index = build_paper_index(paper_list)
+            paper_id_list = [paper_id for paper_id in day_summary_dict
+                             if paper_id in day_index and paper_id not in seen_id_set]
+            if not paper_id_list:
+                continue
+            seen_id_set.update(paper_id_list)
+            paper_index.update(day_index)
+            summary_dict.update(day_summary_dict)
+            section_list.append((f"{day[:4]}-{day[4:6]}-{day[6:]} {day_topic}", paper_id_list))
+
+    if not section_list:
+        print_with_timestamp(f"{start_date} 至 {end_date} 没有可汇总的简报...")
+        return None
+
+    builder = ReportBuilder()
+    builder.add(REPORT_HEADER_MD, REPORT_HEADER_HTML, title=f"{title}（{start_date} 至 {end_date}）",
+                current_time=datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    if topic is not None:
+        builder.add(TOPIC_MD, TOPIC_HTML, topic=topic)
+    builder.add(COUNT_MD, COUNT_HTML, count=len(seen_id_set))
+    number = 1
+    for section, paper_id_list in section_list:
+        builder.add(SECTION_MD, SECTION_HTML, section=section)
+        number = builder.add_papers(paper_id_list, summary_dict, paper_index, number)
+    md_text, html_text = builder.render()
+
+    digest_dir = os.path.join(root_paper_path, "digest")
+    if not os.path.exists(digest_dir):
+        os.makedirs(digest_dir)
+    md_path = os.path.join(digest_dir, f"{period}_{end_date.strftime('%Y%m%d')}"
+                                       + (f"_{get_safe_name(topic)}" if topic else "") + ".md")
+    write_report(md_path, md_text, html_text)
+    print_with_timestamp(f"{title}已保存至 {md_path}...")
+
+    return md_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="生成周报或月报")
+    parser.add_argument("root_paper_path", help="论文根目录")
+    parser.add_argument("--period", choices=list(DIGEST_PERIODS), default="week", help="汇总周期")
+    parser.add_argument("--end-date", default=None, help="结束日期，格式为YYYYMMDD，默认为今天")
+    parser.add_argument("--topic", default=None, help="只汇总该主题")
+    args = parser.parse_args()
+    render_digest(args.root_paper_path, args.period,
+                  datetime.datetime.strptime(args.end_date, "%Y%m%d").date() if args.end_date else None, args.topic)
@@ -0,0 +1,237 @@
+import asyncio
+import datetime
+import json
+import os
+
+from llm_tool.gen_tool import print_with_timestamp
+
+# 平台相关的文件锁
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+# 中文周几到 datetime.weekday() 的映射
+WEEKDAY_MAPPING = {"周一": 0, "周二": 1, "周三": 2, "周四": 3, "周五": 4, "周六": 5, "周日": 6}
+
+# 单次休眠的最长时间（秒），系统休眠或修改时间后可以及时按墙上时间重新计算
+MAX_SLEEP_SECONDS = 3600
+
+# 保存运行状态的文件名
+STATE_FILE_NAME = "scheduler_state.json"
+
+
+def read_last_run(state_dir):
+    """
+    读取最近一次完成的计划运行时间
+    :param state_dir: 保存运行状态的目录
+    :return: 计划运行时间，没有运行过时返回None
+    """
+    state_path = os.path.join(state_dir, STATE_FILE_NAME)
+    if not os.path.exists(state_path):
+        return None
+    with open(state_path, "r", encoding="utf-8") as f:
+        return datetime.datetime.fromisoformat(json.load(f)["last_run"])
+
+
+def last_due_time(weekdays, hour, minute, now):
+    """
+    计算不晚于now的最近一次计划运行时间
+    :param weekdays: 运行的周几，datetime.weekday() 的取值列表
+    :param hour: 时
+    :param minute: 分
+    :param now: 当前时间
+    :return: 计划运行时间，没有选择周几时返回None
+    """
+    for days in range(8):
+        slot = (now - datetime.timedelta(days=days)).replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if slot <= now and slot.weekday() in weekdays:
+            return slot
+    return None
+
+
+def next_run_time(weekdays, hour, minute, now):
+    """
+    计算晚于now的下一次计划运行时间
+    :param weekdays: 运行的周几，datetime.weekday() 的取值列表
+    :param hour: 时
+    :param minute: 分
+    :param now: 当前时间
+    :return: 计划运行时间，没有选择周几时返回None
+    """
+    for days in range(8):
+        slot = (now + datetime.timedelta(days=days)).replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if slot > now and slot.weekday() in weekdays:
+            return slot
+    return None
+
+
+class RunLock:
+    """
+    跨进程的运行锁，同一目录下同时只能有一个任务在运行，进程退出后由操作系统自动释放
+    """
+
+    def __init__(self, lock_path):
+        """
+        :param lock_path: 锁文件路径
+        """
+        self.lock_path = lock_path
+        self._file = None
+
+    def acquire(self):
+        """
+        尝试获取锁，不等待
+        :return: 是否获取成功
+        """
+        self._file = open(self.lock_path, "a+")
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            self._file.close()
+            self._file = None
+            return False
+        return True
+
+    def release(self):
+        """
+        释放锁
+        :return: 无返回
+        """
+        if self._file is None:
+            return
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        self._file.close()
+        self._file = None
+
+
+class ScheduleDaemon:
+    """
+    基于asyncio的定时任务，休眠到下一次计划运行时间再唤醒，任务在线程中执行，不阻塞事件循环。
+    错过的运行（例如电脑关机或上一次任务运行过久）在恢复后补运行一次，同一时间只运行一个任务
+    """
+
+    def __init__(self, job, weekdays, hour, minute, state_dir, catch_up_hours=24):
+        """
+        :param job: 任务函数，无参数
+        :param weekdays: 运行的周几，中文（周一至周日）列表
+        :param hour: 时
+        :param minute: 分
+        :param state_dir: 保存运行状态与锁文件的目录
+        :param catch_up_hours: 错过的运行在多少小时内补运行，超过后只等待下一次
+        """
+        self.job = job
+        self.weekdays = sorted({WEEKDAY_MAPPING[weekday] for weekday in weekdays})
+        self.hour = int(hour)
+        self.minute = int(minute)
+        self.catch_up = datetime.timedelta(hours=catch_up_hours)
+        if not os.path.exists(state_dir):
+            os.makedirs(state_dir)
+        self.state_dir = state_dir
+        self.state_path = os.path.join(state_dir, STATE_FILE_NAME)
+        self.run_lock = RunLock(os.path.join(state_dir, "scheduler.lock"))
+        self._lock = asyncio.Lock()
+        self._loop = None
+        self._stop_event = None
+        self._stop_requested = False
+
+    def stop(self):
+        """
+        停止定时任务，可在其他线程中调用；正在运行的任务会继续运行到结束
+        :return: 无返回
+        """
+        self._stop_requested = True
+        if self._loop is not None and self._stop_event is not None:
+            self._loop.call_soon_threadsafe(self._stop_event.set)
+
+    def load_last_run(self):
+        """
+        读取最近一次完成的计划运行时间，首次启动时视为当前时间，不补运行
+        :return: 计划运行时间
+        """
+        return read_last_run(self.state_dir) or datetime.datetime.now()
+
+    def save_last_run(self, slot):
+        """
+        保存最近一次完成的计划运行时间
+        :param slot: 计划运行时间
+        :return: 无返回
+        """
+        with open(self.state_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"last_run": slot.isoformat()}, f)
+        os.replace(self.state_path + ".tmp", self.state_path)
+
+    async def run_job(self, slot=None):
+        """
+        在线程中运行一次任务，已有任务在运行时跳过
+        :param slot: 对应的计划运行时间，为空时为手动运行，不记录为计划运行，不影响错过的运行的补运行
+        :return: 是否运行成功
+        """
+        if self._lock.locked() or not self.run_lock.acquire():
+            print_with_timestamp("已有任务正在运行，跳过本次运行...")
+            return False
+        async with self._lock:
+            try:
+                if slot is None:
+                    print_with_timestamp("开始手动运行的任务...")
+                else:
+                    print_with_timestamp(f"开始计划于 {slot.strftime('%Y-%m-%d %H:%M')} 的任务...")
+                await asyncio.get_running_loop().run_in_executor(None, self.job)
+                if slot is not None:
+                    self.save_last_run(slot)
+                return True
+            except Exception as e:
+                print_with_timestamp(f"任务运行失败：{e}")
+                return False
+            finally:
+                self.run_lock.release()
+
+    async def run(self):
+        """
+        持续运行直到手动停止或调用stop
+        :return: 无返回
+        """
+        if not self.weekdays:
+            print_with_timestamp("没有选择运行的周几，定时任务不会运行...")
+            return
+
+        self._loop = asyncio.get_running_loop()
+        self._stop_event = asyncio.Event()
+        # 启动前已请求停止
+        if self._stop_requested:
+            self._stop_event.set()
+        last_run = self.load_last_run()
+        announced_slot = None
+        while not self._stop_event.is_set():
+            now = datetime.datetime.now()
+            slot = last_due_time(self.weekdays, self.hour, self.minute, now)
+            if slot is not None and slot > last_run:
+                if now - slot <= self.catch_up:
+                    if slot < now - datetime.timedelta(minutes=1):
+                        print_with_timestamp(f"补运行错过的任务（原计划于 {slot.strftime('%Y-%m-%d %H:%M')}）...")
+                    await self.run_job(slot)
+                else:
+                    print_with_timestamp(f"计划于 {slot.strftime('%Y-%m-%d %H:%M')} 的任务已错过太久，不再补运行...")
+                # 失败的运行不会立即重试，等待下一次计划运行时间
+                last_run = slot
+                continue
+
+            # 只在下次运行时间变化时输出，休眠期间没有任何输出
+            next_slot = next_run_time(self.weekdays, self.hour, self.minute, now)
+            if next_slot != announced_slot:
+                print_with_timestamp(f"下次运行时间：{next_slot.strftime('%Y-%m-%d %H:%M')}")
+                announced_slot = next_slot
+            try:
+                await asyncio.wait_for(self._stop_event.wait(),
+                                       timeout=min((next_slot - now).total_seconds(), MAX_SLEEP_SECONDS))
+            except asyncio.TimeoutError:
+                pass
+        print_with_timestamp("定时任务已停止...")
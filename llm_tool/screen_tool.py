@@ -0,0 +1,210 @@
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import openai
+
+from llm_tool.gen_tool import print_with_timestamp, estimate_tokens, retry_with_backoff, MOONSHOT_SYSTEM_PROMPT
+from llm_tool.metrics_tool import get_metrics, record_completion
+from llm_tool.parse_tool import parse_response, ResponseParseError, SCORE_SCHEMA, JSON_MODE
+
+# 筛选时只发送与相关性有关的字段
+SCREEN_FIELDS = ("paper_id", "paper_title", "paper_abstract")
+
+# JSON模式只能返回对象，打分列表包装在scores字段中，解析时由 normalize_scores 取出
+SCREEN_USER_PROMPT = "请对用户提供的每一篇论文按是否适合建筑领域人士阅读进行打分，分数为0到10的整数，分数越高越适合，" \
+                     "必须以{\"scores\": [{\"paper_id\": \"\", \"score\": 0}]}的json格式返回全部论文的结果，" \
+                     "禁止添加其他内容"
+
+
+def build_screen_record(paper, abstract_length=1500):
+    """
+    只保留筛选需要的字段，并截断过长的摘要
+    :param paper: 论文信息
+    :param abstract_length: 摘要保留的最大字符数
+    :return: 论文记录
+    """
+    record = {key: paper[key] for key in SCREEN_FIELDS}
+    record["paper_abstract"] = record["paper_abstract"][:abstract_length]
+    return record
+
+
+def build_screen_batches(papers_info, token_budget=4000, abstract_length=1500):
+    """
+    按token预算将论文打包成多个批次，每篇论文只保留筛选需要的字段
+    :param papers_info: extract_paper_data 返回的论文信息列表
+    :param token_budget: 每个批次论文部分的token上限
+    :param abstract_length: 摘要保留的最大字符数
+    :return: 批次列表，每个批次为论文记录的列表
+    """
+    batch_list = []
+    current_batch = []
+    current_tokens = 0
+
+    for paper in papers_info:
+        record = build_screen_record(paper, abstract_length)
+        record_tokens = estimate_tokens(json.dumps(record, ensure_ascii=False))
+
+        if current_batch and current_tokens + record_tokens > token_budget:
+            batch_list.append(current_batch)
+            current_batch = []
+            current_tokens = 0
+        current_batch.append(record)
+        current_tokens += record_tokens
+
+    if current_batch:
+        batch_list.append(current_batch)
+
+    return batch_list
+
+
+def normalize_scores(value):
+    """
+    整理打分结果的常见变体：外层包装的对象、单篇论文的对象、paper_id 到分数的字典以及字符串形式的分数
+    :param value: 解析得到的json
+    :return: [{"paper_id": , "score": }] 列表，无法整理时原样返回，由校验报告错误
+    """
+    if isinstance(value, dict):
+        if "paper_id" in value:
+            value = [value]
+        else:
+            list_value_list = [item for item in value.values() if isinstance(item, list)]
+            if list_value_list:
+                value = list_value_list[0]
+            elif value and all(isinstance(item, (int, float, str)) for item in value.values()):
+                value = [{"paper_id": paper_id, "score": score} for paper_id, score in value.items()]
+    if isinstance(value, list):
+        for item in value:
+            if isinstance(item, dict) and isinstance(item.get("score"), str):
+                try:
+                    item["score"] = float(item["score"].strip())
+                except ValueError:
+                    pass
+    return value
+
+
+def parse_scores(content, repair=None, response_store=None, item_key=None):
+    """
+    从大模型的回复中解析打分结果
+    :param content: 大模型的回复
+    :param repair: 解析失败时的修复函数，见 parse_tool.parse_response
+    :param response_store: 保存原始回复的ResponseStore
+    :param item_key: 回复对应的批次
+    :return: paper_id 到分数的字典
+    """
+    score_list = parse_response(content, SCORE_SCHEMA, normalize=normalize_scores, repair=repair,
+                                response_store=response_store, kind="judge", item_key=item_key)
+    return {str(item["paper_id"]): float(item["score"]) for item in score_list}
+
+
+def score_batch(client, model, batch, rate_limiter=None, response_store=None, retry_missing=True):
+    """
+    调用大模型对一个批次的论文打分，回复格式有误时只发送原始回复请求修复，遗漏的论文单独再打分一次
+    :param client: 客户端
+    :param model: 模型名称
+    :param batch: 论文记录的列表
+    :param rate_limiter: 请求数与token数的限速器
+    :param response_store: 保存原始回复的ResponseStore，为空时不保存
+    :param retry_missing: 是否对回复中遗漏的论文重新打分
+    :return: paper_id 到分数的字典，不包含没有得到打分的论文
+    """
+    content = json.dumps(batch, ensure_ascii=False)
+    if rate_limiter is not None:
+        # 每篇论文的打分结果约20个token
+        rate_limiter.acquire(estimate_tokens(content) + estimate_tokens(SCREEN_USER_PROMPT) + 20 * len(batch))
+
+    completion = client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": MOONSHOT_SYSTEM_PROMPT},
+            {"role": "user", "content": f"{content} \n " + SCREEN_USER_PROMPT}
+        ],
+        temperature=0,
+        response_format=JSON_MODE,
+    )
+
+    record_completion(completion)
+
+    def _repair(messages):
+        if rate_limiter is not None:
+            rate_limiter.acquire(sum(estimate_tokens(message["content"]) for message in messages) + 20 * len(batch))
+        repair_completion = retry_with_backoff(
+            lambda: client.chat.completions.create(model=model, messages=messages, temperature=0,
+                                                   response_format=JSON_MODE),
+            exceptions=(openai.RateLimitError, openai.APIConnectionError),
+            on_retry=lambda: get_metrics().record(retries=1))
+        record_completion(repair_completion)
+        return repair_completion.choices[0].message.content
+
+    batch_id_list = [record["paper_id"] for record in batch]
+    item_key = hashlib.sha256(",".join(sorted(batch_id_list)).encode("utf-8")).hexdigest()[:16]
+    score_dict = parse_scores(completion.choices[0].message.content, _repair, response_store, item_key)
+
+    # 忽略大模型编造的paper_id，遗漏的论文只对其本身重新打分一次，仍然遗漏的不计分也不缓存，下次运行时重新打分
+    missing_batch = [record for record in batch if record["paper_id"] not in score_dict]
+    if missing_batch and retry_missing:
+        print_with_timestamp(f"打分结果遗漏了 {len(missing_batch)} 篇论文，重新打分...")
+        score_dict.update(score_batch(client, model, missing_batch, rate_limiter, response_store,
+                                      retry_missing=False))
+        missing_id_list = [paper_id for paper_id in batch_id_list if paper_id not in score_dict]
+        if missing_id_list:
+            print_with_timestamp(f"论文 {', '.join(missing_id_list)} 仍未得到打分，本次跳过...")
+    return {paper_id: score_dict[paper_id] for paper_id in batch_id_list if paper_id in score_dict}
+
+
+def score_papers(client, model, papers_info, token_budget=4000, max_workers=4, rate_limiter=None,
+                 response_store=None):
+    """
+    分批并发地对论文打分
+    :param client: 客户端
+    :param model: 模型名称
+    :param papers_info: extract_paper_data 返回的论文信息列表
+    :param token_budget: 每个批次论文部分的token上限
+    :param max_workers: 并发数
+    :param rate_limiter: 请求数与token数的限速器
+    :param response_store: 保存原始回复的ResponseStore，为空时不保存
+    :return: paper_id 到分数的字典
+    """
+    batch_list = build_screen_batches(papers_info, token_budget=token_budget)
+    print_with_timestamp(f"共 {len(papers_info)} 篇论文，分为 {len(batch_list)} 批进行筛选...")
+
+    def _score(batch):
+        try:
+            return retry_with_backoff(lambda: score_batch(client, model, batch, rate_limiter, response_store),
+                                      exceptions=(openai.RateLimitError, openai.APIConnectionError),
+                                      on_retry=lambda: get_metrics().record(retries=1))
+        except ResponseParseError as e:
+            # 修复后仍无法解析的批次不计分也不缓存，下次运行时重新打分，原始回复已保存
+            print_with_timestamp(f"{len(batch)} 篇论文的打分结果无法解析：{e}")
+            return dict()
+
+    score_dict = dict()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for batch_score_dict in executor.map(_score, batch_list):
+            score_dict.update(batch_score_dict)
+
+    return score_dict
+
+
+def select_top_papers(papers_info, score_dict, judge_number):
+    """
+    按分数合并为全局前judge_number篇
+    :param papers_info: extract_paper_data 返回的论文信息列表
+    :param score_dict: paper_id 到分数的字典
+    :param judge_number: 保留的论文数量
+    :return: 按分数从高到低排序的 [{"paper_id": , "score": }] 列表
+    """
+    # 分数相同时保持原有顺序
+    order_dict = {paper["paper_id"]: i for i, paper in enumerate(papers_info)}
+    ranked_id_list = sorted((paper_id for paper_id in score_dict if paper_id in order_dict),
+                            key=lambda paper_id: (-score_dict[paper_id], order_dict[paper_id]))
+
+    return [{"paper_id": paper_id, "score": score_dict[paper_id]} for paper_id in ranked_id_list[:judge_number]]
+
+
+def get_prompt_hash():
+    """
+    计算筛选提示词的哈希，提示词变化后历史打分不再复用
+    :return: sha256的前16位
+    """
+    return hashlib.sha256((MOONSHOT_SYSTEM_PROMPT + SCREEN_USER_PROMPT).encode("utf-8")).hexdigest()[:16]
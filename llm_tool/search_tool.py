@@ -0,0 +1,257 @@
+import argparse
+import datetime
+import json
+import os
+import sqlite3
+
+from llm_tool.gen_tool import print_with_timestamp
+from llm_tool.render_tool import DAY_DIR_PATTERN, load_paper_data
+from llm_tool.store_tool import BaseStore
+
+# 参与检索的字段及其在bm25排序中的权重
+SEARCH_COLUMNS = [("title", 10.0), ("authors", 5.0), ("abstract", 1.0), ("summary", 2.0), ("keypoints", 2.0)]
+
+# trigram分词按三个字符切分，适用于没有空格的中文；较短的检索词改用LIKE匹配
+TRIGRAM_LENGTH = 3
+
+
+def get_keypoints(summary):
+    """
+    :param summary: 总结内容
+    :return: 两个关键点拼接后的文本
+    """
+    return "\n".join(str(summary.get(key, "")) for key in ("keypoints_1", "keypoints_2"))
+
+
+class SearchIndex(BaseStore):
+    """
+    基于SQLite FTS5的论文全文索引，索引标题、作者、摘要以及中文总结和关键点。
+    论文信息保存在paper_doc表中，由触发器同步到外部内容的paper_fts表，更新单篇论文不需要重建索引
+    """
+
+    def __init__(self, root_paper_path):
+        """
+        :param root_paper_path: 论文根目录，数据库文件保存为该目录下的paper_store.db
+        """
+        super().__init__(root_paper_path)
+        column_names = ", ".join(column for column, _ in SEARCH_COLUMNS)
+        new_columns = ", ".join(f"new.{column}" for column, _ in SEARCH_COLUMNS)
+        old_columns = ", ".join(f"old.{column}" for column, _ in SEARCH_COLUMNS)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS paper_doc ("
+                "id INTEGER PRIMARY KEY, "
+                "paper_id TEXT NOT NULL UNIQUE, "
+                "title TEXT NOT NULL DEFAULT '', "
+                "authors TEXT NOT NULL DEFAULT '', "
+                "abstract TEXT NOT NULL DEFAULT '', "
+                "summary TEXT NOT NULL DEFAULT '', "
+                "keypoints TEXT NOT NULL DEFAULT '', "
+                "topic TEXT, "
+                "published TEXT, "
+                "entry_id TEXT, "
+                "first_seen TEXT, "
+                "updated_at TEXT NOT NULL)"
+            )
+            # 较早的SQLite（3.34之前）没有trigram分词，退回按空格与标点分词
+            try:
+                self._create_fts(column_names, "trigram")
+            except sqlite3.OperationalError:
+                print_with_timestamp("当前SQLite不支持trigram分词，中文只能按整句检索...")
+                self._create_fts(column_names, "unicode61")
+            self._conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS paper_doc_ai AFTER INSERT ON paper_doc BEGIN "
+                f"INSERT INTO paper_fts (rowid, {column_names}) VALUES (new.id, {new_columns}); END"
+            )
+            self._conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS paper_doc_ad AFTER DELETE ON paper_doc BEGIN "
+                f"INSERT INTO paper_fts (paper_fts, rowid, {column_names}) VALUES ('delete', old.id, {old_columns}); "
+                "END"
+            )
+            self._conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS paper_doc_au AFTER UPDATE ON paper_doc BEGIN "
+                f"INSERT INTO paper_fts (paper_fts, rowid, {column_names}) VALUES ('delete', old.id, {old_columns}); "
+                f"INSERT INTO paper_fts (rowid, {column_names}) VALUES (new.id, {new_columns}); END"
+            )
+
+    def _create_fts(self, column_names, tokenizer):
+        self._conn.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS paper_fts USING fts5({column_names}, "
+            f"content='paper_doc', content_rowid='id', tokenize='{tokenizer}')"
+        )
+
+    def count(self):
+        """
+        :return: 已索引的论文数量
+        """
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM paper_doc").fetchone()[0]
+
+    def put_papers(self, paper_list, topic=None, day=None):
+        """
+        写入论文信息，已存在的论文只更新论文信息，保留总结与首次出现的日期
+        :param paper_list: 论文信息列表，格式见 moonshot_tool.extract_paper_data
+        :param topic: 论文所属的主题
+        :param day: 论文出现的日期，格式为YYYYMMDD
+        :return: 无返回
+        """
+        current_time = datetime.datetime.now().isoformat(timespec="seconds")
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO paper_doc (paper_id, title, authors, abstract, topic, published, entry_id, first_seen, "
+                "updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(paper_id) DO UPDATE SET title = excluded.title, authors = excluded.authors, "
+                "abstract = excluded.abstract, topic = COALESCE(excluded.topic, topic), "
+                "published = excluded.published, entry_id = excluded.entry_id, "
+                "first_seen = MIN(COALESCE(first_seen, excluded.first_seen), "
+                "COALESCE(excluded.first_seen, first_seen)), "
+                "updated_at = excluded.updated_at",
+                [(paper["paper_id"], paper.get("paper_title") or "", str(paper.get("paper_authors") or ""),
+                  paper.get("paper_abstract") or "", topic, paper.get("paper_published_time"),
+                  paper.get("paper_entry_id"), day, current_time) for paper in paper_list]
+            )
+
+    def put_summaries(self, summary_dict):
+        """
+        写入论文的总结与关键点，索引中不存在的论文跳过
+        :param summary_dict: paper_id 到总结内容的字典
+        :return: 无返回
+        """
+        current_time = datetime.datetime.now().isoformat(timespec="seconds")
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE paper_doc SET summary = ?, keypoints = ?, updated_at = ? WHERE paper_id = ?",
+                [(str(summary.get("summary", "")), get_keypoints(summary), current_time, paper_id)
+                 for paper_id, summary in summary_dict.items()]
+            )
+
+    def put_stored_summaries(self):
+        """
+        从同一数据库的summary表中写入全部已保存的总结
+        :return: 无返回
+        """
+        with self._lock:
+            table_exists = self._conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'summary'").fetchone()
+            rows = self._conn.execute("SELECT paper_id, content FROM summary").fetchall() if table_exists else []
+        self.put_summaries({paper_id: json.loads(content) for paper_id, content in rows})
+
+    def search(self, query, limit=50):
+        """
+        全文检索，多个检索词之间以空格分隔，需要同时匹配；不少于三个字符的检索词使用全文索引并按相关性排序，
+        较短的检索词（例如两个字的中文词）逐条匹配
+        :param query: 检索词
+        :param limit: 最多返回的数量
+        :return: 论文列表，每篇论文包含paper_id、title、authors、published、entry_id、topic、first_seen、summary、snippet
+        """
+        term_list = [term for term in query.split() if term]
+        if not term_list:
+            return []
+        match_list = [term for term in term_list if len(term) >= TRIGRAM_LENGTH]
+        like_list = [term for term in term_list if len(term) < TRIGRAM_LENGTH]
+
+        where_list = []
+        params = []
+        if match_list:
+            where_list.append("paper_fts MATCH ?")
+            params.append(" AND ".join('"' + term.replace('"', '""') + '"' for term in match_list))
+        for term in like_list:
+            where_list.append("(" + " OR ".join(f"paper_fts.{column} LIKE ?" for column, _ in SEARCH_COLUMNS) + ")")
+            params.extend(["%" + term + "%"] * len(SEARCH_COLUMNS))
+
+        if match_list:
+            snippet = "snippet(paper_fts, -1, '**', '**', '…', 24)"
+            order = "bm25(paper_fts, " + ", ".join(str(weight) for _, weight in SEARCH_COLUMNS) + ")"
+        else:
+            snippet = "substr(paper_doc.abstract, 1, 200)"
+            order = "paper_doc.published DESC"
+
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT paper_doc.paper_id, paper_doc.title, paper_doc.authors, paper_doc.published, "
+                f"paper_doc.entry_id, paper_doc.topic, paper_doc.first_seen, paper_doc.summary, {snippet} "
+                "FROM paper_fts JOIN paper_doc ON paper_doc.id = paper_fts.rowid "
+                f"WHERE {' AND '.join(where_list)} ORDER BY {order} LIMIT ?", params + [limit]
+            ).fetchall()
+        return [dict(zip(["paper_id", "title", "authors", "published", "entry_id", "topic", "first_seen", "summary",
+                          "snippet"], row)) for row in rows]
+
+
+def index_daily_report(search_index, paper_data_path, summary_path=None, day=None):
+    """
+    将一次运行的论文信息与总结写入索引
+    :param search_index: SearchIndex
+    :param paper_data_path: 论文信息文件路径
+    :param summary_path: 总结文件路径，为空或不存在时只写入论文信息
+    :param day: 日期，为空时取论文信息文件的名称
+    :return: 写入的论文数量
+    """
+    day = day or os.path.splitext(os.path.basename(paper_data_path))[0]
+    paper_number = 0
+    for topic, paper_list in load_paper_data(paper_data_path).items():
+        search_index.put_papers(paper_list, topic=topic, day=day)
+        paper_number += len(paper_list)
+    if summary_path and os.path.exists(summary_path):
+        with open(summary_path, "r", encoding="utf-8") as f:
+            search_index.put_summaries(json.load(f))
+    return paper_number
+
+
+def rebuild_index(search_index, root_paper_path):
+    """
+    从每日目录中的论文信息文件与数据库中的全部总结建立索引，已索引的论文会被更新
+    :param search_index: SearchIndex
+    :param root_paper_path: 论文根目录
+    :return: 写入的论文数量
+    """
+    paper_number = 0
+    if os.path.exists(root_paper_path):
+        for day in sorted(os.listdir(root_paper_path)):
+            day_dir = os.path.join(root_paper_path, day)
+            if not DAY_DIR_PATTERN.match(day) or not os.path.isdir(day_dir):
+                continue
+            # 多主题运行的论文信息保存在主题子目录中
+            for dir_path in [day_dir] + [os.path.join(day_dir, name) for name in sorted(os.listdir(day_dir))]:
+                paper_data_path = os.path.join(dir_path, day + ".json")
+                if os.path.exists(paper_data_path):
+                    paper_number += index_daily_report(search_index, paper_data_path, day=day)
+
+    search_index.put_stored_summaries()
+    print_with_timestamp(f"全文索引重建完成，共 {search_index.count()} 篇论文...")
+    return paper_number
+
+
+def update_search_index(root_paper_path, paper_data_path, summary_path=None):
+    """
+    每次运行结束后更新全文索引，首次使用时先从已有的每日目录建立索引
+    :param root_paper_path: 论文根目录
+    :param paper_data_path: 本次运行的论文信息文件路径
+    :param summary_path: 本次运行的总结文件路径
+    :return: 无返回
+    """
+    search_index = SearchIndex(root_paper_path)
+    try:
+        if search_index.count() == 0:
+            rebuild_index(search_index, root_paper_path)
+        else:
+            paper_number = index_daily_report(search_index, paper_data_path, summary_path)
+            print_with_timestamp(f"全文索引已更新 {paper_number} 篇论文...")
+    finally:
+        search_index.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="检索已保存的论文")
+    parser.add_argument("root_paper_path", help="论文根目录")
+    parser.add_argument("query", nargs="?", default=None, help="检索词，多个检索词以空格分隔")
+    parser.add_argument("--rebuild", action="store_true", help="从每日目录重建索引")
+    parser.add_argument("--limit", type=int, default=20, help="最多返回的数量")
+    args = parser.parse_args()
+
+    index = SearchIndex(args.root_paper_path)
+    if args.rebuild:
+        rebuild_index(index, args.root_paper_path)
+    if args.query:
+        for result in index.search(args.query, limit=args.limit):
+            print(f"{result['paper_id']}  {result['title']}\n    {result['snippet']}")
+    index.close()
@@ -0,0 +1,634 @@
+import datetime
+import json
+import os
+import shutil
+import sqlite3
+import threading
+
+from llm_tool.file_cache_tool import get_file_hash
+from llm_tool.gen_tool import print_with_timestamp
+
+
+class BaseStore:
+    """
+    论文根目录下paper_store.db的连接，开启WAL模式，可在多线程间共享
+    """
+
+    def __init__(self, root_paper_path):
+        """
+        :param root_paper_path: 论文根目录，数据库文件保存为该目录下的paper_store.db
+        """
+        if not os.path.exists(root_paper_path):
+            os.makedirs(root_paper_path)
+        self.db_path = os.path.join(root_paper_path, "paper_store.db")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+
+    def close(self):
+        """
+        关闭数据库连接
+        :return: 无返回
+        """
+        self._conn.close()
+
+
+class SummaryStore(BaseStore):
+    """
+    基于SQLite的论文总结存储，按paper_id建立主键索引，
+    每次写入都在独立事务中完成，写入中断不会影响已有的总结
+    """
+
+    def __init__(self, root_paper_path):
+        """
+        :param root_paper_path: 论文根目录，数据库文件保存为该目录下的paper_store.db
+        """
+        super().__init__(root_paper_path)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS summary ("
+                "paper_id TEXT PRIMARY KEY, "
+                "content TEXT NOT NULL, "
+                "created_at TEXT NOT NULL)"
+            )
+
+        # 从旧版本的total_summary.json迁移
+        self.migrate_json(os.path.join(root_paper_path, "total_summary.json"))
+
+    def migrate_json(self, json_path):
+        """
+        将旧版本total_summary.json中的总结导入数据库，已存在的paper_id不会被覆盖，
+        导入完成后将json文件重命名为.migrated
+        :param json_path: total_summary.json的路径
+        :return: 导入的数量
+        """
+        if not os.path.exists(json_path):
+            return 0
+
+        paper_summary_dict = dict()
+        if os.path.getsize(json_path) != 0:
+            with open(json_path, "r", encoding="utf-8") as f:
+                paper_summary_dict = json.load(f)
+
+        current_time = datetime.datetime.now().isoformat(timespec="seconds")
+        with self._lock, self._conn:
+            cursor = self._conn.executemany(
+                "INSERT OR IGNORE INTO summary (paper_id, content, created_at) VALUES (?, ?, ?)",
+                [(paper_id, json.dumps(summary, ensure_ascii=False), current_time)
+                 for paper_id, summary in paper_summary_dict.items()]
+            )
+        os.replace(json_path, json_path + ".migrated")
+        print_with_timestamp(f"已将 {cursor.rowcount} 条论文总结从 {json_path} 迁移至 {self.db_path}...")
+
+        return cursor.rowcount
+
+    def get(self, paper_id):
+        """
+        查询单篇论文的总结
+        :param paper_id: 论文id
+        :return: 总结内容，不存在时返回None
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT content FROM summary WHERE paper_id = ?", (paper_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, paper_id, summary):
+        """
+        保存单篇论文的总结
+        :param paper_id: 论文id
+        :param summary: 总结内容
+        :return: 无返回
+        """
+        current_time = datetime.datetime.now().isoformat(timespec="seconds")
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO summary (paper_id, content, created_at) VALUES (?, ?, ?)",
+                (paper_id, json.dumps(summary, ensure_ascii=False), current_time)
+            )
+
+    def _select_in(self, columns, paper_id_list):
+        """
+        按paper_id列表批量查询，SQLite对参数数量有限制，因此分批查询
+        :param columns: 查询的列
+        :param paper_id_list: 论文id列表
+        :return: 查询结果
+        """
+        paper_id_list = list(paper_id_list)
+        rows = []
+        for i in range(0, len(paper_id_list), 500):
+            batch = paper_id_list[i:i + 500]
+            with self._lock:
+                rows.extend(self._conn.execute(
+                    f"SELECT {columns} FROM summary WHERE paper_id IN ({','.join('?' * len(batch))})", batch
+                ).fetchall())
+        return rows
+
+    def get_many(self, paper_id_list):
+        """
+        批量查询论文的总结
+        :param paper_id_list: 论文id列表
+        :return: paper_id 到总结内容的字典，只包含已总结的论文
+        """
+        return {paper_id: json.loads(content) for paper_id, content in self._select_in("paper_id, content",
+                                                                                      paper_id_list)}
+
+    def summarized_ids(self, paper_id_list):
+        """
+        查询哪些论文已经总结过
+        :param paper_id_list: 论文id列表
+        :return: 已总结的paper_id集合
+        """
+        return {row[0] for row in self._select_in("paper_id", paper_id_list)}
+
+    def alias(self, alias_dict):
+        """
+        将已总结论文的总结复制给其新版本或重复论文，已有总结的论文不会被覆盖
+        :param alias_dict: 新paper_id 到已有paper_id 的字典
+        :return: 复制的数量
+        """
+        current_time = datetime.datetime.now().isoformat(timespec="seconds")
+        with self._lock, self._conn:
+            cursor = self._conn.executemany(
+                "INSERT OR IGNORE INTO summary (paper_id, content, created_at) "
+                "SELECT ?, content, ? FROM summary WHERE paper_id = ?",
+                [(paper_id, current_time, source_id) for paper_id, source_id in alias_dict.items()]
+            )
+        return cursor.rowcount
+
+
+class JudgeCache(BaseStore):
+    """
+    跨天的论文筛选打分缓存，以 (paper_id, topic, prompt_hash, model) 为键，
+    同一主题、提示词与模型下已打过分的论文不再发送给大模型
+    """
+
+    def __init__(self, root_paper_path):
+        """
+        :param root_paper_path: 论文根目录，数据库文件保存为该目录下的paper_store.db
+        """
+        super().__init__(root_paper_path)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS judge ("
+                "paper_id TEXT NOT NULL, "
+                "topic TEXT NOT NULL, "
+                "prompt_hash TEXT NOT NULL, "
+                "model TEXT NOT NULL, "
+                "score REAL NOT NULL, "
+                "created_at TEXT NOT NULL, "
+                "PRIMARY KEY (topic, prompt_hash, model, paper_id))"
+            )
+
+    def get_scores(self, paper_id_list, topic, prompt_hash, model):
+        """
+        批量查询已缓存的打分
+        :param paper_id_list: 论文id列表
+        :param topic: 主题
+        :param prompt_hash: 提示词的哈希
+        :param model: 模型名称
+        :return: paper_id 到分数的字典，只包含已缓存的论文
+        """
+        paper_id_list = list(paper_id_list)
+        score_dict = dict()
+        for i in range(0, len(paper_id_list), 500):
+            batch = paper_id_list[i:i + 500]
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT paper_id, score FROM judge WHERE topic = ? AND prompt_hash = ? AND model = ? "
+                    f"AND paper_id IN ({','.join('?' * len(batch))})", [topic, prompt_hash, model] + batch
+                ).fetchall()
+            score_dict.update(dict(rows))
+        return score_dict
+
+    def put_scores(self, score_dict, topic, prompt_hash, model):
+        """
+        保存打分结果
+        :param score_dict: paper_id 到分数的字典
+        :param topic: 主题
+        :param prompt_hash: 提示词的哈希
+        :param model: 模型名称
+        :return: 无返回
+        """
+        current_time = datetime.datetime.now().isoformat(timespec="seconds")
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO judge (paper_id, topic, prompt_hash, model, score, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(paper_id, topic, prompt_hash, model, score, current_time) for paper_id, score in score_dict.items()]
+            )
+
+    def alias(self, alias_dict):
+        """
+        将已有论文在各主题、提示词与模型下的打分复制给其新版本或重复论文，已有的打分不会被覆盖
+        :param alias_dict: 新paper_id 到已有paper_id 的字典
+        :return: 无返回
+        """
+        current_time = datetime.datetime.now().isoformat(timespec="seconds")
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO judge (paper_id, topic, prompt_hash, model, score, created_at) "
+                "SELECT ?, topic, prompt_hash, model, score, ? FROM judge WHERE paper_id = ?",
+                [(paper_id, current_time, source_id) for paper_id, source_id in alias_dict.items()]
+            )
+
+
+class TokenCountStore(BaseStore):
+    """
+    每篇论文文本的token数缓存，以 (paper_id, 文本的sha256) 为键，
+    先保存本地估计值，调用大模型后替换为接口返回的实际值
+    """
+
+    def __init__(self, root_paper_path):
+        """
+        :param root_paper_path: 论文根目录，数据库文件保存为该目录下的paper_store.db
+        """
+        super().__init__(root_paper_path)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS token_count ("
+                "paper_id TEXT NOT NULL, "
+                "text_hash TEXT NOT NULL, "
+                "tokens INTEGER NOT NULL, "
+                "exact INTEGER NOT NULL, "
+                "created_at TEXT NOT NULL, "
+                "PRIMARY KEY (paper_id, text_hash))"
+            )
+
+    def get(self, paper_id, text_hash):
+        """
+        查询缓存的token数
+        :param paper_id: 论文id
+        :param text_hash: 文本的sha256
+        :return: (token数, 是否为实际值)，不存在时返回None
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT tokens, exact FROM token_count WHERE paper_id = ? AND text_hash = ?",
+                                     (paper_id, text_hash)).fetchone()
+        return (row[0], bool(row[1])) if row else None
+
+    def put(self, paper_id, text_hash, tokens, exact=False):
+        """
+        保存token数，已有实际值时不会被估计值覆盖
+        :param paper_id: 论文id
+        :param text_hash: 文本的sha256
+        :param tokens: token数
+        :param exact: 是否为接口返回的实际值
+        :return: 无返回
+        """
+        current_time = datetime.datetime.now().isoformat(timespec="seconds")
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO token_count (paper_id, text_hash, tokens, exact, created_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (paper_id, text_hash) DO UPDATE SET tokens = excluded.tokens, exact = excluded.exact, "
+                "created_at = excluded.created_at WHERE excluded.exact >= token_count.exact",
+                (paper_id, text_hash, tokens, int(exact), current_time)
+            )
+
+
+class ResponseStore(BaseStore):
+    """
+    大模型的原始回复，每次调用都保存，解析失败时之后的运行可以先修复已保存的回复，不必重新调用
+    """
+
+    def __init__(self, root_paper_path):
+        """
+        :param root_paper_path: 论文根目录，数据库文件保存为该目录下的paper_store.db
+        """
+        super().__init__(root_paper_path)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_response ("
+                "id INTEGER PRIMARY KEY, "
+                "kind TEXT NOT NULL, "
+                "item_key TEXT NOT NULL, "
+                "content TEXT NOT NULL, "
+                "ok INTEGER NOT NULL, "
+                "error TEXT, "
+                "created_at TEXT NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS llm_response_item ON llm_response (kind, item_key, id)")
+
+    def put(self, kind, item_key, content, ok, error=None):
+        """
+        保存一条原始回复
+        :param kind: 回复的类型，例如summary、judge
+        :param item_key: 回复对应的对象，例如paper_id
+        :param content: 原始回复
+        :param ok: 是否解析成功
+        :param error: 解析失败的原因
+        :return: 无返回
+        """
+        current_time = datetime.datetime.now().isoformat(timespec="seconds")
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO llm_response (kind, item_key, content, ok, error, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (kind, item_key, content, int(ok), error, current_time)
+            )
+
+    def latest(self, kind, item_key):
+        """
+        查询最近一次的原始回复
+        :param kind: 回复的类型
+        :param item_key: 回复对应的对象
+        :return: (原始回复, 是否解析成功)，不存在时返回None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content, ok FROM llm_response WHERE kind = ? AND item_key = ? ORDER BY id DESC LIMIT 1",
+                (kind, item_key)).fetchone()
+        return (row[0], bool(row[1])) if row else None
+
+
+class MinHashStore(BaseStore):
+    """
+    论文标题与摘要的MinHash签名及其LSH分桶，用于跨天查找同一论文的其他版本与近似重复的论文
+    """
+
+    def __init__(self, root_paper_path):
+        """
+        :param root_paper_path: 论文根目录，数据库文件保存为该目录下的paper_store.db
+        """
+        super().__init__(root_paper_path)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS minhash ("
+                "paper_id TEXT PRIMARY KEY, "
+                "base_id TEXT NOT NULL, "
+                "signature BLOB NOT NULL, "
+                "created_at TEXT NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS minhash_base_id ON minhash (base_id)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS minhash_band ("
+                "band INTEGER NOT NULL, "
+                "bucket INTEGER NOT NULL, "
+                "paper_id TEXT NOT NULL, "
+                "PRIMARY KEY (band, bucket, paper_id)) WITHOUT ROWID"
+            )
+
+    def get_signatures(self, paper_id_list):
+        """
+        批量查询签名
+        :param paper_id_list: 论文id列表
+        :return: paper_id 到签名字节的字典
+        """
+        paper_id_list = list(paper_id_list)
+        signature_dict = dict()
+        for i in range(0, len(paper_id_list), 500):
+            batch = paper_id_list[i:i + 500]
+            with self._lock:
+                signature_dict.update(self._conn.execute(
+                    f"SELECT paper_id, signature FROM minhash WHERE paper_id IN ({','.join('?' * len(batch))})", batch
+                ).fetchall())
+        return signature_dict
+
+    def find_versions(self, base_id_list):
+        """
+        批量查询同一论文的全部版本
+        :param base_id_list: 不含版本号的论文id列表
+        :return: base_id 到paper_id列表的字典
+        """
+        base_id_list = list(base_id_list)
+        version_dict = dict()
+        for i in range(0, len(base_id_list), 500):
+            batch = base_id_list[i:i + 500]
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT base_id, paper_id FROM minhash WHERE base_id IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+            for base_id, paper_id in rows:
+                version_dict.setdefault(base_id, []).append(paper_id)
+        return version_dict
+
+    def find_buckets(self, bucket_list):
+        """
+        批量查询LSH分桶中的论文
+        :param bucket_list: (band, bucket) 列表
+        :return: (band, bucket) 到paper_id列表的字典
+        """
+        bucket_list = list(bucket_list)
+        bucket_dict = dict()
+        for i in range(0, len(bucket_list), 400):
+            batch = bucket_list[i:i + 400]
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT band, bucket, paper_id FROM minhash_band WHERE (band, bucket) IN "
+                    f"(VALUES {','.join(['(?, ?)'] * len(batch))})", [value for pair in batch for value in pair]
+                ).fetchall()
+            for band, bucket, paper_id in rows:
+                bucket_dict.setdefault((band, bucket), []).append(paper_id)
+        return bucket_dict
+
+    def put_many(self, record_list):
+        """
+        批量保存签名与分桶，已保存的论文会被更新
+        :param record_list: (paper_id, base_id, 签名字节, [(band, bucket)]) 列表
+        :return: 无返回
+        """
+        current_time = datetime.datetime.now().isoformat(timespec="seconds")
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO minhash (paper_id, base_id, signature, created_at) VALUES (?, ?, ?, ?)",
+                [(paper_id, base_id, signature, current_time) for paper_id, base_id, signature, _ in record_list]
+            )
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO minhash_band (band, bucket, paper_id) VALUES (?, ?, ?)",
+                [(band, bucket, paper_id) for paper_id, _, _, bucket_list in record_list
+                 for band, bucket in bucket_list]
+            )
+
+
+class PdfStore(BaseStore):
+    """
+    按内容寻址的pdf存储，pdf按sha256保存在论文根目录的pdf_store目录下，paper_id（含版本号）映射到对应的文件，
+    每日目录中的pdf通过硬链接（不支持时使用符号链接或复制）指向存储中的文件，
+    存储总大小超过上限时按最近使用时间淘汰。仍被每日目录链接的文件删除后不能释放空间，不会被淘汰
+    """
+
+    def __init__(self, root_paper_path, max_bytes=None):
+        """
+        :param root_paper_path: 论文根目录，数据库文件保存为该目录下的paper_store.db
+        :param max_bytes: 存储大小上限（字节），为空时不淘汰
+        """
+        super().__init__(root_paper_path)
+        self.max_bytes = max_bytes
+        self.blob_dir = os.path.join(root_paper_path, "pdf_store")
+        if not os.path.exists(self.blob_dir):
+            os.makedirs(self.blob_dir)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS pdf_blob ("
+                "sha256 TEXT PRIMARY KEY, "
+                "size INTEGER NOT NULL, "
+                "last_access TEXT NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS pdf_paper ("
+                "paper_id TEXT PRIMARY KEY, "
+                "sha256 TEXT NOT NULL)"
+            )
+            # 指向存储中文件的符号链接，硬链接可以从文件的链接数得知，符号链接需要单独记录
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS pdf_symlink ("
+                "link_path TEXT PRIMARY KEY, "
+                "sha256 TEXT NOT NULL)"
+            )
+
+    def _blob_path(self, file_hash):
+        return os.path.join(self.blob_dir, file_hash[:2], file_hash + ".pdf")
+
+    def lookup(self, paper_id):
+        """
+        查询论文在存储中的文件，并更新最近使用时间
+        :param paper_id: 论文id
+        :return: 文件路径，不存在时返回None
+        """
+        current_time = datetime.datetime.now().isoformat(timespec="seconds")
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT sha256 FROM pdf_paper WHERE paper_id = ?", (paper_id,)).fetchone()
+            if row is None:
+                return None
+            blob_path = self._blob_path(row[0])
+            if not os.path.exists(blob_path):
+                # 文件被手动删除时清理记录
+                self._conn.execute("DELETE FROM pdf_paper WHERE sha256 = ?", (row[0],))
+                self._conn.execute("DELETE FROM pdf_blob WHERE sha256 = ?", (row[0],))
+                return None
+            self._conn.execute("UPDATE pdf_blob SET last_access = ? WHERE sha256 = ?", (current_time, row[0]))
+        return blob_path
+
+    def add(self, paper_id, file_path):
+        """
+        将已下载的pdf加入存储，内容相同的文件只保存一份
+        :param paper_id: 论文id
+        :param file_path: pdf路径
+        :return: 存储中的文件路径
+        """
+        file_hash = get_file_hash(file_path)
+        blob_path = self._blob_path(file_hash)
+        if not os.path.exists(blob_path):
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            # 存储中的文件不能是指向每日目录的符号链接
+            link_file(file_path, blob_path, allow_symlink=False)
+
+        current_time = datetime.datetime.now().isoformat(timespec="seconds")
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO pdf_blob (sha256, size, last_access) VALUES (?, ?, ?)",
+                               (file_hash, os.path.getsize(file_path), current_time))
+            self._conn.execute("INSERT OR REPLACE INTO pdf_paper (paper_id, sha256) VALUES (?, ?)",
+                               (paper_id, file_hash))
+        return blob_path
+
+    def link(self, paper_id, file_path):
+        """
+        将存储中的论文链接到指定路径
+        :param paper_id: 论文id
+        :param file_path: 目标路径，例如每日目录下的 <paper_id>.pdf
+        :return: 存储中存在该论文时返回True
+        """
+        blob_path = self.lookup(paper_id)
+        if blob_path is None:
+            return False
+        if link_file(blob_path, file_path) == "symlink":
+            file_hash = os.path.basename(blob_path)[:-len(".pdf")]
+            with self._lock, self._conn:
+                self._conn.execute("INSERT OR REPLACE INTO pdf_symlink (link_path, sha256) VALUES (?, ?)",
+                                   (os.path.abspath(file_path), file_hash))
+        return True
+
+    def _is_linked(self, file_hash):
+        """
+        判断存储中的文件是否仍被每日目录链接，失效的符号链接记录会被清理
+        :param file_hash: 文件的sha256
+        :return: 存在硬链接或有效的符号链接时返回True
+        """
+        blob_path = self._blob_path(file_hash)
+        if os.path.exists(blob_path) and os.stat(blob_path).st_nlink > 1:
+            return True
+        with self._lock:
+            link_path_list = [row[0] for row in self._conn.execute(
+                "SELECT link_path FROM pdf_symlink WHERE sha256 = ?", (file_hash,)).fetchall()]
+        stale_list = []
+        for link_path in link_path_list:
+            if os.path.islink(link_path) and os.path.realpath(link_path) == os.path.realpath(blob_path):
+                return True
+            stale_list.append((link_path,))
+        if stale_list:
+            with self._lock, self._conn:
+                self._conn.executemany("DELETE FROM pdf_symlink WHERE link_path = ?", stale_list)
+        return False
+
+    def total_size(self):
+        """
+        :return: 存储中全部文件的字节数
+        """
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM pdf_blob").fetchone()[0]
+
+    def evict(self, max_bytes=None):
+        """
+        按最近使用时间淘汰文件，直到总大小不超过max_bytes。
+        总大小包括仍被每日目录链接的文件，这些文件删除后不能释放空间，删除符号链接指向的文件会使其失效，因此不会被淘汰
+        :param max_bytes: 存储大小上限（字节），为空时使用创建时设置的上限
+        :return: 淘汰的文件数
+        """
+        max_bytes = max_bytes if max_bytes is not None else self.max_bytes
+        if max_bytes is None:
+            return 0
+        with self._lock:
+            rows = self._conn.execute("SELECT sha256, size FROM pdf_blob ORDER BY last_access ASC").fetchall()
+
+        total_size = sum(size for _, size in rows)
+        evict_list = []
+        for file_hash, size in rows:
+            if total_size <= max_bytes:
+                break
+            if self._is_linked(file_hash):
+                continue
+            evict_list.append(file_hash)
+            total_size -= size
+
+        for file_hash in evict_list:
+            blob_path = self._blob_path(file_hash)
+            if os.path.exists(blob_path):
+                os.remove(blob_path)
+        if evict_list:
+            with self._lock, self._conn:
+                self._conn.executemany("DELETE FROM pdf_paper WHERE sha256 = ?", [(h,) for h in evict_list])
+                self._conn.executemany("DELETE FROM pdf_blob WHERE sha256 = ?", [(h,) for h in evict_list])
+                self._conn.executemany("DELETE FROM pdf_symlink WHERE sha256 = ?", [(h,) for h in evict_list])
+            print_with_timestamp(f"pdf存储超过 {max_bytes / 1024 / 1024:.1f} MB，"
+                                 f"淘汰了 {len(evict_list)} 个最久未使用的文件...")
+        if total_size > max_bytes:
+            print_with_timestamp(f"pdf存储中仍被每日目录链接的文件共 {total_size / 1024 / 1024:.1f} MB，"
+                                 f"超过上限但无法淘汰，可以删除不再需要的每日目录...")
+
+        return len(evict_list)
+
+
+def link_file(source_path, target_path, allow_symlink=True):
+    """
+    优先使用硬链接，文件系统不支持时依次使用符号链接、复制
+    :param source_path: 源文件
+    :param target_path: 目标路径，已存在时会被替换
+    :param allow_symlink: 是否允许使用符号链接
+    :return: 实际使用的方式，"hardlink"、"symlink"或"copy"
+    """
+    tmp_path = target_path + ".link"
+    if os.path.lexists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        os.link(source_path, tmp_path)
+        method = "hardlink"
+    except OSError:
+        try:
+            if not allow_symlink:
+                raise OSError("不允许使用符号链接")
+            os.symlink(os.path.abspath(source_path), tmp_path)
+            method = "symlink"
+        except OSError:
+            shutil.copy2(source_path, tmp_path)
+            method = "copy"
+    os.replace(tmp_path, target_path)
+    return method
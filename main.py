@@ -1,81 +1,27 @@
+import argparse
+import asyncio
 import datetime
+import functools
 import json
-import arxiv
+import queue
+import threading
+
+import openai
 import os
 
-from llm_tool import moonshot_tool
-from llm_tool.gen_tool import print_with_timestamp
+from llm_tool import (moonshot_tool, arxiv_tool, metrics_tool, screen_tool, render_tool, pdf_text_tool,
+                      scheduler_tool, manifest_tool, dedup_tool)
+from llm_tool.file_cache_tool import MoonshotFileCache, get_file_hash
+from llm_tool.gen_tool import print_with_timestamp, retry_with_backoff, estimate_tokens
+from llm_tool.pipeline_tool import (iter_query_paper, fetch_queries, get_topic_paper, save_topic_paper,
+                                    select_candidates, judge_topic, read_judge_ids, get_pdf_store_max_bytes,
+                                    link_existing_pdf, download_with_store, render_and_index)
+from llm_tool.store_tool import JudgeCache, SummaryStore, PdfStore, TokenCountStore, ResponseStore
 
-import schedule
 import time
-import markdown2
-
-
-def get_authors(authors, first_author=False):
-    """
-    用于对文章作者进行处理
-    :param authors: 作者列表
-    :param first_author: 是否只需要第一作者
-    :return: 作者名称
-    """
-    output = str()
-    if not first_author:
-        output = ", ".join(str(author) for author in authors)
-    else:
-        output = authors[0]
-    return output
-
-
-def save_json_file(dir_name, topic_paper):
-    """
-    用于将检索的论文信息保存为json文件
-    :param dir_name: 保存文件的目录
-    :param topic_paper: 论文信息
-    :return: 无返回
-    """
-    # 如果不存在目录就创建
-    if not os.path.exists(dir_name):
-        os.makedirs(dir_name)
-    # 以当前的时间点为文件名称
-    file_name = os.path.join(dir_name, datetime.datetime.now().strftime("%Y%m%d")+".json")
-
-    if not os.path.exists(file_name):
-        with open(file_name, "w") as f:
-            json.dump(topic_paper, f)
 
-        print_with_timestamp(f"保存论文信息文件 {file_name} 完成...")
-    else:
-        print_with_timestamp(f"论文信息文件 {file_name} 已经存在...")
-
-    return file_name
-
-
-def download_paper(judge_result_path, dir_path):
-    """
-    下载论文
-    :param dir_path: 保存论文pdf的路径
-    :param judge_result_path: 论文id的json文件路径
-    :return: 无返回
-    """
-    # 读取json文件
-    with open(judge_result_path, "r") as f:
-        paper_id_dict_list = json.load(f)
-
-    if len(paper_id_dict_list) == 0:
-        raise ValueError("筛选结果为空，没有需要下载的论文...")
-
-    # 获取论文的id
-    paper_id_list = [paper_id_dict["paper_id"] for paper_id_dict in paper_id_dict_list]
-
-    for paper_id in paper_id_list:
-        # 对论文进行检测是否存在
-        if not os.path.exists(os.path.join(dir_path, paper_id+".pdf")):
-            print_with_timestamp(f"开始下载 {paper_id}.pdf...")
-            paper = next(arxiv.Client().results(arxiv.Search(id_list=[paper_id])))
-            paper.download_pdf(filename=paper_id+".pdf", dirpath=dir_path)
-            print_with_timestamp(f"下载 {paper_id}.pdf 完成...")
-        else:
-            print_with_timestamp(f"{paper_id}.pdf 已经存在，无需下载...")
+# 多主题与流式运行没有检查点，不能继续
+RESUME_UNSUPPORTED_MESSAGE = "--resume 只支持单主题、非流式的运行，多主题或流式运行请直接重新运行..."
 
 
 def process_keywords(keywords):
@@ -104,179 +50,42 @@ def process_keywords(keywords):
     return query_list
 
 
-def output_md_and_pdf(paper_data_path, topic, query_list):
-    """
-    用于生成markdown文件和pdf文件
-    :return: none
-    """
-    print_with_timestamp("开始生成markdown文件...")
-
-    # 提取所有论文信息
-    paper_info = moonshot_tool.extract_paper_data(paper_data_path)
-
-    # 总结文件
-    summary_json = paper_data_path.replace(".json", "_summary.json")
-    # md文件
-    md_file = paper_data_path.replace(".json", ".md")
-
-    # 时间
-    current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-    with open(md_file, "w+", encoding='utf-8') as f:
-        pass
-
-    with open(md_file, "a+", encoding='utf-8') as m:
-
-        # 标题
-        m.write("## 论文自动化结果\n")
-        # 更新时间
-        m.write(f"### 更新时间：{current_time}\n\n")
-        # 主题
-        m.write(f"### 主题：{topic}\n")
-        # 关键词
-        for query in query_list:
-            m.write(f"#### 关键词：{query}\n")
-
-        m.write(f"\n\n")
-
-        with open(summary_json, "r", encoding='utf-8') as f:
-            summary_data = json.load(f)
-            # 总论文数量
-            m.write(f"#### 共总结论文数量：{len(summary_data)}\n")
-
-            paper_num = 1
-            # 各论文详细情况
-            for paper_id, paper_summary in summary_data.items():
-                # 在paper_info数组中找到paper_id一致的项
-                current_paper = next((item for item in paper_info if item["paper_id"] == paper_id), None)
-                # print(current_paper)
-
-                if current_paper is None:
-                    continue
-
-                # 论文序号
-                m.write(f"#### 论文序号：{paper_num}\n")
-                # 论文标题
-                m.write(f"**论文标题**：{current_paper['paper_title']}\n\n")
-                # 论文作者
-                m.write(f"**论文作者**：{current_paper['paper_authors']}\n\n")
-                # 论文发表时间
-                m.write(f"**论文发表时间**：{current_paper['paper_published_time']}\n\n")
-                # 论文总结
-                m.write(f"**论文总结**：{paper_summary['summary']}\n\n")
-                # 论文关键点1
-                m.write(f"**论文关键点1**：{paper_summary['keypoints_1']}\n\n")
-                # 论文关键点2
-                m.write(f"**论文关键点2**：{paper_summary['keypoints_2']}\n\n")
-                # 论文地址
-                m.write(f"**论文地址**：{current_paper['paper_entry_id']}")
-                # 空行
-                m.write(f"\n\n")
-
-                paper_num += 1
-
-    with open(md_file, "r", encoding='utf-8') as f:
-        html = markdown2.markdown(f.read())
-
-    # 保存HTML到文件
-    with open(md_file.replace(".md", ".html"), "w", encoding="utf-8") as f:
-        f.write(html)
-
-    print_with_timestamp("生成markdown文件完成...")
-
-
-def get_query_paper(query="", max_results=2):
-    """
-    根据关键词获取论文信息
-    :param query: 关键词
-    :param max_results: 最大数量
-    :return: 检索结果
-    """
-    # 构造客户端
-    client = arxiv.Client()
-
-    # 发送请求，获取论文信息
-    search = arxiv.Search(
-        query=query,
-        max_results=max_results,
-        sort_by=arxiv.SortCriterion.SubmittedDate
-    )
-    results = client.results(search)
-
-    # 存放信息的字典
-    paper_content = dict()
-
-    for result in results:
-
-        paper_title = result.title  # 文章标题
-        paper_entry_id = result.entry_id  # URL
-        paper_authors = get_authors(result.authors)  # 作者
-        """
-        包括了这些类型
-        Computer Science, 
-        Economics, 
-        Electrical Engineering and Systems Science, 
-        Mathematics, 
-        Physics, 
-        Quantitative Biology, 
-        Quantitative Finance, 
-        Statistics
-        """
-        paper_primary_category = result.primary_category  # 所属的主要分类
-        paper_published_time = result.published.date().strftime("%Y-%m-%d")  # 首次出版时间
-        paper_abstract = result.summary.replace('\n', " ")  # 论文的摘要
-
-        # paper的id，用于识别唯一性
-        paper_id = result.get_short_id()
-
-        paper_content[paper_id] = {
-            "paper_id": paper_id,
-            "paper_title": paper_title,
-            "paper_entry_id": paper_entry_id,
-            "paper_authors": paper_authors,
-            "paper_primary_category": paper_primary_category,
-            "paper_published_time": paper_published_time,
-            "paper_abstract": paper_abstract,
-        }
-
-    print_with_timestamp(f"关键词 {query} 检索到 {len(paper_content)} 个结果...")
-
-    return paper_content
-
-
-def get_topic_paper(topic, query_list=None, max_results=2):
-    """
-    根据主题对论文进行检索
-    :param topic: 主题
-    :param query_list: 关键词列表
-    :param max_results: 单关键词最大论文数量
-    :return: 检索结果
-    """
-    # 如果没有提供query，则返回，并报错
-    if query_list is None:
-        raise ValueError("没有提供关键词列表...")
-
-    topic_paper = dict()
-
-    for query in query_list:
-        paper_content = get_query_paper(query, max_results)
-        topic_paper[query.strip('"')] = paper_content
-
-    return {topic: topic_paper}
-
-
 def paper_process(
         topic: str,
         query_list: list,
         max_results_per_query: int,
         judge_number: int,
         root_dir: str,
-        is_free_account=True
+        is_free_account=True,
+        download_workers=4,
+        concurrent_fetch=False,
+        fetch_workers=4,
+        incremental=False,
+        llm_limits=None,
+        prefilter_top_k=None,
+        streaming=False,
+        pdf_store_max_mb=2048,
+        local_extract=None,
+        resume=False
 ):
     """
     论文主函数
+    :param fetch_workers: 并发检索关键词的线程数
+    :param llm_limits: Moonshot AI 的速率限制，可包含rpm、tpm、max_workers，为空时按账户类型取默认值
+    :param prefilter_top_k: 本地BM25预筛选保留的论文数量，为空时不进行预筛选
+    :param streaming: 是否以流式方式执行，见 stream_paper_process
+    :param pdf_store_max_mb: 论文根目录下pdf存储的大小上限（MB），为空时不淘汰
+    :param local_extract: 本地抽取pdf文本的配置，见 pdf_text_tool.get_text_extractor，为空时通过Moonshot AI抽取
+    :param resume: 是否从当天的检查点继续，已完成且输入未变化的阶段不再重复运行，流式模式不支持
     :return: 无返回
     """
+    if streaming:
+        if resume:
+            raise ValueError(RESUME_UNSUPPORTED_MESSAGE)
+        return stream_paper_process(topic, query_list, max_results_per_query, judge_number, root_dir,
+                                    is_free_account=is_free_account, download_workers=download_workers,
+                                    fetch_workers=fetch_workers, incremental=incremental, llm_limits=llm_limits,
+                                    pdf_store_max_mb=pdf_store_max_mb, local_extract=local_extract)
 
     print_with_timestamp('开始执行主题为："' + topic + '"的论文自动化任务')
 
@@ -285,31 +94,582 @@ def paper_process(
         os.makedirs(root_dir)
 
     current_dir = root_dir
+    root_paper_path = os.path.join(current_dir, 'paper')
 
     # 建立当日任务的保存目录
-    daily_dir_name = os.path.join(current_dir, 'paper', datetime.datetime.now().strftime("%Y%m%d"))
+    daily_dir_name = os.path.join(root_paper_path, datetime.datetime.now().strftime("%Y%m%d"))
+
+    # 记录各阶段与各论文的状态，--resume 时跳过已完成的阶段
+    manifest = manifest_tool.RunManifest(daily_dir_name, resume=resume)
+
+    # 记录各阶段的性能，运行结束后写入每日目录
+    metrics = metrics_tool.start_run(daily_dir_name)
+    try:
+        fetch_hash = manifest_tool.get_inputs_hash(topic, query_list, max_results_per_query, incremental)
+        fetch_outputs = manifest.completed_outputs("fetch", fetch_hash)
+        if fetch_outputs and os.path.exists(fetch_outputs["paper_data_path"]):
+            paper_data_path = fetch_outputs["paper_data_path"]
+        else:
+            with manifest.checkpoint("fetch", fetch_hash) as outputs:
+                with metrics.stage("fetch"):
+                    # 增量检索时读取上次运行的水位线
+                    watermark_dict = arxiv_tool.load_watermarks(root_dir) if incremental else None
+
+                    # 获取主题的论文信息
+                    topic_paper = get_topic_paper(topic, query_list, max_results=max_results_per_query,
+                                                  concurrent=concurrent_fetch, max_workers=fetch_workers,
+                                                  watermark_dict=watermark_dict)
+
+                with metrics.stage("save"):
+                    # 保存论文信息，非增量检索时覆盖当天之前的检索结果
+                    paper_data_path = save_topic_paper(daily_dir_name, topic_paper, incremental, root_dir,
+                                                       watermark_dict)
+                outputs["paper_data_path"] = paper_data_path
+
+        # 没有需要处理的论文时直接结束，不再调用大模型
+        paper_info = moonshot_tool.extract_paper_data(paper_data_path)
+        if not paper_info:
+            print_with_timestamp("没有检索到新的论文，本次任务结束...")
+            return
+
+        # 去除重复论文并进行本地预筛选
+        candidate_ids = select_candidates(root_paper_path, paper_data_path, paper_info, topic, query_list,
+                                          prefilter_top_k)
+
+        judge_hash = manifest_tool.get_inputs_hash(get_file_hash(paper_data_path), candidate_ids, judge_number,
+                                                   screen_tool.get_prompt_hash())
+        judge_outputs = manifest.completed_outputs("judge", judge_hash)
+        if judge_outputs and os.path.exists(judge_outputs["judge_result_path"]):
+            judge_result_path = judge_outputs["judge_result_path"]
+        else:
+            with manifest.checkpoint("judge", judge_hash) as outputs, metrics.stage("judge"):
+                # 通过llm选取论文
+                judge_result_path = judge_topic(paper_data_path, topic, max_results_per_query, judge_number,
+                                                root_paper_path, candidate_ids, is_free_account, llm_limits)
+                outputs["judge_result_path"] = judge_result_path
+
+        judge_result_hash = get_file_hash(judge_result_path)
+        with manifest.checkpoint("download", judge_result_hash) as outputs, metrics.stage("download"):
+            # 下载论文
+            judge_id_list = read_judge_ids(judge_result_path)
+            failed_id_list = download_with_store(judge_id_list, daily_dir_name, root_paper_path, pdf_store_max_mb,
+                                                 max_workers=download_workers, paper_info=paper_info)
+            manifest.set_papers([paper_id for paper_id in judge_id_list if paper_id not in failed_id_list],
+                                "download", "done")
+            manifest.set_papers(failed_id_list, "download", "failed")
+            outputs["failed"] = failed_id_list
+
+        with manifest.checkpoint("summary", manifest_tool.get_inputs_hash(judge_result_hash, local_extract)) \
+                as outputs, metrics.stage("summary"):
+            # 对论文进行总结，每篇论文完成后立即保存，中断后重新运行时不会重复总结
+            summary_path = moonshot_tool.summary_paper(judge_result_path=judge_result_path,
+                                                       root_paper_path=root_paper_path,
+                                                       daily_dir=daily_dir_name,
+                                                       is_free_account=is_free_account,
+                                                       local_extract=local_extract,
+                                                       on_result=lambda paper_id, error: manifest.set_paper(
+                                                           paper_id, "summary", "failed" if error else "done",
+                                                           error),
+                                                       **(llm_limits or {}))
+            outputs["summary_path"] = summary_path
+
+        with manifest.checkpoint("render", get_file_hash(summary_path)) as outputs:
+            # 输出md和html，并更新全文索引
+            outputs["md_path"] = render_and_index(root_paper_path, paper_data_path, summary_path, topic, query_list)
+    finally:
+        metrics.finish()
+
+
+def get_topic_dir_name(daily_dir_name, topic):
+    """
+    多主题运行时每个主题的文件保存目录
+    :param daily_dir_name: 每日信息保存目录
+    :param topic: 主题
+    :return: 目录路径
+    """
+    return os.path.join(daily_dir_name, render_tool.get_safe_name(topic))
 
-    # 获取主题的论文信息
-    topic_paper = get_topic_paper(topic, query_list, max_results=max_results_per_query)
 
-    # 保存论文信息
-    paper_data_path = save_json_file(dir_name=daily_dir_name, topic_paper=topic_paper)
+def multi_topic_process(
+        topic_config_list: list,
+        root_dir: str,
+        is_free_account=True,
+        download_workers=4,
+        concurrent_fetch=False,
+        fetch_workers=4,
+        incremental=False,
+        llm_limits=None,
+        prefilter_top_k=None,
+        pdf_store_max_mb=2048,
+        local_extract=None
+):
+    """
+    在一次运行中处理多个主题，相同的关键词只检索一次，多个主题选中的同一篇论文只下载和总结一次，
+    筛选和简报按主题分别进行，每个主题的文件保存在每日目录下以主题命名的子目录中，pdf保存在每日目录中
+    :param topic_config_list: 主题配置列表，每项包含topic、query_list、max_results_per_query、judge_number
+    :param fetch_workers: 并发检索关键词的线程数
+    :param llm_limits: Moonshot AI 的速率限制，可包含rpm、tpm、max_workers，为空时按账户类型取默认值
+    :param prefilter_top_k: 本地BM25预筛选保留的论文数量，为空时不进行预筛选
+    :param pdf_store_max_mb: 论文根目录下pdf存储的大小上限（MB），为空时不淘汰
+    :param local_extract: 本地抽取pdf文本的配置，见 pdf_text_tool.get_text_extractor，为空时通过Moonshot AI抽取
+    :return: 无返回
+    """
+    print_with_timestamp(f"开始执行 {len(topic_config_list)} 个主题的论文自动化任务")
+
+    root_paper_path = os.path.join(root_dir, 'paper')
+    daily_dir_name = os.path.join(root_paper_path, datetime.datetime.now().strftime("%Y%m%d"))
+    if not os.path.exists(daily_dir_name):
+        os.makedirs(daily_dir_name)
+
+    # 多个主题中相同的关键词合并检索，检索数量取各主题的最大值
+    query_max_results_dict = dict()
+    for topic_config in topic_config_list:
+        for query in topic_config["query_list"]:
+            query_max_results_dict[query] = max(query_max_results_dict.get(query, 0),
+                                                topic_config["max_results_per_query"])
+
+    metrics = metrics_tool.start_run(daily_dir_name)
+    try:
+        with metrics.stage("fetch"):
+            watermark_dict = arxiv_tool.load_watermarks(root_dir) if incremental else None
+            query_paper_dict = fetch_queries(query_max_results_dict, concurrent=concurrent_fetch,
+                                             max_workers=fetch_workers, watermark_dict=watermark_dict)
+            print_with_timestamp(f"{len(topic_config_list)} 个主题共 {len(query_paper_dict)} 个不同的关键词...")
+
+        with metrics.stage("save"):
+            topic_data_path_dict = dict()
+            for topic_config in topic_config_list:
+                topic = topic_config["topic"]
+                query_result_dict = dict()
+                for query in topic_config["query_list"]:
+                    paper_content = query_paper_dict[query.strip('"')]
+                    if not incremental:
+                        # 检索结果按提交时间排序，取前max_results_per_query篇即为该主题单独检索的结果
+                        paper_content = dict(list(paper_content.items())[:topic_config["max_results_per_query"]])
+                    query_result_dict[query.strip('"')] = paper_content
+                topic_paper = {topic: arxiv_tool.merge_query_results(query_result_dict)}
+                topic_data_path_dict[topic] = save_topic_paper(get_topic_dir_name(daily_dir_name, topic),
+                                                               topic_paper, incremental)
+
+            # 全部主题的论文信息保存后再推进水位线
+            if incremental:
+                arxiv_tool.save_watermarks(root_dir, watermark_dict)
+
+        # 各主题分别去重、预筛选与筛选
+        topic_judge_path_dict = dict()
+        paper_info_dict = dict()
+        for topic_config in topic_config_list:
+            topic = topic_config["topic"]
+            paper_data_path = topic_data_path_dict[topic]
+            paper_info = moonshot_tool.extract_paper_data(paper_data_path)
+            if not paper_info:
+                print_with_timestamp(f'主题 "{topic}" 没有检索到新的论文...')
+                continue
+            paper_info_dict.update({paper["paper_id"]: paper for paper in paper_info})
+
+            candidate_ids = select_candidates(root_paper_path, paper_data_path, paper_info, topic,
+                                              topic_config["query_list"], prefilter_top_k)
+            with metrics.stage("judge"):
+                topic_judge_path_dict[topic] = judge_topic(paper_data_path, topic,
+                                                           topic_config["max_results_per_query"],
+                                                           topic_config["judge_number"], root_paper_path,
+                                                           candidate_ids, is_free_account, llm_limits)
+
+        # 合并各主题选中的论文，同一篇论文只下载和总结一次
+        selected_id_list = []
+        for judge_result_path in topic_judge_path_dict.values():
+            selected_id_list.extend(read_judge_ids(judge_result_path))
+        selected_id_list = list(dict.fromkeys(selected_id_list))
+        print_with_timestamp(f"各主题共选中 {len(selected_id_list)} 篇不同的论文...")
+
+        if not selected_id_list:
+            return
+
+        with metrics.stage("download"):
+            download_with_store(selected_id_list, daily_dir_name, root_paper_path, pdf_store_max_mb,
+                                max_workers=download_workers, paper_info=list(paper_info_dict.values()))
+
+        with metrics.stage("summary"):
+            summary_dict = moonshot_tool.summarize_papers(selected_id_list, root_paper_path, daily_dir_name,
+                                                          is_free_account=is_free_account,
+                                                          local_extract=local_extract, **(llm_limits or {}))
+
+        for topic_config in topic_config_list:
+            topic = topic_config["topic"]
+            if topic not in topic_judge_path_dict:
+                continue
+            with metrics.stage("save"):
+                summary_path = moonshot_tool.save_summary(topic_judge_path_dict[topic], summary_dict)
+            render_and_index(root_paper_path, topic_data_path_dict[topic], summary_path, topic,
+                             topic_config["query_list"])
+    finally:
+        metrics.finish()
+
+
+def _start_stage_workers(metrics, stage, target, worker_number, next_queue=None, next_worker_number=0):
+    """
+    启动一个流式阶段的工作线程，全部结束后向下一阶段的队列放入结束标记
+    :param metrics: 性能记录
+    :param stage: 阶段名称
+    :param target: 工作线程执行的函数
+    :param worker_number: 工作线程数
+    :param next_queue: 下一阶段的队列
+    :param next_worker_number: 下一阶段的工作线程数，即需要放入的结束标记数量
+    :return: 监视线程
+    """
+    def _worker():
+        metrics.bind_stage(stage)
+        target()
+
+    def _watcher():
+        with metrics.stage(stage):
+            thread_list = [threading.Thread(target=_worker, daemon=True) for _ in range(worker_number)]
+            for thread in thread_list:
+                thread.start()
+            for thread in thread_list:
+                thread.join()
+        for _ in range(next_worker_number):
+            next_queue.put(None)
+
+    watcher = threading.Thread(target=_watcher, daemon=True)
+    watcher.start()
+    return watcher
+
+
+def stream_paper_process(
+        topic: str,
+        query_list: list,
+        max_results_per_query: int,
+        judge_number: int,
+        root_dir: str,
+        is_free_account=True,
+        download_workers=4,
+        fetch_workers=4,
+        incremental=False,
+        llm_limits=None,
+        min_score=7,
+        queue_size=16,
+        token_budget=4000,
+        pdf_store_max_mb=2048,
+        local_extract=None
+):
+    """
+    流式执行的论文主函数，检索到的论文经有界队列依次流入筛选、下载、总结各阶段，各阶段同时进行，
+    队列中的论文数量有上限，pdf与文本不在内存中累积。由于无法在流式处理中取全局前N篇，
+    筛选阶段保留分数不低于min_score的论文，直到达到judge_number篇
+    :param fetch_workers: 同时检索关键词的线程数
+    :param min_score: 筛选保留的最低分数（0-10）
+    :param queue_size: 各阶段之间队列的最大长度
+    :param token_budget: 每批筛选论文的token上限
+    :param pdf_store_max_mb: 论文根目录下pdf存储的大小上限（MB），为空时不淘汰
+    :param local_extract: 本地抽取pdf文本的配置，见 pdf_text_tool.get_text_extractor，为空时通过Moonshot AI抽取
+    :return: 无返回
+    """
+    print_with_timestamp('开始流式执行主题为："' + topic + '"的论文自动化任务')
+
+    root_paper_path = os.path.join(root_dir, 'paper')
+    daily_dir_name = os.path.join(root_paper_path, datetime.datetime.now().strftime("%Y%m%d"))
+    if not os.path.exists(daily_dir_name):
+        os.makedirs(daily_dir_name)
+
+    llm_limits = llm_limits or {}
+    client = moonshot_tool.get_moonshot_client()
+    rate_limiter, summary_workers = moonshot_tool.get_rate_limiter(is_free_account, **llm_limits)
+    model = "moonshot-v1-8k"
+    prompt_hash = screen_tool.get_prompt_hash()
+    judge_cache = JudgeCache(root_paper_path)
+    summary_store = SummaryStore(root_paper_path)
+    file_cache = MoonshotFileCache(root_paper_path)
+    pdf_store = PdfStore(root_paper_path, get_pdf_store_max_bytes(pdf_store_max_mb))
+    text_extractor = pdf_text_tool.get_text_extractor(file_cache, local_extract)
+    token_store = TokenCountStore(root_paper_path)
+    deduplicator = dedup_tool.PaperDeduplicator(root_paper_path)
+    response_store = ResponseStore(root_paper_path)
+
+    # 各阶段之间的有界队列，None为结束标记
+    fetch_queue = queue.Queue(maxsize=queue_size)
+    download_queue = queue.Queue(maxsize=queue_size)
+    summary_queue = queue.Queue(maxsize=queue_size)
+
+    lock = threading.Lock()
+    # 筛选数量已满时停止检索（增量检索时需要完整推进水位线，不提前停止）
+    stop_event = threading.Event()
+    query_result_dict = {query.strip('"'): dict() for query in query_list}
+    paper_dict = dict()
+    accepted_list = []
+    summary_dict = dict()
+
+    watermark_dict = arxiv_tool.load_watermarks(root_dir) if incremental else None
+    arxiv_client = arxiv_tool.get_arxiv_client()
+
+    def fetch_query(query):
+        watermark = watermark_dict.setdefault(query.strip('"'), dict()) if incremental else None
+        number = 0
+        for paper in iter_query_paper(query, max_results_per_query, arxiv_client, watermark):
+            number += 1
+            with lock:
+                # 命中多个关键词的论文只处理一次
+                if paper["paper_id"] in paper_dict:
+                    paper_dict[paper["paper_id"]]["paper_queries"].append(query.strip('"'))
+                    continue
+                paper["paper_queries"] = [query.strip('"')]
+                paper_dict[paper["paper_id"]] = paper
+                query_result_dict[query.strip('"')][paper["paper_id"]] = paper
+            fetch_queue.put(paper)
+            if stop_event.is_set():
+                break
+        print_with_timestamp(f"关键词 {query} 检索到 {number} 个结果...")
+
+    query_queue = queue.Queue()
+    for query in query_list:
+        query_queue.put(query)
+
+    def fetch_worker():
+        while True:
+            try:
+                query = query_queue.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                fetch_query(query)
+            except Exception as e:
+                print_with_timestamp(f"关键词 {query} 检索失败：{e}")
+
+    def judge_batch(batch):
+        try:
+            score_dict = _score_batch(batch)
+        except Exception as e:
+            # 筛选失败时跳过该批次，避免阻塞上游的检索
+            print_with_timestamp(f"{len(batch)} 篇论文筛选失败：{e}")
+            return
+        for record in batch:
+            # 没有得到打分的论文跳过，下次运行时重新打分
+            if record["paper_id"] not in score_dict:
+                continue
+            if len(accepted_list) < judge_number and score_dict[record["paper_id"]] >= min_score:
+                accepted_list.append({"paper_id": record["paper_id"], "score": score_dict[record["paper_id"]]})
+                download_queue.put(paper_dict[record["paper_id"]])
+        if len(accepted_list) >= judge_number and not incremental:
+            stop_event.set()
+
+    def _score_batch(batch):
+        score_dict = judge_cache.get_scores([record["paper_id"] for record in batch], topic, prompt_hash, model)
+        metrics_tool.get_metrics().record(cache_hits=len(score_dict))
+        uncached_batch = [record for record in batch if record["paper_id"] not in score_dict]
+        if uncached_batch:
+            new_score_dict = retry_with_backoff(
+                lambda: screen_tool.score_batch(client, model, uncached_batch, rate_limiter, response_store),
+                exceptions=(openai.RateLimitError, openai.APIConnectionError),
+                on_retry=lambda: metrics_tool.get_metrics().record(retries=1))
+            judge_cache.put_scores(new_score_dict, topic, prompt_hash, model)
+            score_dict.update(new_score_dict)
+        return score_dict
+
+    def judge_worker():
+        batch = []
+        batch_tokens = 0
+        finished = False
+        try:
+            while True:
+                try:
+                    # 队列暂时为空时先筛选已积累的论文，避免等待
+                    paper = fetch_queue.get(timeout=1)
+                except queue.Empty:
+                    if batch:
+                        judge_batch(batch)
+                        batch, batch_tokens = [], 0
+                    continue
+                if paper is None:
+                    finished = True
+                    break
+                if len(accepted_list) >= judge_number:
+                    continue
+                try:
+                    # 跳过重复论文，之前处理过的论文复用打分与总结
+                    if not deduplicator.filter([paper]):
+                        continue
+                    record = screen_tool.build_screen_record(paper)
+                    record_tokens = estimate_tokens(json.dumps(record, ensure_ascii=False))
+                except Exception as e:
+                    # 单篇论文出错时跳过，筛选线程是检索队列唯一的消费者，不能因此退出
+                    print_with_timestamp(f"论文 {paper.get('paper_id')} 筛选前的处理失败：{e}")
+                    continue
+                if batch and batch_tokens + record_tokens > token_budget:
+                    judge_batch(batch)
+                    batch, batch_tokens = [], 0
+                batch.append(record)
+                batch_tokens += record_tokens
+            if batch and len(accepted_list) < judge_number:
+                judge_batch(batch)
+        finally:
+            if not finished:
+                # 筛选线程意外退出时排空检索队列直到结束标记，避免检索线程阻塞在已满的队列上，
+                # 增量检索时需要完整推进水位线，不提前停止
+                print_with_timestamp("筛选线程意外退出，其余检索到的论文本次不再筛选...")
+                if not incremental:
+                    stop_event.set()
+                while fetch_queue.get() is not None:
+                    pass
+
+    def download_worker():
+        while True:
+            paper = download_queue.get()
+            if paper is None:
+                break
+            paper_id = paper["paper_id"]
+            pdf_path = os.path.join(daily_dir_name, paper_id + ".pdf")
+            try:
+                if not link_existing_pdf(paper_id, pdf_path, pdf_store):
+                    pdf_url = paper.get("paper_pdf_url") or arxiv_tool.resolve_pdf_urls([paper_id])[paper_id]
+                    arxiv_tool.PDF_RATE_LIMITER.wait()
+                    start = time.perf_counter()
+                    size = arxiv_tool.download_pdf(pdf_url, pdf_path, rate_limiter=None)
+                    metrics_tool.get_metrics().record(paper_id=paper_id, http_calls=1, bytes=size,
+                                                      wall_time=time.perf_counter() - start)
+                    pdf_store.add(paper_id, pdf_path)
+                    print_with_timestamp(f"下载 {paper_id}.pdf 完成...")
+            except Exception as e:
+                print_with_timestamp(f"下载 {paper_id}.pdf 失败：{e}")
+                continue
+            summary_queue.put(paper_id)
+
+    def summary_worker():
+        while True:
+            paper_id = summary_queue.get()
+            if paper_id is None:
+                break
+            summary_content = summary_store.get(paper_id)
+            if summary_content is not None:
+                print_with_timestamp(f"论文 {paper_id} 已总结，从本地文件中拉取...")
+                metrics_tool.get_metrics().record(paper_id=paper_id, cache_hits=1)
+            else:
+                try:
+                    summary_content = moonshot_tool.summarize_with_retry(client, daily_dir_name, paper_id,
+                                                                         rate_limiter, file_cache,
+                                                                         text_extractor=text_extractor,
+                                                                         token_store=token_store,
+                                                                         response_store=response_store)
+                except Exception as e:
+                    print_with_timestamp(f"论文 {paper_id} 总结失败：{e}")
+                    continue
+                summary_store.put(paper_id, summary_content)
+                print_with_timestamp(f"论文 {paper_id} 总结完成...")
+            with lock:
+                summary_dict[paper_id] = summary_content
+
+    metrics = metrics_tool.start_run(daily_dir_name)
+    try:
+        watcher_list = [
+            _start_stage_workers(metrics, "fetch", fetch_worker, min(fetch_workers, len(query_list)), fetch_queue, 1),
+            _start_stage_workers(metrics, "judge", judge_worker, 1, download_queue, download_workers),
+            _start_stage_workers(metrics, "download", download_worker, download_workers, summary_queue,
+                                 summary_workers),
+            _start_stage_workers(metrics, "summary", summary_worker, summary_workers),
+        ]
+        for watcher in watcher_list:
+            watcher.join()
+
+        with metrics.stage("save"):
+            # 保存论文信息、筛选结果与总结
+            paper_data_path = save_topic_paper(daily_dir_name, {topic: query_result_dict}, incremental, root_dir,
+                                               watermark_dict)
+            judge_result_path = moonshot_tool.update_judge_results(paper_data_path, accepted_list)
+            summary_path = moonshot_tool.save_summary(judge_result_path, summary_dict)
+            print_with_timestamp(f"流式处理完成，共检索 {len(paper_dict)} 篇论文，保留 {len(accepted_list)} 篇，"
+                                 f"总结 {len(summary_dict)} 篇...")
+
+        # 输出md和html，并更新全文索引
+        render_and_index(root_paper_path, paper_data_path, summary_path, topic, query_list)
+    finally:
+        pdf_store.evict()
+        judge_cache.close()
+        summary_store.close()
+        pdf_store.close()
+        token_store.close()
+        deduplicator.close()
+        response_store.close()
+        if text_extractor is not None:
+            text_extractor.close()
+        metrics.finish()
+
+
+def load_config(config_path):
+    """
+    读取配置文件，并设置大模型接口的环境变量
+    :param config_path: 配置文件路径
+    :return: 配置字典
+    """
+    with open(config_path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+
+    os.environ["KIMI_API_KEY"] = config["api_key"]
+    os.environ["KIMI_BASE_URL"] = "https://api.moonshot.cn/v1"
+    return config
 
-    # 通过llm选取论文
-    judge_result_path = moonshot_tool.judge_paper(paper_data_path=paper_data_path, paper_number=max_results_per_query,
-                                                  judge_number=judge_number, llm="moonshot")
 
-    # 下载论文
-    download_paper(judge_result_path=judge_result_path, dir_path=daily_dir_name)
+def is_resumable(config):
+    """
+    只有单主题、非流式的运行记录检查点，可以从中断的地方继续
+    :param config: 配置字典
+    :return: 是否支持 --resume
+    """
+    return not config.get("topics") and not config.get("streaming", False)
 
-    # 对论文进行总结
-    moonshot_tool.summary_paper(judge_result_path=judge_result_path,
-                                root_paper_path=os.path.join(current_dir, 'paper'),
-                                daily_dir=daily_dir_name,
-                                is_free_account=is_free_account)
 
-    # 输出md和html
-    output_md_and_pdf(paper_data_path, topic, query_list)
+def run_task(config, resume=False):
+    """
+    按配置运行一次完整的任务，定时任务、--resume 与界面上的立即运行共用
+    :param config: 配置字典，见 load_config
+    :param resume: 是否从当天的检查点继续，只支持单主题、非流式模式
+    :return: 无返回
+    """
+    if resume and not is_resumable(config):
+        raise ValueError(RESUME_UNSUPPORTED_MESSAGE)
+
+    # 配置了多个主题时在一次运行中处理全部主题
+    if config.get("topics"):
+        multi_topic_process(
+            topic_config_list=[{
+                "topic": topic_config["topic"],
+                "query_list": process_keywords(topic_config["keyword"]),
+                "max_results_per_query": topic_config.get("max_results_per_query",
+                                                          config.get("max_results_per_query")),
+                "judge_number": topic_config.get("judge_number", config.get("judge_number")),
+            } for topic_config in config["topics"]],
+            root_dir=config["root_dir"],
+            is_free_account=config["is_free_account"],
+            download_workers=config.get("download_workers", 4),
+            concurrent_fetch=config.get("concurrent_fetch", False),
+            fetch_workers=config.get("fetch_workers", 4),
+            incremental=config.get("incremental", False),
+            llm_limits=config.get("llm_limits"),
+            prefilter_top_k=config.get("prefilter_top_k"),
+            pdf_store_max_mb=config.get("pdf_store_max_mb", 2048),
+            local_extract=config.get("local_extract")
+        )
+    else:
+        paper_process(
+            topic=config["topic"],
+            query_list=process_keywords(config["keyword"]) if "keyword" in config else [],
+            max_results_per_query=config["max_results_per_query"],
+            judge_number=config["judge_number"],
+            root_dir=config["root_dir"],
+            is_free_account=config["is_free_account"],
+            download_workers=config.get("download_workers", 4),
+            concurrent_fetch=config.get("concurrent_fetch", False),
+            fetch_workers=config.get("fetch_workers", 4),
+            incremental=config.get("incremental", False),
+            llm_limits=config.get("llm_limits"),
+            prefilter_top_k=config.get("prefilter_top_k"),
+            streaming=config.get("streaming", False),
+            pdf_store_max_mb=config.get("pdf_store_max_mb", 2048),
+            local_extract=config.get("local_extract"),
+            resume=resume
+        )
+
+    # 按配置更新周报或月报
+    for period in config.get("digest_periods", []):
+        render_tool.render_digest(os.path.join(config["root_dir"], 'paper'), period)
 
 
 if __name__ == '__main__':
@@ -344,57 +704,37 @@ if __name__ == '__main__':
     # moonshot_tool.summary_paper(judge_result_path=judge_result_path, root_paper_path=os.path.join(current_dir, 'paper'),
     #                             daily_dir=daily_dir_name)
 
+    parser = argparse.ArgumentParser(description="论文自动化任务")
+    parser.add_argument("--resume", action="store_true", help="从当天的检查点继续运行一次后退出，不启动定时任务")
+    args = parser.parse_args()
+
     print_with_timestamp("任务启动...")
     # 读取配置文件
     config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.json')
 
-    with open(config_path, 'r', encoding='utf-8') as f:
-        config = json.load(f)
-
-    # 执行主函数
-    os.environ["KIMI_API_KEY"] = config["api_key"]
-    os.environ["KIMI_BASE_URL"] = "https://api.moonshot.cn/v1"
+    config = load_config(config_path)
+
+    # 从中断的地方继续当天的任务，与定时任务共用运行锁
+    if args.resume:
+        if not is_resumable(config):
+            print_with_timestamp(RESUME_UNSUPPORTED_MESSAGE)
+            raise SystemExit(1)
+        if not os.path.exists(config["root_dir"]):
+            os.makedirs(config["root_dir"])
+        run_lock = scheduler_tool.RunLock(os.path.join(config["root_dir"], "scheduler.lock"))
+        if not run_lock.acquire():
+            print_with_timestamp("已有任务正在运行，无法继续...")
+        else:
+            try:
+                run_task(config, resume=True)
+            finally:
+                run_lock.release()
+        raise SystemExit
 
-    # 中文到英文的周几映射
-    weekday_mapping = {
-        "周一": "mon",
-        "周二": "tue",
-        "周三": "wed",
-        "周四": "thu",
-        "周五": "fri",
-        "周六": "sat",
-        "周日": "sun"
-    }
-
-    # 对关键词进行处理
-    query_list = process_keywords(config["keyword"])
-
-    # 定义定时任务函数
-    def schedule_task(chinese_weekdays, hour, minute):
-        # 将中文周几列表转换为英文缩写列表
-        weekdays = [weekday_mapping[wd] for wd in chinese_weekdays]
-
-        # 创建定时任务
-        for day in weekdays:
-            schedule.every().day.at(f"{hour}:{minute}").do(
-                lambda: paper_process(
-                    topic=config["topic"],
-                    query_list=query_list,
-                    max_results_per_query=config["max_results_per_query"],
-                    judge_number=config["judge_number"],
-                    root_dir=config["root_dir"],
-                    is_free_account=config["is_free_account"]
-                )
-            ).tag(day)
-
-
-    # 提早20分钟触发任务
-    schedule_task(config["selected_days"], config["daily_time"][0], config["daily_time"][1])
+    # 提早20分钟触发任务，在选择的周几按时运行，错过的运行会补运行，同一时间只运行一个任务
+    daemon = scheduler_tool.ScheduleDaemon(functools.partial(run_task, config), config["selected_days"],
+                                           config["daily_time"][0], config["daily_time"][1],
+                                           state_dir=config["root_dir"])
 
     # 持续运行直到手动停止
-    while True:
-        # 检查定时任务是否需要执行
-        schedule.run_pending()
-        time.sleep(10)  # 每隔60秒检查一次
-        print_with_timestamp("任务运行中...")
-
+    asyncio.run(daemon.run())
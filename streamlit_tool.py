@@ -1,10 +1,30 @@
 import datetime
-import subprocess
+import time
 
+import pandas as pd
 import streamlit as st
+import streamlit.components.v1 as components
 import os
 import json
 
+import main
+from llm_tool import search_tool, job_tool, history_tool
+
+# 配置文件路径，与保存配置文件时一致
+CONFIG_PATH = 'config.json'
+
+# 历史统计的时间范围（天），0表示全部
+HISTORY_PERIODS = [30, 90, 365, 0]
+
+# 运行状态的显示名称
+JOB_STATUS_LABELS = {
+    job_tool.JOB_PENDING: '等待中',
+    job_tool.JOB_RUNNING: '运行中',
+    job_tool.JOB_DONE: '已完成',
+    job_tool.JOB_FAILED: '失败',
+    job_tool.JOB_SKIPPED: '已跳过',
+}
+
 # 设置页面标题
 st.title("论文自动化工具")
 st.info("受版权限制，目前本工具仅支持Arxiv")
@@ -40,67 +60,71 @@ st.sidebar.write('运行时间为：', daily_time)
 
 # endregion
 
-# region 创建主题
-st.subheader('创建主题')
+# 任务配置与论文检索分为两个标签页
+config_tab, status_tab, history_tab, search_tab = st.tabs(["任务配置", "运行状态", "历史统计", "论文检索"])
 
-topic = st.text_input('请输入主题', '')
+with config_tab:
+    # region 创建主题
+    st.subheader('创建主题')
 
-keyword_number = st.session_state['keyword_number'] if 'keyword_number' in st.session_state else 1
-# 增加关键词组合的容器
-if st.button('添加关键词组合'):
-    if keyword_number < 2:
-        keyword_number += 1
-        st.session_state['keyword_number'] = keyword_number
-    else:
-        st.toast('关键词组合数量不能超过2个', icon="⚠️")
-
-# 关键词类型
-keyword_type = ['全域', '标题', '作者', '摘要']
-# 创建关键词组合
-keyword = dict()
-for i in range(keyword_number):
-    with st.container(border=True):
-        st.markdown("**关键词组合%d**" % (i+1))
-        cols = st.columns(4)
-        for j, col in enumerate(cols):
-            keyword[f"k-{i}-{j}"] = col.text_input(f'{keyword_type[j]}', '', key=f'k-{i}-{j}')
-# endregion
-# print(keyword)
-
-# region 参数设置
-st.subheader('参数设置')
-
-max_results_per_query = st.number_input(
-    label='论文检索数量',
-    min_value=1,
-    max_value=20,
-    value=1,
-    step=1,
-    help='设置每个关键词的检索数量，不建议设置过大，容易被封ip',
-)
-
-judge_number = st.number_input(
-    label='经大模型筛选后保留的论文数量',
-    min_value=1,
-    max_value=5,
-    value=1,
-    step=1,
-    help='这一数量不能大于最大论文检索数量',
-)
-
-if judge_number:
-    pass
-# endregion
+    topic = st.text_input('请输入主题', '')
 
+    keyword_number = st.session_state['keyword_number'] if 'keyword_number' in st.session_state else 1
+    # 增加关键词组合的容器
+    if st.button('添加关键词组合'):
+        if keyword_number < 2:
+            keyword_number += 1
+            st.session_state['keyword_number'] = keyword_number
+        else:
+            st.toast('关键词组合数量不能超过2个', icon="⚠️")
+
+    # 关键词类型
+    keyword_type = ['全域', '标题', '作者', '摘要']
+    # 创建关键词组合
+    keyword = dict()
+    for i in range(keyword_number):
+        with st.container(border=True):
+            st.markdown("**关键词组合%d**" % (i+1))
+            cols = st.columns(4)
+            for j, col in enumerate(cols):
+                keyword[f"k-{i}-{j}"] = col.text_input(f'{keyword_type[j]}', '', key=f'k-{i}-{j}')
+    # endregion
+    # print(keyword)
+
+    # region 参数设置
+    st.subheader('参数设置')
+
+    max_results_per_query = st.number_input(
+        label='论文检索数量',
+        min_value=1,
+        max_value=20,
+        value=1,
+        step=1,
+        help='设置每个关键词的检索数量，不建议设置过大，容易被封ip',
+    )
+
+    judge_number = st.number_input(
+        label='经大模型筛选后保留的论文数量',
+        min_value=1,
+        max_value=5,
+        value=1,
+        step=1,
+        help='这一数量不能大于最大论文检索数量',
+    )
+
+    if judge_number:
+        pass
+    # endregion
 
-# 设置页面标题
-st.subheader("文件保存路径")
 
-# 默认文件保存路径
-default_file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "paper")
+    # 设置页面标题
+    st.subheader("文件保存路径")
 
-# 输入文件保存路径
-root_dir = st.text_input("请输入文件保存路径", value=default_file_path, help="输入文件保存路径")
+    # 默认文件保存路径
+    default_file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "paper")
+
+    # 输入文件保存路径
+    root_dir = st.text_input("请输入文件保存路径", value=default_file_path, help="输入文件保存路径")
 
 # 保存配置文件
 if st.sidebar.button('保存配置文件', use_container_width=True):
@@ -125,11 +149,250 @@ if st.sidebar.button('保存配置文件', use_container_width=True):
     with open('config.json', 'w', encoding='utf-8') as f:
         json.dump(config, f, ensure_ascii=False, indent=4)
     st.toast('配置文件已保存', icon="✅")
-# 添加侧边栏中的运行按钮
-if st.sidebar.button('运行定时任务', use_container_width=True, type="primary"):
-    if not os.path.exists('./config.json'):
+
+
+@st.cache_resource
+def get_job_manager(state_dir):
+    """
+    每个保存路径只创建一个任务管理器，所有页面共用，页面刷新与重复点击不会启动新的任务
+    :param state_dir: 文件保存路径
+    :return: JobManager
+    """
+    return job_tool.JobManager(state_dir)
+
+
+def load_job_config():
+    """
+    读取已保存的配置文件，与当前的保存路径不一致时提示重新保存
+    :return: 配置字典，无法运行时返回None
+    """
+    if not os.path.exists(CONFIG_PATH):
         st.toast('请先保存配置文件', icon="⚠️")
+        return None
+    config = main.load_config(CONFIG_PATH)
+    if os.path.abspath(config['root_dir']) != os.path.abspath(root_dir):
+        st.toast('配置文件中的保存路径与当前不一致，请先保存配置文件', icon="⚠️")
+        return None
+    return config
+
+
+job_manager = get_job_manager(os.path.abspath(root_dir))
+
+# 添加侧边栏中的运行按钮
+if st.sidebar.button('立即运行', use_container_width=True, type="primary", help='在后台运行一次任务，已有任务在运行时不会重复运行'):
+    job_config = load_job_config()
+    if job_config is not None:
+        if job_manager.run_now(main.run_task, job_config):
+            st.toast('任务已开始运行，可在运行状态中查看进度', icon="✅")
+        else:
+            st.toast('已有任务正在运行', icon="⚠️")
+
+if not job_manager.is_scheduling():
+    if st.sidebar.button('启动定时任务', use_container_width=True):
+        job_config = load_job_config()
+        if job_config is not None:
+            if not job_config.get('selected_days'):
+                st.toast('请先选择运行的频率并保存配置文件', icon="⚠️")
+            elif job_manager.start_scheduler(main.run_task, job_config):
+                st.toast('定时任务已启动', icon="✅")
+elif st.sidebar.button('停止定时任务', use_container_width=True, help='正在运行的任务会继续运行到结束'):
+    job_manager.stop_scheduler()
+    st.toast('定时任务将在当前任务结束后停止', icon="✅")
+
+@st.cache_resource
+def get_search_index(root_paper_path):
+    """
+    每个论文根目录只打开一次索引，页面刷新时复用同一个数据库连接
+    :param root_paper_path: 论文根目录
+    :return: SearchIndex
+    """
+    return search_tool.SearchIndex(root_paper_path)
+
+
+@st.cache_data(show_spinner=False, max_entries=5000)
+def load_day_history(root_paper_path, day, mtime):
+    """
+    读取一天的简报统计与运行记录，按每日目录的修改时间缓存，页面刷新时只重新读取有变化的日期
+    :param root_paper_path: 论文根目录
+    :param day: 日期
+    :param mtime: 每日目录的修改时间，只用于缓存失效
+    :return: 见 history_tool.load_day
+    """
+    return history_tool.load_day(root_paper_path, day)
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def load_report_html(html_path, mtime):
+    """
+    :param html_path: 简报html文件路径
+    :param mtime: 文件的修改时间，只用于缓存失效
+    :return: html内容
+    """
+    with open(html_path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+root_paper_path = os.path.join(root_dir, 'paper')
+
+# region 运行状态
+with status_tab:
+    job_status = job_manager.status()
+    scheduler_status = job_status['scheduler']
+
+    st.subheader('定时任务')
+    scheduler_cols = st.columns(3)
+    scheduler_cols[0].metric('状态', '已启动' if scheduler_status['running'] else '未启动')
+    scheduler_cols[1].metric('下次运行', scheduler_status['next_run'].strftime('%m-%d %H:%M')
+                             if scheduler_status['next_run'] else '-')
+    scheduler_cols[2].metric('最近一次计划运行', scheduler_status['last_run'].strftime('%m-%d %H:%M')
+                             if scheduler_status['last_run'] else '-')
+    if scheduler_status['error']:
+        st.error(f"定时任务异常退出：{scheduler_status['error']}")
+
+    st.subheader('最近一次运行')
+    job_run = job_status['run']
+    if job_run is None:
+        st.info('本次启动后还没有运行过任务，点击侧边栏的立即运行开始')
     else:
-        st.sidebar.success('开始执行...')
-        subprocess.Popen(["python", "main.py"])
+        started_at = job_run['started_at'].strftime('%Y-%m-%d %H:%M:%S') if job_run['started_at'] else '-'
+        st.caption(f"{job_run['trigger']}运行 · {JOB_STATUS_LABELS[job_run['status']]} · 开始于 {started_at} · "
+                   f"用时 {job_run['wall_time']:.1f} 秒")
+        if job_run['error']:
+            st.error(job_run['error'])
+
+        stage_dict = job_run['stage_dict']
+        total_cols = st.columns(3)
+        total_cols[0].metric('输入tokens', sum(stage['prompt_tokens'] for stage in stage_dict.values()))
+        total_cols[1].metric('输出tokens', sum(stage['completion_tokens'] for stage in stage_dict.values()))
+        total_cols[2].metric('HTTP请求', sum(stage['http_calls'] for stage in stage_dict.values()))
+        if stage_dict:
+            st.dataframe([{
+                '阶段': name,
+                '状态': JOB_STATUS_LABELS[stage['status']],
+                '用时（秒）': round(stage['wall_time'], 1),
+                '论文数': stage['papers'],
+                'HTTP请求': stage['http_calls'],
+                '输入tokens': stage['prompt_tokens'],
+                '输出tokens': stage['completion_tokens'],
+                '重试': stage['retries'],
+                '缓存命中': stage['cache_hits'],
+            } for name, stage in stage_dict.items()], hide_index=True, use_container_width=True)
+
+    auto_refresh = st.checkbox('运行时自动刷新', value=True, help='任务运行时每2秒刷新一次页面')
+# endregion
+
+# region 历史统计
+with history_tab:
+    st.subheader('历史统计')
+
+    day_mtime_dict = history_tool.list_days(root_paper_path)
+    if not day_mtime_dict:
+        st.info('保存路径下还没有运行记录，运行任务后即可查看')
+    else:
+        history_period = st.selectbox('统计范围', HISTORY_PERIODS,
+                                      format_func=lambda days: f'最近{days}天' if days else '全部')
+        start_day = (datetime.date.today() - datetime.timedelta(days=history_period - 1)).strftime('%Y%m%d') \
+            if history_period else ''
+        day_history_list = [load_day_history(root_paper_path, day, mtime) for day, mtime in day_mtime_dict.items()
+                            if day >= start_day]
+
+        day_row_list = []
+        run_row_list = []
+        stage_row_list = []
+        report_list = []
+        for day_history in day_history_list:
+            day_label = f"{day_history['day'][:4]}-{day_history['day'][4:6]}-{day_history['day'][6:]}"
+            # 没有筛选结果的简报（例如运行中断）不计入通过率
+            judged_list = [report for report in day_history['reports'] if report['accepted'] is not None]
+            day_row_list.append({
+                '日期': day_label,
+                '检索论文': sum(report['papers'] for report in day_history['reports']),
+                '筛选论文': sum(report['papers'] for report in judged_list),
+                '选中论文': sum(report['accepted'] for report in judged_list),
+            })
+            for run in day_history['runs']:
+                run_label = f"{day_label} {run['run_id'][8:10]}:{run['run_id'][10:12]}:{run['run_id'][12:14]}"
+                run_row_list.append({
+                    '运行': run_label,
+                    '用时（秒）': round(run['wall_time'], 1),
+                    'HTTP请求': run['http_calls'],
+                    '输入tokens': run['prompt_tokens'],
+                    '输出tokens': run['completion_tokens'],
+                    '费用（元）': round(run['cost'], 4),
+                })
+                stage_row_list.append(dict({'运行': run_label},
+                                           **{stage: round(wall_time, 1) for stage, wall_time
+                                              in run['stage_dict'].items()}))
+            report_list.extend((day_label, report) for report in day_history['reports'] if report['html_path'])
+
+        day_df = pd.DataFrame(day_row_list).set_index('日期')
+        day_df['未选中论文'] = day_df['检索论文'] - day_df['选中论文']
+        day_df['筛选通过率'] = (day_df['选中论文'] / day_df['筛选论文'].where(day_df['筛选论文'] > 0)).round(3)
+        run_df = pd.DataFrame(run_row_list, columns=['运行', '用时（秒）', 'HTTP请求', '输入tokens', '输出tokens',
+                                                     '费用（元）']).set_index('运行')
+
+        total_cols = st.columns(4)
+        total_cols[0].metric('检索论文', int(day_df['检索论文'].sum()))
+        total_cols[1].metric('筛选通过率', f"{day_df['选中论文'].sum() / day_df['筛选论文'].sum():.1%}"
+                             if day_df['筛选论文'].sum() else '-')
+        total_cols[2].metric('tokens', int(run_df['输入tokens'].sum() + run_df['输出tokens'].sum()))
+        total_cols[3].metric('费用（元）', f"{run_df['费用（元）'].sum():.2f}",
+                             help='按各模型的价格估算，较早的运行没有记录模型，按moonshot-v1-8k计算')
+
+        st.markdown('**每日论文数**')
+        st.bar_chart(day_df[['选中论文', '未选中论文']])
+        st.markdown('**筛选通过率**')
+        st.line_chart(day_df['筛选通过率'])
+        if not run_df.empty:
+            st.markdown('**每次运行的tokens与费用**')
+            st.bar_chart(run_df[['输入tokens', '输出tokens']])
+            st.markdown('**每次运行的阶段用时（秒）**')
+            st.bar_chart(pd.DataFrame(stage_row_list).set_index('运行').fillna(0))
+            with st.expander('运行记录'):
+                st.dataframe(run_df, use_container_width=True)
+
+        st.markdown('**历史简报**')
+        if not report_list:
+            st.info('统计范围内没有生成的简报')
+        else:
+            report_index = st.selectbox('选择简报', range(len(report_list) - 1, -1, -1),
+                                        format_func=lambda i: f"{report_list[i][0]} {report_list[i][1]['topic']}")
+            html_path = report_list[report_index][1]['html_path']
+            components.html(load_report_html(html_path, os.path.getmtime(html_path)), height=600, scrolling=True)
+# endregion
+
+# region 论文检索
+with search_tab:
+    st.subheader('论文检索')
+
+    if not os.path.exists(root_paper_path):
+        st.info('保存路径下还没有论文，运行任务后即可检索')
+    else:
+        search_index = get_search_index(root_paper_path)
+        search_cols = st.columns([4, 1])
+        search_query = search_cols[0].text_input('检索词', '', placeholder='标题、作者、摘要或总结中的词，多个检索词以空格分隔',
+                                                 label_visibility='collapsed')
+        if search_cols[1].button('重建索引', use_container_width=True, help='从已保存的每日目录重新建立索引'):
+            search_tool.rebuild_index(search_index, root_paper_path)
+            st.toast('索引已重建', icon="✅")
+        st.caption(f'已索引 {search_index.count()} 篇论文')
+
+        if search_query:
+            start_time = time.perf_counter()
+            search_result_list = search_index.search(search_query, limit=50)
+            st.caption(f'找到 {len(search_result_list)} 篇论文，用时 {(time.perf_counter() - start_time) * 1000:.1f} 毫秒')
+            for search_result in search_result_list:
+                with st.container(border=True):
+                    st.markdown(f"**[{search_result['title']}]({search_result['entry_id']})**")
+                    st.caption(f"{search_result['authors']} · 发表于 {search_result['published']} · "
+                               f"主题：{search_result['topic']} · 首次检索：{search_result['first_seen']}")
+                    st.markdown(search_result['snippet'])
+                    if search_result['summary']:
+                        with st.expander('论文总结'):
+                            st.write(search_result['summary'])
+# endregion
 
+# 任务运行时定时刷新，显示最新的进度
+if auto_refresh and job_manager.is_running():
+    time.sleep(2)
+    st.rerun()
@@ -0,0 +1,247 @@
+import datetime
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+from llm_tool.arxiv_tool import (advance_watermark, compare_watermark, download_papers, download_pdf, get_base_id,
+                                 get_paper_version, load_watermarks, merge_query_results, resolve_pdf_urls,
+                                 save_watermarks)
+
+PDF_CONTENT = b"%PDF-1.4\n" + bytes(range(256)) * 40
+
+NOON = datetime.datetime(2024, 1, 3, 12, 0, tzinfo=datetime.timezone.utc)
+
+
+def make_result(paper_id, published=NOON):
+    """
+    构造只包含水位线所需字段的arxiv检索结果替身
+    """
+    return SimpleNamespace(published=published, get_short_id=lambda: paper_id)
+
+
+def test_paper_version_and_base_id():
+    assert get_paper_version("2404.01234v2") == "v2"
+    assert get_paper_version("2404.01234") is None
+    assert get_base_id("2404.01234v12") == "2404.01234"
+    assert get_base_id("2404.01234") == "2404.01234"
+
+
+def test_compare_watermark_treats_empty_watermark_as_first_run():
+    assert compare_watermark(make_result("2401.00001v1"), None) == "new"
+    assert compare_watermark(make_result("2401.00001v1"), dict()) == "new"
+
+
+@pytest.mark.parametrize("result, expected", [
+    (make_result("2401.00009v1", NOON + datetime.timedelta(seconds=1)), "new"),
+    (make_result("2401.00009v1", NOON - datetime.timedelta(seconds=1)), "older"),
+    # 同一时刻按不含版本号的id判断是否见过
+    (make_result("2401.00001v2"), "seen"),
+    (make_result("2401.00002v1"), "new"),
+])
+def test_compare_watermark(result, expected):
+    watermark = {"published": NOON.isoformat(), "paper_ids": ["2401.00001"]}
+    assert compare_watermark(result, watermark) == expected
+
+
+def test_advance_watermark_moves_forward_and_collects_ties():
+    watermark = dict()
+    advance_watermark(watermark, make_result("2401.00001v1"))
+    assert watermark == {"published": NOON.isoformat(), "paper_ids": ["2401.00001"]}
+
+    # 同一时刻的论文追加，重复版本不追加，更早的论文不影响水位线
+    advance_watermark(watermark, make_result("2401.00002v1"))
+    advance_watermark(watermark, make_result("2401.00001v2"))
+    advance_watermark(watermark, make_result("2401.00003v1", NOON - datetime.timedelta(days=1)))
+    assert watermark == {"published": NOON.isoformat(), "paper_ids": ["2401.00001", "2401.00002"]}
+
+    later = NOON + datetime.timedelta(hours=1)
+    advance_watermark(watermark, make_result("2401.00004v1", later))
+    assert watermark == {"published": later.isoformat(), "paper_ids": ["2401.00004"]}
+
+
+def test_watermark_round_trip(tmp_path):
+    root_dir = str(tmp_path)
+    assert load_watermarks(root_dir) == dict()
+    watermark = dict()
+    advance_watermark(watermark, make_result("2401.00001v1"))
+    save_watermarks(root_dir, {"绿色建筑": watermark})
+
+    watermark_dict = load_watermarks(root_dir)
+    assert watermark_dict == {"绿色建筑": watermark}
+    assert compare_watermark(make_result("2401.00001v1"), watermark_dict["绿色建筑"]) == "seen"
+    assert not (tmp_path / "watermark.json.tmp").exists()
+
+
+def test_merge_query_results_keeps_first_query_and_records_all_hits():
+    query_result_dict = {
+        "carbon": {"1": {"paper_id": "1"}, "2": {"paper_id": "2"}},
+        "building": {"2": {"paper_id": "2"}, "3": {"paper_id": "3"}},
+        "energy": {"2": {"paper_id": "2"}},
+    }
+    merged_dict = merge_query_results(query_result_dict)
+    assert {query: list(paper_content) for query, paper_content in merged_dict.items()} == \
+           {"carbon": ["1", "2"], "building": ["3"], "energy": []}
+    assert merged_dict["carbon"]["2"]["paper_queries"] == ["carbon", "building", "energy"]
+    assert merged_dict["building"]["3"]["paper_queries"] == ["building"]
+    # 不修改传入的检索结果
+    assert "paper_queries" not in query_result_dict["carbon"]["2"]
+
+
+class RecordingClient:
+    """
+    记录每次查询的arxiv客户端替身
+    """
+
+    def __init__(self, result_list):
+        self.result_list = result_list
+        self.search_list = []
+
+    def results(self, search):
+        self.search_list.append(search)
+        return iter(self.result_list)
+
+
+def make_pdf_result(paper_id, pdf_url):
+    return SimpleNamespace(get_short_id=lambda: paper_id, pdf_url=pdf_url)
+
+
+def test_resolve_pdf_urls_reuses_saved_urls_and_batches_the_rest():
+    paper_info = [{"paper_id": "2401.00001v1", "paper_pdf_url": "http://saved/1"},
+                  {"paper_id": "2401.00002v1", "paper_pdf_url": None}]
+    client = RecordingClient([make_pdf_result("2401.00002v1", "http://arxiv/2"),
+                              make_pdf_result("2401.00003v2", "http://arxiv/3")])
+    pdf_url_dict = resolve_pdf_urls(["2401.00001v1", "2401.00002v1", "2401.00003", "2401.00004"], paper_info, client)
+
+    # 未带版本号的id匹配返回结果中的最新版本，arXiv上找不到的论文不在结果中
+    assert pdf_url_dict == {"2401.00001v1": "http://saved/1", "2401.00002v1": "http://arxiv/2",
+                            "2401.00003": "http://arxiv/3"}
+    assert [search.id_list for search in client.search_list] == [["2401.00002v1", "2401.00003", "2401.00004"]]
+
+
+def test_resolve_pdf_urls_skips_the_api_when_every_url_is_saved():
+    client = RecordingClient([])
+    assert resolve_pdf_urls(["1"], [{"paper_id": "1", "paper_pdf_url": "http://saved/1"}], client) == \
+           {"1": "http://saved/1"}
+    assert client.search_list == []
+
+
+class PdfHandler(BaseHTTPRequestHandler):
+    """
+    支持Range请求的pdf服务，记录每次请求的Range
+    """
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        range_header = self.headers.get("Range")
+        self.server.range_list.append(range_header)
+        if self.path == "/missing.pdf":
+            self._send(404, b"")
+            return
+        if self.path == "/always_416.pdf":
+            self._send(416, b"")
+            return
+        match = re.match(r"bytes=(\d+)-", range_header or "")
+        if match and self.server.support_range:
+            offset = int(match.group(1))
+            if offset >= len(PDF_CONTENT):
+                self._send(416, b"")
+                return
+            self._send(206, PDF_CONTENT[offset:],
+                       {"Content-Range": f"bytes {offset}-{len(PDF_CONTENT) - 1}/{len(PDF_CONTENT)}"})
+        else:
+            self._send(200, PDF_CONTENT)
+
+
+@pytest.fixture
+def pdf_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), PdfHandler)
+    server.daemon_threads = True
+    server.range_list = []
+    server.support_range = True
+    server.base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def read_bytes(file_path):
+    with open(file_path, "rb") as f:
+        return f.read()
+
+
+def write_part(file_path, content):
+    with open(file_path + ".part", "wb") as f:
+        f.write(content)
+
+
+def test_download_pdf_writes_the_file_atomically(tmp_path, pdf_server):
+    file_path = str(tmp_path / "paper.pdf")
+    assert download_pdf(pdf_server.base_url + "/paper.pdf", file_path, rate_limiter=None) == len(PDF_CONTENT)
+    assert read_bytes(file_path) == PDF_CONTENT
+    assert not os.path.exists(file_path + ".part")
+    assert pdf_server.range_list == [None]
+
+
+def test_download_pdf_resumes_from_a_partial_file(tmp_path, pdf_server):
+    file_path = str(tmp_path / "paper.pdf")
+    write_part(file_path, PDF_CONTENT[:1000])
+    assert download_pdf(pdf_server.base_url + "/paper.pdf", file_path, rate_limiter=None) == len(PDF_CONTENT) - 1000
+    assert read_bytes(file_path) == PDF_CONTENT
+    assert pdf_server.range_list == ["bytes=1000-"]
+
+
+def test_download_pdf_restarts_when_the_server_ignores_range(tmp_path, pdf_server):
+    pdf_server.support_range = False
+    file_path = str(tmp_path / "paper.pdf")
+    write_part(file_path, b"stale")
+    download_pdf(pdf_server.base_url + "/paper.pdf", file_path, rate_limiter=None)
+    assert read_bytes(file_path) == PDF_CONTENT
+
+
+def test_download_pdf_restarts_once_on_416(tmp_path, pdf_server):
+    file_path = str(tmp_path / "paper.pdf")
+    # .part已经完整时续传位置超出文件长度
+    write_part(file_path, PDF_CONTENT)
+    assert download_pdf(pdf_server.base_url + "/paper.pdf", file_path, rate_limiter=None) == len(PDF_CONTENT)
+    assert read_bytes(file_path) == PDF_CONTENT
+    assert pdf_server.range_list == [f"bytes={len(PDF_CONTENT)}-", None]
+
+
+def test_download_pdf_does_not_loop_when_the_server_keeps_answering_416(tmp_path, pdf_server):
+    file_path = str(tmp_path / "paper.pdf")
+    write_part(file_path, PDF_CONTENT[:10])
+    with pytest.raises(requests.HTTPError):
+        download_pdf(pdf_server.base_url + "/always_416.pdf", file_path, rate_limiter=None)
+    assert pdf_server.range_list == ["bytes=10-", None]
+
+    # 没有.part时416按普通的错误处理
+    pdf_server.range_list.clear()
+    with pytest.raises(requests.HTTPError):
+        download_pdf(pdf_server.base_url + "/always_416.pdf", file_path, rate_limiter=None)
+    assert pdf_server.range_list == [None]
+    assert not os.path.exists(file_path)
+
+
+def test_download_papers_reports_failures_per_paper(tmp_path, pdf_server):
+    failed_list = download_papers({"ok": pdf_server.base_url + "/paper.pdf",
+                                   "missing": pdf_server.base_url + "/missing.pdf"},
+                                  str(tmp_path / "day"), max_workers=2, rate_limiter=None)
+    assert failed_list == ["missing"]
+    assert read_bytes(str(tmp_path / "day" / "ok.pdf")) == PDF_CONTENT
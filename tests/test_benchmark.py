@@ -0,0 +1,59 @@
+import sys
+
+import arxiv
+import pytest
+import requests
+
+from benchmark import run_benchmark
+from benchmark.fake_server import FakeConfig, get_paper_id, get_query_indexes, start_fake_server
+from llm_tool import arxiv_tool
+
+
+@pytest.fixture
+def benchmark_args(monkeypatch):
+    """
+    零延迟的测试参数，run_workload 修改的全局设置在测试结束后恢复
+    """
+    monkeypatch.setattr(arxiv.Client, "query_url_format", arxiv.Client.query_url_format)
+    monkeypatch.setenv("KIMI_API_KEY", "test")
+    monkeypatch.setenv("KIMI_BASE_URL", "http://127.0.0.1")
+    monkeypatch.setattr(arxiv_tool.API_RATE_LIMITER, "min_interval", arxiv_tool.API_RATE_LIMITER.min_interval)
+    monkeypatch.setattr(arxiv_tool.PDF_RATE_LIMITER, "min_interval", arxiv_tool.PDF_RATE_LIMITER.min_interval)
+    monkeypatch.setattr(sys, "argv", ["run_benchmark.py", "--queries", "2", "--pdf-size", "2048",
+                                      "--arxiv-latency", "0", "--pdf-latency", "0", "--llm-latency", "0",
+                                      "--files-latency", "0", "--judge-ratio", "0.2"])
+    return run_benchmark.parse_args()
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_run_workload_reports_every_stage(benchmark_args, capsys, streaming):
+    benchmark_args.streaming = streaming
+    result = run_benchmark.run_workload(benchmark_args, 10)
+    assert (result["paper_number"], result["judge_number"]) == (10, 2)
+    assert {"fetch", "judge", "download", "summary", "render", "index"} <= set(result["stages"])
+    assert result["stages"]["download"]["bytes"] >= 2 * 2048
+
+    capsys.readouterr()
+    run_benchmark.print_report([result])
+    line_list = capsys.readouterr().out.splitlines()
+    assert line_list[0].split()[:3] == ["papers", "total(s)", "fetch(s)"]
+    assert line_list[2].split()[0] == "10"
+
+
+def test_fake_server_pages_queries_and_serves_ranges():
+    config = FakeConfig(paper_number=10, query_number=2, overlap=0.2, pdf_size=100)
+    # 相邻关键词的结果有重叠
+    assert get_query_indexes(config, 0) == [0, 1, 2, 3, 4]
+    assert get_query_indexes(config, 1) == [4, 5, 6, 7, 8]
+
+    server = start_fake_server(config)
+    try:
+        pdf_url = f"{server.base_url}/pdf/{get_paper_id(3)}"
+        content = requests.get(pdf_url).content
+        assert content.startswith(b"%PDF-") and len(content) >= 100
+        response = requests.get(pdf_url, headers={"Range": "bytes=40-"})
+        assert (response.status_code, response.content) == (206, content[40:])
+        assert requests.get(pdf_url, headers={"Range": f"bytes={len(content)}-"}).status_code == 416
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,110 @@
+import numpy as np
+import pytest
+
+from llm_tool import dedup_tool
+from llm_tool.dedup_tool import (MINHASH_PERMUTATIONS, PaperDeduplicator, compute_signatures, dedup_papers,
+                                 estimate_similarity, get_buckets, get_shingles)
+from llm_tool.store_tool import JudgeCache, SummaryStore
+
+ABSTRACT = ("We propose a carbon accounting framework for green buildings that combines life cycle assessment "
+            "with operational energy monitoring, and evaluate it on twelve office buildings in three climate zones.")
+
+
+def make_paper(paper_id, title="Carbon accounting for green buildings", abstract=ABSTRACT):
+    return {"paper_id": paper_id, "paper_title": title, "paper_abstract": abstract}
+
+
+def test_get_shingles_splits_words_and_chinese_characters():
+    assert len(get_shingles({"paper_title": "a b c d"})) == 2
+    assert len(get_shingles({"paper_title": "绿色建筑"})) == 2
+    assert get_shingles({"paper_title": "", "paper_abstract": ""}) == set()
+    # 不足3个词时整体作为一个分片
+    assert len(get_shingles({"paper_title": "green building"})) == 1
+
+
+def test_get_shingles_ignores_case_and_punctuation():
+    assert get_shingles({"paper_title": "Green, Building: Design!"}) == \
+           get_shingles({"paper_title": "green building design"})
+
+
+def test_compute_signatures_is_deterministic_and_independent_of_chunking(monkeypatch):
+    shingle_set_list = [get_shingles(make_paper(str(i), abstract=ABSTRACT + f" variant {i}")) for i in range(5)]
+    shingle_set_list.insert(2, set())
+    signatures = compute_signatures(shingle_set_list)
+    assert signatures.shape == (6, MINHASH_PERMUTATIONS)
+    assert signatures.dtype == np.uint32
+
+    # 每块只放一篇论文时结果相同
+    monkeypatch.setattr(dedup_tool, "MINHASH_CHUNK_SHINGLES", 1)
+    assert (compute_signatures(shingle_set_list) == signatures).all()
+
+
+def test_estimate_similarity_tracks_jaccard():
+    signatures = compute_signatures([get_shingles(make_paper("1")), get_shingles(make_paper("2")),
+                                     get_shingles(make_paper("3", title="Deep learning for protein folding",
+                                                             abstract="An unrelated abstract about proteins."))])
+    assert estimate_similarity(signatures[0], signatures[1]) == 1.0
+    assert estimate_similarity(signatures[0], signatures[2]) < 0.2
+    assert get_buckets(signatures[0]) == get_buckets(signatures[1])
+
+
+@pytest.fixture
+def root_paper_path(tmp_path):
+    return str(tmp_path)
+
+
+def test_filter_drops_other_versions_and_near_duplicates_within_a_run(root_paper_path):
+    paper_list = [
+        make_paper("2401.00001v1"),
+        make_paper("2401.00001v2", abstract=ABSTRACT + " Revised."),
+        make_paper("2401.00002v1", title="Carbon accounting for green buildings."),
+        make_paper("2401.00003v1", title="Deep learning for protein folding", abstract="Proteins fold."),
+    ]
+    kept_list = dedup_papers(root_paper_path, paper_list)
+    assert [paper["paper_id"] for paper in kept_list] == ["2401.00001v1", "2401.00003v1"]
+
+
+def test_filter_keeps_papers_without_text(root_paper_path):
+    paper_list = [make_paper("1", title="", abstract=""), make_paper("2", title="", abstract="")]
+    assert dedup_papers(root_paper_path, paper_list) == paper_list
+
+
+def test_new_version_reuses_previous_summary_and_score(root_paper_path):
+    dedup_papers(root_paper_path, [make_paper("2401.00001v1")])
+    summary_store = SummaryStore(root_paper_path)
+    judge_cache = JudgeCache(root_paper_path)
+    try:
+        summary_store.put("2401.00001v1", {"summary": "总结", "keypoints_1": "", "keypoints_2": ""})
+        judge_cache.put_scores({"2401.00001v1": 9.0}, "topic", "hash", "model")
+
+        kept_list = dedup_papers(root_paper_path, [make_paper("2401.00001v2")])
+        assert [paper["paper_id"] for paper in kept_list] == ["2401.00001v2"]
+        assert summary_store.get("2401.00001v2")["summary"] == "总结"
+        assert judge_cache.get_scores(["2401.00001v2"], "topic", "hash", "model") == {"2401.00001v2": 9.0}
+    finally:
+        summary_store.close()
+        judge_cache.close()
+
+
+def test_materially_changed_version_is_judged_again(root_paper_path):
+    dedup_papers(root_paper_path, [make_paper("2401.00001v1")])
+    summary_store = SummaryStore(root_paper_path)
+    try:
+        summary_store.put("2401.00001v1", {"summary": "总结", "keypoints_1": "", "keypoints_2": ""})
+        kept_list = dedup_papers(root_paper_path, [make_paper(
+            "2401.00001v2", title="A new title entirely",
+            abstract="The revised paper studies concrete recycling with a different method and new data.")])
+        assert [paper["paper_id"] for paper in kept_list] == ["2401.00001v2"]
+        assert summary_store.get("2401.00001v2") is None
+    finally:
+        summary_store.close()
+
+
+def test_deduplicator_remembers_papers_across_filter_calls(root_paper_path):
+    # 流式运行中论文逐批进入
+    deduplicator = PaperDeduplicator(root_paper_path)
+    try:
+        assert deduplicator.filter([make_paper("2401.00001v1")])
+        assert deduplicator.filter([make_paper("2401.00009v1", title="Carbon accounting for green buildings!")]) == []
+    finally:
+        deduplicator.close()
@@ -0,0 +1,102 @@
+import json
+import os
+import uuid
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+from llm_tool.file_cache_tool import MoonshotFileCache, get_file_hash
+
+
+class FakeFiles:
+    """
+    记录每次调用的 files 接口替身，抽取的文本为 "text of <文件名>"
+    """
+
+    def __init__(self):
+        self.files = self
+        self.file_dict = dict()
+        self.call_list = []
+
+    def list(self):
+        self.call_list.append("list")
+        return SimpleNamespace(data=list(self.file_dict.values()))
+
+    def create(self, file, purpose):
+        self.call_list.append("create")
+        file_object = SimpleNamespace(id=uuid.uuid4().hex, filename=os.path.basename(str(file)))
+        self.file_dict[file_object.id] = file_object
+        return file_object
+
+    def content(self, file_id):
+        self.call_list.append("content")
+        if file_id not in self.file_dict:
+            request = httpx.Request("GET", f"https://api.moonshot.cn/v1/files/{file_id}/content")
+            raise openai.NotFoundError("file not found", response=httpx.Response(404, request=request), body=None)
+        return SimpleNamespace(text="text of " + self.file_dict[file_id].filename)
+
+
+@pytest.fixture
+def client():
+    return FakeFiles()
+
+
+def write_pdf(dir_path, paper_id, content=b"%PDF-1"):
+    file_path = os.path.join(dir_path, paper_id + ".pdf")
+    with open(file_path, "wb") as f:
+        f.write(content)
+    return file_path
+
+
+def test_text_is_extracted_once_and_then_served_from_the_local_cache(tmp_path, client):
+    pdf_path = write_pdf(str(tmp_path), "2401.00001v1")
+    file_cache = MoonshotFileCache(str(tmp_path))
+    assert file_cache.get_text(client, pdf_path, "2401.00001v1") == "text of 2401.00001v1.pdf"
+    assert client.call_list == ["list", "create", "content"]
+
+    # 同一次运行与之后的运行都不再访问云端
+    assert file_cache.get_text(client, pdf_path, "2401.00001v1") == "text of 2401.00001v1.pdf"
+    assert MoonshotFileCache(str(tmp_path)).get_text(client, pdf_path, "2401.00001v1") == "text of 2401.00001v1.pdf"
+    assert client.call_list == ["list", "create", "content"]
+
+    with open(os.path.join(str(tmp_path), "moonshot_files.json"), "r", encoding="utf-8") as f:
+        assert json.load(f)["2401.00001v1"]["sha256"] == get_file_hash(pdf_path)
+
+
+def test_files_uploaded_by_an_older_version_are_reused(tmp_path, client):
+    uploaded = client.create(tmp_path / "2401.00001v1.pdf", "file-extract")
+    client.call_list.clear()
+    file_cache = MoonshotFileCache(str(tmp_path))
+
+    pdf_path = write_pdf(str(tmp_path), "2401.00001v1")
+    assert file_cache.get_text(client, pdf_path, "2401.00001v1") == "text of 2401.00001v1.pdf"
+    other_path = write_pdf(str(tmp_path), "2401.00002v1", b"%PDF-2")
+    file_cache.get_text(client, other_path, "2401.00002v1")
+
+    # 每次运行只对账一次，已上传的文件直接读取内容
+    assert client.call_list == ["list", "content", "create", "content"]
+    assert file_cache.manifest["2401.00001v1"]["file_id"] == uploaded.id
+
+
+def test_files_deleted_in_the_cloud_or_changed_locally_are_uploaded_again(tmp_path, client):
+    pdf_path = write_pdf(str(tmp_path), "2401.00001v1")
+    MoonshotFileCache(str(tmp_path)).get_text(client, pdf_path, "2401.00001v1")
+    first_file_id = next(iter(client.file_dict))
+
+    # 云端文件被删除，对账时移除本地记录
+    client.file_dict.clear()
+    for file_name in os.listdir(os.path.join(str(tmp_path), "text_cache")):
+        os.remove(os.path.join(str(tmp_path), "text_cache", file_name))
+    client.call_list.clear()
+    file_cache = MoonshotFileCache(str(tmp_path))
+    file_cache.get_text(client, pdf_path, "2401.00001v1")
+    assert client.call_list == ["list", "create", "content"]
+    assert file_cache.manifest["2401.00001v1"]["file_id"] != first_file_id
+
+    # 同一paper_id的pdf内容变化时不复用旧文件
+    write_pdf(str(tmp_path), "2401.00001v1", b"%PDF-changed")
+    client.call_list.clear()
+    file_cache.get_text(client, pdf_path, "2401.00001v1")
+    assert client.call_list == ["create", "content"]
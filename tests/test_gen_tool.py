@@ -0,0 +1,92 @@
+import threading
+import time
+
+import pytest
+
+from llm_tool import gen_tool
+from llm_tool.gen_tool import RateLimiter, TokenBucket, estimate_tokens, retry_with_backoff
+
+
+def run_threads(target, number):
+    thread_list = [threading.Thread(target=target) for _ in range(number)]
+    for thread in thread_list:
+        thread.start()
+    for thread in thread_list:
+        thread.join()
+
+
+def test_rate_limiter_spaces_requests_across_threads():
+    rate_limiter = RateLimiter(min_interval=0.1)
+    time_list = []
+    lock = threading.Lock()
+
+    def _request():
+        rate_limiter.wait()
+        with lock:
+            time_list.append(time.monotonic())
+
+    run_threads(_request, 5)
+    time_list.sort()
+    # 第一次请求不等待，之后每次间隔不小于min_interval
+    assert all(later - earlier >= 0.09 for earlier, later in zip(time_list, time_list[1:]))
+    assert time_list[-1] - time_list[0] < 1.0
+
+
+def test_token_bucket_allows_a_burst_then_refills_at_the_given_rate():
+    token_bucket = TokenBucket(capacity=10, refill_per_second=50)
+    start = time.monotonic()
+    token_bucket.acquire(10)
+    assert time.monotonic() - start < 0.05
+
+    # 桶已空，再取10个令牌需要等待约0.2秒
+    token_bucket.acquire(10)
+    assert 0.15 <= time.monotonic() - start < 0.6
+
+
+def test_token_bucket_caps_oversized_requests_at_its_capacity():
+    token_bucket = TokenBucket(capacity=5, refill_per_second=1000)
+    start = time.monotonic()
+    token_bucket.acquire(100)
+    assert time.monotonic() - start < 0.05
+
+
+def test_token_bucket_limits_total_throughput_across_threads():
+    token_bucket = TokenBucket(capacity=4, refill_per_second=40)
+    start = time.monotonic()
+    run_threads(lambda: [token_bucket.acquire(1) for _ in range(3)], 4)
+    # 12个令牌中4个来自初始容量，其余8个按每秒40个补充
+    assert time.monotonic() - start >= 0.18
+
+
+def test_retry_with_backoff_retries_only_the_given_exceptions(monkeypatch):
+    monkeypatch.setattr(gen_tool.time, "sleep", lambda seconds: None)
+    call_list = []
+    retry_list = []
+
+    def _flaky():
+        call_list.append(1)
+        if len(call_list) < 3:
+            raise ConnectionError("断开")
+        return "ok"
+
+    assert retry_with_backoff(_flaky, exceptions=(ConnectionError,), on_retry=lambda: retry_list.append(1)) == "ok"
+    assert (len(call_list), len(retry_list)) == (3, 2)
+
+    with pytest.raises(ValueError):
+        retry_with_backoff(lambda: int("x"), exceptions=(ConnectionError,))
+
+    def _broken():
+        call_list.append(1)
+        raise ConnectionError("断开")
+
+    # 达到最大重试次数后抛出最后一次的异常
+    call_list.clear()
+    with pytest.raises(ConnectionError):
+        retry_with_backoff(_broken, exceptions=(ConnectionError,), max_retries=2)
+    assert len(call_list) == 3
+
+
+def test_estimate_tokens_counts_chinese_characters_individually():
+    assert estimate_tokens("") == 1
+    assert estimate_tokens("abcdefgh") == 3
+    assert estimate_tokens("绿色建筑") == 5
@@ -0,0 +1,74 @@
+import json
+import os
+
+from llm_tool import history_tool
+
+
+def write_json(file_path, data):
+    with open(file_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+
+
+def write_topic_day(dir_path, day, topic, paper_id_list, judge_id_list, summary_id_list):
+    os.makedirs(dir_path, exist_ok=True)
+    write_json(os.path.join(dir_path, day + ".json"),
+               {topic: {"all:bench0": {paper_id: {"paper_id": paper_id} for paper_id in paper_id_list}}})
+    write_json(os.path.join(dir_path, day + "_judge_result.json"),
+               [{"paper_id": paper_id, "score": 1.0} for paper_id in judge_id_list])
+    write_json(os.path.join(dir_path, day + "_summary.json"), {paper_id: {} for paper_id in summary_id_list})
+
+
+def test_list_days_skips_other_directories_and_ignores_pdf_changes(tmp_path):
+    day_dir = tmp_path / "20240105"
+    day_dir.mkdir()
+    (tmp_path / "digest").mkdir()
+    (tmp_path / "paper_store.db").write_bytes(b"")
+    summary_path = day_dir / "20240105_summary.json"
+    summary_path.write_text("{}")
+    os.utime(str(day_dir), (1000, 1000))
+    os.utime(str(summary_path), (2000, 2000))
+    assert history_tool.list_days(str(tmp_path)) == {"20240105": 2000}
+
+    # 下载pdf不会使缓存失效，更新总结会
+    pdf_path = day_dir / "2401.00001v1.pdf"
+    pdf_path.write_bytes(b"%PDF-")
+    os.utime(str(pdf_path), (3000, 3000))
+    os.utime(str(day_dir), (1000, 1000))
+    assert history_tool.list_days(str(tmp_path)) == {"20240105": 2000}
+    os.utime(str(summary_path), (4000, 4000))
+    assert history_tool.list_days(str(tmp_path)) == {"20240105": 4000}
+    assert history_tool.list_days(str(tmp_path / "missing")) == {}
+
+
+def test_load_runs_sums_tokens_and_handles_interrupted_runs(tmp_path):
+    metrics_path = str(tmp_path / "20240105_metrics.jsonl")
+    event_list = [
+        {"run_id": "a", "type": "stage_end", "stage": "fetch", "wall_time": 1.5},
+        {"run_id": "a", "type": "paper", "stage": "summary", "model": "moonshot-v1-32k", "http_calls": 1,
+         "prompt_tokens": 900000, "completion_tokens": 100000},
+        {"run_id": "a", "type": "run_summary", "wall_time": 10.0},
+        {"run_id": "b", "type": "stage_end", "stage": "fetch", "wall_time": 1.0},
+        {"run_id": "b", "type": "stage_end", "stage": "fetch", "wall_time": 0.5},
+        {"run_id": "b", "type": "stage_counter", "stage": "judge", "prompt_tokens": 1000000},
+    ]
+    with open(metrics_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(json.dumps(event) for event in event_list) + '\n{"run_id": "b", "ty')
+
+    run_a, run_b = history_tool.load_runs(metrics_path)
+    assert (run_a["wall_time"], run_a["http_calls"], run_a["cost"]) == (10.0, 1, 24.0)
+    # 没有汇总记录的运行按阶段用时计算，没有模型的调用按最小模型计费
+    assert (run_b["wall_time"], run_b["stage_dict"], run_b["cost"]) == (1.5, {"fetch": 1.5}, 12.0)
+
+
+def test_load_day_reads_single_and_multi_topic_reports(tmp_path):
+    day_dir = str(tmp_path / "20240105")
+    write_topic_day(day_dir, "20240105", "绿色建筑", ["p1", "p2", "p3"], ["p1", "p2"], ["p1"])
+    write_topic_day(os.path.join(day_dir, "low_carbon"), "20240105", "低碳", ["p4"], ["p4"], ["p4"])
+    (tmp_path / "20240105" / "low_carbon" / "20240105.html").write_text("<p></p>")
+
+    day = history_tool.load_day(str(tmp_path), "20240105")
+    assert day["runs"] == []
+    assert [(report["topic"], report["papers"], report["accepted"], report["summarized"])
+            for report in day["reports"]] == [("绿色建筑", 3, 2, 1), ("低碳", 1, 1, 1)]
+    assert day["reports"][0]["html_path"] is None
+    assert day["reports"][1]["html_path"] == os.path.join(day_dir, "low_carbon", "20240105.html")
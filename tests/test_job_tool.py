@@ -0,0 +1,92 @@
+import os
+import threading
+import time
+
+import pytest
+
+from llm_tool import metrics_tool
+from llm_tool.job_tool import JOB_DONE, JOB_FAILED, JobManager
+from llm_tool.scheduler_tool import RunLock
+
+
+def wait_until_idle(job_manager, timeout=10):
+    deadline = time.monotonic() + timeout
+    while job_manager.is_running():
+        assert time.monotonic() < deadline, "任务没有结束"
+        time.sleep(0.02)
+    return job_manager.status()["run"]
+
+
+@pytest.fixture
+def state_dir(tmp_path):
+    return str(tmp_path)
+
+
+def make_config(state_dir, topic):
+    return {"root_dir": state_dir, "topic": topic, "selected_days": ["周一"], "daily_time": ["09", "00"]}
+
+
+def test_run_now_uses_the_given_config_while_the_scheduler_runs(state_dir):
+    job_manager = JobManager(state_dir)
+    topic_list = []
+    assert job_manager.start_scheduler(lambda config: topic_list.append(config["topic"]),
+                                       make_config(state_dir, "启动时的主题"))
+    try:
+        assert job_manager.run_now(lambda config: topic_list.append(config["topic"]),
+                                   make_config(state_dir, "修改后的主题"))
+        assert wait_until_idle(job_manager)["status"] == JOB_DONE
+        assert topic_list == ["修改后的主题"]
+        # 手动运行不记录为计划运行
+        assert job_manager.status()["scheduler"]["last_run"] is None
+        assert job_manager.status()["scheduler"]["running"]
+    finally:
+        job_manager.stop_scheduler()
+
+
+def test_run_now_rejects_a_second_run(state_dir):
+    job_manager = JobManager(state_dir)
+    release = threading.Event()
+    assert job_manager.run_now(lambda config: release.wait(10), make_config(state_dir, "t"))
+    try:
+        assert not job_manager.run_now(lambda config: None, make_config(state_dir, "t"))
+    finally:
+        release.set()
+    assert wait_until_idle(job_manager)["status"] == JOB_DONE
+
+
+def test_run_now_rejects_while_another_process_holds_the_lock(state_dir):
+    job_manager = JobManager(state_dir)
+    other_lock = RunLock(os.path.join(state_dir, "scheduler.lock"))
+    assert other_lock.acquire()
+    try:
+        assert not job_manager.run_now(lambda config: None, make_config(state_dir, "t"))
+        assert job_manager.status()["run"] is None
+    finally:
+        other_lock.release()
+
+
+def test_status_collects_stage_progress_and_failures(state_dir):
+    job_manager = JobManager(state_dir)
+
+    def job(config):
+        metrics = metrics_tool.start_run(os.path.join(state_dir, "paper", "20240105"))
+        try:
+            with metrics.stage("summary"):
+                for paper_id in ("1", "2"):
+                    metrics.record(paper_id=paper_id, prompt_tokens=100, completion_tokens=20, http_calls=1)
+        finally:
+            metrics.finish()
+
+    assert job_manager.run_now(job, make_config(state_dir, "t"))
+    run = wait_until_idle(job_manager)
+    assert run["trigger"] == "手动" and run["status"] == JOB_DONE
+    summary = run["stage_dict"]["summary"]
+    assert (summary["status"], summary["papers"], summary["prompt_tokens"], summary["http_calls"]) == \
+           (JOB_DONE, 2, 200, 2)
+
+    def failing_job(config):
+        raise RuntimeError("检索失败")
+
+    assert job_manager.run_now(failing_job, make_config(state_dir, "t"))
+    run = wait_until_idle(job_manager)
+    assert (run["status"], run["error"]) == (JOB_FAILED, "检索失败")
@@ -0,0 +1,181 @@
+import json
+import os
+import threading
+
+import arxiv
+import pytest
+
+import main
+from benchmark.fake_server import FakeConfig, start_fake_server
+from llm_tool import arxiv_tool, dedup_tool, moonshot_tool, pipeline_tool
+
+LLM_LIMITS = {"rpm": 6000, "tpm": 100000000, "max_workers": 4}
+
+
+@pytest.fixture
+def fake_server(monkeypatch):
+    """
+    本地的 arXiv 与 Moonshot AI 替身服务，不需要网络
+    """
+    server = start_fake_server(FakeConfig(paper_number=20, query_number=2, pdf_size=1024, text_size=800))
+    monkeypatch.setattr(arxiv.Client, "query_url_format", server.base_url + "/api/query?{}")
+    monkeypatch.setenv("KIMI_API_KEY", "test")
+    monkeypatch.setenv("KIMI_BASE_URL", server.base_url + "/v1")
+    monkeypatch.setattr(arxiv_tool.API_RATE_LIMITER, "min_interval", 0)
+    monkeypatch.setattr(arxiv_tool.PDF_RATE_LIMITER, "min_interval", 0)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def run_with_timeout(target, timeout=60):
+    """
+    在线程中运行，超时说明流水线卡住
+    """
+    error_list = []
+
+    def _run():
+        try:
+            target()
+        except Exception as e:
+            error_list.append(e)
+
+    thread = threading.Thread(target=_run, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "流水线没有结束"
+    if error_list:
+        raise error_list[0]
+
+
+def read_day_file(root_dir, suffix):
+    daily_dir = os.path.join(root_dir, "paper", main.datetime.datetime.now().strftime("%Y%m%d"))
+    with open(os.path.join(daily_dir, os.path.basename(daily_dir) + suffix), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_streaming_pipeline_selects_and_summarizes(tmp_path, fake_server):
+    root_dir = str(tmp_path)
+    run_with_timeout(lambda: main.stream_paper_process(
+        "green building", ['all:"bench0"', 'all:"bench1"'], 10, 2, root_dir, is_free_account=False,
+        llm_limits=LLM_LIMITS, min_score=0, queue_size=2))
+
+    judge_result = read_day_file(root_dir, "_judge_result.json")
+    assert len(judge_result) == 2
+    assert list(read_day_file(root_dir, "_summary.json")) == [item["paper_id"] for item in judge_result]
+
+
+def test_streaming_pipeline_terminates_when_a_judge_step_fails(tmp_path, fake_server, monkeypatch):
+    def _filter(self, paper_list):
+        raise RuntimeError("去重失败")
+
+    monkeypatch.setattr(dedup_tool.PaperDeduplicator, "filter", _filter)
+    root_dir = str(tmp_path)
+    # 队列长度小于检索到的论文数，筛选线程退出时检索线程会阻塞在已满的队列上
+    run_with_timeout(lambda: main.stream_paper_process(
+        "green building", ['all:"bench0"', 'all:"bench1"'], 10, 2, root_dir, is_free_account=False,
+        llm_limits=LLM_LIMITS, min_score=0, queue_size=2))
+
+    assert read_day_file(root_dir, "_judge_result.json") == []
+
+
+def test_streaming_pipeline_skips_papers_whose_download_fails(tmp_path, fake_server, monkeypatch):
+    def _download_pdf(url, file_path, **kwargs):
+        raise OSError("下载失败")
+
+    monkeypatch.setattr(arxiv_tool, "download_pdf", _download_pdf)
+    root_dir = str(tmp_path)
+    run_with_timeout(lambda: main.stream_paper_process(
+        "green building", ['all:"bench0"', 'all:"bench1"'], 10, 2, root_dir, is_free_account=False,
+        llm_limits=LLM_LIMITS, min_score=0, queue_size=2))
+
+    # 筛选结果照常保存，下载失败的论文不进入总结
+    assert len(read_day_file(root_dir, "_judge_result.json")) == 2
+    assert read_day_file(root_dir, "_summary.json") == dict()
+
+
+def test_streaming_pipeline_stops_fetching_once_enough_papers_are_accepted(tmp_path, fake_server):
+    root_dir = str(tmp_path)
+    run_with_timeout(lambda: main.stream_paper_process(
+        "green building", ['all:"bench0"'], 10, 1, root_dir, is_free_account=False,
+        llm_limits=LLM_LIMITS, min_score=0, queue_size=1, token_budget=1))
+
+    paper_data = read_day_file(root_dir, ".json")
+    assert len(read_day_file(root_dir, "_judge_result.json")) == 1
+    assert len(paper_data["green building"]['all:"bench0']) < 10
+
+
+def make_keyword(*keyword_list):
+    """
+    界面保存的关键词格式，每组四项依次为全部字段、标题、作者、摘要
+    """
+    keyword_dict = dict()
+    for i, keyword in enumerate(keyword_list):
+        keyword_dict.update({f"k-{i}-0": keyword, f"k-{i}-1": "", f"k-{i}-2": "", f"k-{i}-3": ""})
+    return keyword_dict
+
+
+def test_multi_topic_run_shares_fetch_download_and_summary(tmp_path, fake_server, monkeypatch):
+    query_list = []
+    get_query_paper = pipeline_tool.get_query_paper
+    monkeypatch.setattr(pipeline_tool, "get_query_paper",
+                        lambda query, *args: query_list.append(query) or get_query_paper(query, *args))
+    summarized_list = []
+    summarize_with_retry = moonshot_tool.summarize_with_retry
+    monkeypatch.setattr(moonshot_tool, "summarize_with_retry",
+                        lambda client, daily_dir, paper_id, *args, **kwargs: summarized_list.append(paper_id) or
+                        summarize_with_retry(client, daily_dir, paper_id, *args, **kwargs))
+
+    root_dir = str(tmp_path)
+    config = {"root_dir": root_dir, "is_free_account": False, "llm_limits": LLM_LIMITS,
+              "max_results_per_query": 10, "judge_number": 3,
+              "topics": [{"topic": "green building", "keyword": make_keyword("bench0", "bench1")},
+                         {"topic": "low carbon", "keyword": make_keyword("bench1"), "judge_number": 2}]}
+    run_with_timeout(lambda: main.run_task(config))
+
+    # 相同的关键词只检索一次
+    assert sorted(query_list) == ['all:"bench0"', 'all:"bench1"']
+    daily_dir = os.path.join(root_dir, "paper", main.datetime.datetime.now().strftime("%Y%m%d"))
+    selected_dict = dict()
+    for topic, judge_number in (("green building", 3), ("low carbon", 2)):
+        topic_dir = main.get_topic_dir_name(daily_dir, topic)
+        with open(os.path.join(topic_dir, os.path.basename(daily_dir) + "_judge_result.json"), "r") as f:
+            selected_dict[topic] = [item["paper_id"] for item in json.load(f)]
+        assert len(selected_dict[topic]) == judge_number
+        with open(os.path.join(topic_dir, os.path.basename(daily_dir) + "_summary.json"), "r", encoding="utf-8") as f:
+            assert list(json.load(f)) == selected_dict[topic]
+        assert os.path.exists(os.path.join(topic_dir, os.path.basename(daily_dir) + ".md"))
+
+    # 多个主题选中的同一篇论文只下载和总结一次，pdf保存在每日目录中
+    selected_set = set(selected_dict["green building"]) | set(selected_dict["low carbon"])
+    assert sorted(summarized_list) == sorted(selected_set)
+    assert {file_name[:-len(".pdf")] for file_name in os.listdir(daily_dir) if file_name.endswith(".pdf")} == \
+           selected_set
+
+
+def test_resumed_run_reuses_completed_stages_after_a_crash(tmp_path, fake_server, monkeypatch):
+    def _crash(*args, **kwargs):
+        raise KeyboardInterrupt("crash")
+
+    root_dir = str(tmp_path)
+    kwargs = dict(topic="green building", query_list=["all:bench0", "all:bench1"], max_results_per_query=10,
+                  judge_number=3, root_dir=root_dir, is_free_account=False, llm_limits=LLM_LIMITS)
+    summarize_with_retry = moonshot_tool.summarize_with_retry
+    monkeypatch.setattr(moonshot_tool, "summarize_with_retry", _crash)
+    with pytest.raises(KeyboardInterrupt):
+        main.paper_process(**kwargs)
+    stage_dict = read_day_file(root_dir, "_manifest.json")["stages"]
+    assert {stage: stage_dict[stage]["status"] for stage in stage_dict} == \
+           {"fetch": "done", "judge": "done", "download": "done", "summary": "failed"}
+
+    # 继续运行时不再检索和筛选，只补完之后的阶段
+    query_list = []
+    monkeypatch.setattr(pipeline_tool, "get_query_paper", lambda query, *args: query_list.append(query))
+    monkeypatch.setattr(moonshot_tool, "summarize_with_retry", summarize_with_retry)
+    main.paper_process(resume=True, **kwargs)
+    assert query_list == []
+    manifest = read_day_file(root_dir, "_manifest.json")
+    assert {stage["status"] for stage in manifest["stages"].values()} == {"done"}
+    selected_list = [item["paper_id"] for item in read_day_file(root_dir, "_judge_result.json")]
+    assert list(read_day_file(root_dir, "_summary.json")) == selected_list
+    assert all(manifest["papers"][paper_id]["summary"]["status"] == "done" for paper_id in selected_list)
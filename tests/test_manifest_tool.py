@@ -0,0 +1,44 @@
+import json
+
+import pytest
+
+from llm_tool.manifest_tool import RunManifest, get_inputs_hash
+
+
+def read_manifest(daily_dir):
+    with open(str(daily_dir / "20240105_manifest.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_inputs_hash_ignores_key_order():
+    assert get_inputs_hash({"a": 1, "b": 2}, ["q"]) == get_inputs_hash({"b": 2, "a": 1}, ["q"])
+    assert get_inputs_hash({"a": 1}, ["q"]) != get_inputs_hash({"a": 1}, ["q", "r"])
+
+
+def test_completed_stage_is_reused_only_on_resume_with_the_same_inputs(tmp_path):
+    daily_dir = tmp_path / "20240105"
+    with RunManifest(str(daily_dir)).checkpoint("fetch", "hash-1") as outputs:
+        outputs["paper_data_path"] = "20240105.json"
+
+    assert RunManifest(str(daily_dir), resume=True).completed_outputs("fetch", "hash-1") == \
+           {"paper_data_path": "20240105.json"}
+    assert RunManifest(str(daily_dir), resume=True).completed_outputs("fetch", "hash-2") is None
+    # 不以 --resume 运行时重新开始记录
+    assert RunManifest(str(daily_dir)).completed_outputs("fetch", "hash-1") is None
+    assert read_manifest(daily_dir)["stages"] == {}
+
+
+def test_failed_stage_is_recorded_and_not_reused(tmp_path):
+    daily_dir = tmp_path / "20240105"
+    manifest = RunManifest(str(daily_dir))
+    with pytest.raises(KeyboardInterrupt):
+        with manifest.checkpoint("summary", "hash-1"):
+            raise KeyboardInterrupt("crash")
+    manifest.set_papers(["p1", "p2"], "download", "done")
+    manifest.set_paper("p2", "summary", "failed", error=ValueError("bad json"))
+
+    data = read_manifest(daily_dir)
+    assert (data["stages"]["summary"]["status"], data["stages"]["summary"]["error"]) == ("failed", "crash")
+    assert data["papers"]["p2"]["summary"]["error"] == "bad json"
+    assert data["papers"]["p1"]["download"]["status"] == "done"
+    assert RunManifest(str(daily_dir), resume=True).completed_outputs("summary", "hash-1") is None
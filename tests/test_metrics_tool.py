@@ -0,0 +1,96 @@
+import json
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from llm_tool import metrics_tool
+
+
+@pytest.fixture
+def metrics(tmp_path):
+    metrics = metrics_tool.start_run(str(tmp_path / "paper" / "20240105"))
+    yield metrics
+    # 恢复为不写文件的记录，避免影响其他测试
+    metrics_tool._current_metrics = metrics_tool.RunMetrics()
+
+
+def read_report(tmp_path):
+    with open(str(tmp_path / "paper" / "20240105" / "20240105_metrics.jsonl"), "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_records_are_attributed_to_the_current_stage(metrics):
+    with metrics.stage("download"):
+        metrics.record(paper_id="1", http_calls=1, bytes=100)
+        metrics.record(paper_id="2", http_calls=1, bytes=50, cache_hits=0)
+        time.sleep(0.02)
+    with metrics.stage("summary"):
+        metrics_tool.record_completion(SimpleNamespace(model="moonshot-v1-8k",
+                                                       usage=SimpleNamespace(prompt_tokens=10, completion_tokens=2)),
+                                       paper_id="1")
+    # 阶段外的记录可以指定阶段
+    metrics.record(stage="download", retries=1, unknown=5)
+
+    summary_dict = metrics.summary()
+    assert list(summary_dict) == ["download", "summary"]
+    assert (summary_dict["download"]["http_calls"], summary_dict["download"]["bytes"],
+            summary_dict["download"]["retries"]) == (2, 150, 1)
+    assert summary_dict["download"]["wall_time"] >= 0.02
+    assert (summary_dict["summary"]["prompt_tokens"], summary_dict["summary"]["completion_tokens"]) == (10, 2)
+
+
+def test_threads_bound_to_a_stage_record_into_it(metrics):
+    def _worker(stage):
+        metrics.bind_stage(stage)
+        for _ in range(100):
+            metrics_tool.get_metrics().record(http_calls=1)
+
+    # 多个阶段同时进行时各线程的记录归入各自的阶段
+    with metrics.stage("fetch"):
+        thread_list = [threading.Thread(target=_worker, args=(stage,)) for stage in ("judge", "download", "judge")]
+        for thread in thread_list:
+            thread.start()
+        for thread in thread_list:
+            thread.join()
+        metrics.record(http_calls=1)
+
+    summary_dict = metrics.summary()
+    assert {stage: summary_dict[stage]["http_calls"] for stage in summary_dict} == \
+           {"fetch": 1, "judge": 200, "download": 100}
+
+
+def test_finish_appends_events_and_summaries_to_the_daily_report(tmp_path, metrics):
+    with metrics.stage("fetch"):
+        metrics.record(paper_id="1", http_calls=1)
+    metrics.finish()
+
+    event_list = read_report(tmp_path)
+    assert [event["type"] for event in event_list] == \
+           ["stage_start", "paper", "stage_end", "stage_summary", "run_summary"]
+    assert {event["run_id"] for event in event_list} == {metrics.run_id}
+
+    # 同一天的多次运行追加到同一个文件
+    second_metrics = metrics_tool.start_run(str(tmp_path / "paper" / "20240105"))
+    second_metrics.finish()
+    assert len(read_report(tmp_path)) == len(event_list) + 1
+
+
+def test_run_listeners_receive_events_of_later_runs(tmp_path, metrics):
+    event_list = []
+    metrics_tool.add_run_listener(event_list.append)
+    try:
+        later_metrics = metrics_tool.start_run(str(tmp_path / "paper" / "20240106"))
+        with later_metrics.stage("judge"):
+            later_metrics.record(cache_hits=3)
+    finally:
+        metrics_tool.remove_run_listener(event_list.append)
+
+    assert [(event["type"], event["stage"]) for event in event_list] == \
+           [("stage_start", "judge"), ("stage_counter", "judge"), ("stage_end", "judge")]
+    # 已经开始的运行不受之前添加的监听函数影响
+    metrics.record(http_calls=1)
+    assert len(event_list) == 3
+    assert not os.path.exists(str(tmp_path / "paper" / "20240106" / "20240106_metrics.jsonl"))
@@ -0,0 +1,206 @@
+import json
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from llm_tool import moonshot_tool
+from llm_tool.store_tool import TokenCountStore
+
+
+def make_paper(paper_id):
+    return {"paper_id": paper_id, "paper_title": f"title {paper_id}", "paper_abstract": "abstract",
+            "paper_authors": "Alice", "paper_primary_category": "cs.CE", "paper_published_time": "2024-01-03",
+            "paper_entry_id": f"http://arxiv.org/abs/{paper_id}"}
+
+
+def write_paper_data(dir_path, paper_id_list):
+    paper_data_path = os.path.join(dir_path, "20240103.json")
+    with open(paper_data_path, "w", encoding="utf-8") as f:
+        json.dump({"topic": {"query": {paper_id: make_paper(paper_id) for paper_id in paper_id_list}}}, f)
+    return paper_data_path
+
+
+@pytest.fixture
+def scored_list(monkeypatch):
+    """
+    替换大模型打分，记录每次打分的论文，分数按paper_id从大到小
+    """
+    monkeypatch.setenv("KIMI_API_KEY", "test")
+    scored_list = []
+
+    def _score_papers(client, model, papers_info, **kwargs):
+        scored_list.append([paper["paper_id"] for paper in papers_info])
+        return {paper["paper_id"]: float(paper["paper_id"][-1]) for paper in papers_info}
+
+    monkeypatch.setattr(moonshot_tool, "score_papers", _score_papers)
+    return scored_list
+
+
+def read_selected(judge_result_path):
+    with open(judge_result_path, "r", encoding="utf-8") as f:
+        return [item["paper_id"] for item in json.load(f)]
+
+
+def test_judge_paper_reuses_result_only_for_the_same_inputs(tmp_path, scored_list):
+    paper_data_path = write_paper_data(str(tmp_path), ["p1", "p2", "p3"])
+
+    judge_result_path = moonshot_tool.judge_paper(paper_data_path, 3, judge_number=1, llm="moonshot")
+    assert read_selected(judge_result_path) == ["p3"]
+    moonshot_tool.judge_paper(paper_data_path, 3, judge_number=1, llm="moonshot")
+    assert len(scored_list) == 1
+
+    # 候选论文变化后重新筛选
+    moonshot_tool.judge_paper(paper_data_path, 3, judge_number=1, llm="moonshot", candidate_ids=["p2", "p1"])
+    assert read_selected(judge_result_path) == ["p2"]
+    assert scored_list[-1] == ["p1", "p2"]
+
+
+def test_judge_paper_judges_again_when_the_paper_data_changes(tmp_path, scored_list):
+    paper_data_path = write_paper_data(str(tmp_path), ["p1", "p2"])
+    judge_result_path = moonshot_tool.judge_paper(paper_data_path, 2, judge_number=1, llm="moonshot")
+    assert read_selected(judge_result_path) == ["p2"]
+
+    # 同一天再次运行时论文信息被覆盖，之前的筛选结果指向的论文可能已经不存在
+    write_paper_data(str(tmp_path), ["p4", "p5"])
+    moonshot_tool.judge_paper(paper_data_path, 2, judge_number=1, llm="moonshot")
+    assert read_selected(judge_result_path) == ["p5"]
+    assert len(scored_list) == 2
+
+
+def test_result_written_outside_judge_paper_is_not_reused(tmp_path, scored_list):
+    paper_data_path = write_paper_data(str(tmp_path), ["p1", "p2"])
+    moonshot_tool.judge_paper(paper_data_path, 2, judge_number=1, llm="moonshot")
+
+    # 流式运行直接写入的筛选结果没有对应的输入哈希
+    moonshot_tool.update_judge_results(paper_data_path, [{"paper_id": "p1", "score": 1.0}])
+    judge_result_path = moonshot_tool.judge_paper(paper_data_path, 2, judge_number=1, llm="moonshot")
+    assert read_selected(judge_result_path) == ["p2"]
+    assert len(scored_list) == 2
+
+
+def test_judge_paper_only_scores_papers_without_a_cached_score(tmp_path, scored_list):
+    root_paper_path = str(tmp_path)
+    first_dir = tmp_path / "20240103"
+    first_dir.mkdir()
+    moonshot_tool.judge_paper(write_paper_data(str(first_dir), ["p1", "p2"]), 2, judge_number=1, llm="moonshot",
+                              topic="绿色建筑", root_paper_path=root_paper_path)
+
+    # 第二天检索到的论文中已打过分的不再发送给大模型
+    later_dir = tmp_path / "20240104"
+    later_dir.mkdir()
+    judge_result_path = moonshot_tool.judge_paper(write_paper_data(str(later_dir), ["p2", "p3"]), 2, judge_number=2,
+                                                  llm="moonshot", topic="绿色建筑", root_paper_path=root_paper_path)
+    assert scored_list == [["p1", "p2"], ["p3"]]
+    assert read_selected(judge_result_path) == ["p3", "p2"]
+
+    # 其他主题的打分不复用
+    other_dir = tmp_path / "20240105"
+    other_dir.mkdir()
+    moonshot_tool.judge_paper(write_paper_data(str(other_dir), ["p2"]), 1, judge_number=1, llm="moonshot",
+                              topic="低碳", root_paper_path=root_paper_path)
+    assert scored_list[-1] == ["p2"]
+
+
+def test_get_rate_limiter_shares_one_limiter_per_limit(monkeypatch):
+    monkeypatch.setattr(moonshot_tool, "_rate_limiter_dict", dict())
+    result_list = []
+    thread_list = [threading.Thread(target=lambda: result_list.append(moonshot_tool.get_rate_limiter(False)))
+                   for _ in range(8)]
+    for thread in thread_list:
+        thread.start()
+    for thread in thread_list:
+        thread.join()
+    assert len({id(rate_limiter) for rate_limiter, _ in result_list}) == 1
+    paid_limit = moonshot_tool.MOONSHOT_ACCOUNT_LIMITS["paid"]
+    assert {max_workers for _, max_workers in result_list} == {paid_limit["max_workers"]}
+
+    # 显式设置的速率限制使用各自的限速器，默认值按账户类型补全
+    rate_limiter, max_workers = moonshot_tool.get_rate_limiter(True, rpm=10, max_workers=2)
+    assert rate_limiter is not result_list[0][0] and max_workers == 2
+    assert moonshot_tool.get_rate_limiter(True, rpm=10, tpm=32000)[0] is rate_limiter
+
+
+def test_moonshot_rate_limiter_waits_for_both_requests_and_tokens():
+    rate_limiter = moonshot_tool.MoonshotRateLimiter(rpm=600, tpm=6000)
+    start = time.monotonic()
+    rate_limiter.acquire(6000)
+    assert time.monotonic() - start < 0.05
+    # token桶已空，每秒补充100个token
+    rate_limiter.acquire(20)
+    assert time.monotonic() - start >= 0.15
+
+
+def test_route_model_picks_the_smallest_model_that_fits():
+    assert moonshot_tool.route_model(1000) == "moonshot-v1-8k"
+    # 估计值预留余量，实际值不预留
+    assert moonshot_tool.route_model(7000) == "moonshot-v1-32k"
+    assert moonshot_tool.route_model(7000, exact=True) == "moonshot-v1-8k"
+    assert moonshot_tool.route_model(100 * 1024) == "moonshot-v1-128k"
+    assert moonshot_tool.route_model(200 * 1024) is None
+
+
+def test_split_text_keeps_every_chunk_under_the_limit():
+    text = "\n".join(["word " * 50] * 20 + ["x" * 4000])
+    chunk_list = moonshot_tool.split_text(text, 200)
+    assert len(chunk_list) > 1
+    assert all(moonshot_tool.estimate_tokens(chunk) <= 200 + 1 for chunk in chunk_list)
+    # 超长的一行被切分，内容不丢失
+    assert "".join(chunk_list).replace("\n", "") == text.replace("\n", "")
+
+
+class SummaryClient:
+    """
+    记录每次请求模型的 chat.completions 替身，返回的prompt_tokens为估计值的一半
+    """
+
+    def __init__(self):
+        self.chat = SimpleNamespace(completions=self)
+        self.model_list = []
+
+    def create(self, model, messages, temperature=0, **kwargs):
+        self.model_list.append(model)
+        prompt_tokens = sum(moonshot_tool.estimate_tokens(message["content"]) for message in messages) // 2
+        content = json.dumps({"summary": "总结", "keypoints_1": "创新点1", "keypoints_2": "创新点2"},
+                             ensure_ascii=False)
+        return SimpleNamespace(model=model, usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=10,
+                                                                  total_tokens=prompt_tokens + 10),
+                               choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+class TextExtractor:
+    def __init__(self, text):
+        self.text = text
+
+    def get_text(self, pdf_path, paper_id):
+        return self.text
+
+
+def test_summary_routes_by_cached_token_count(tmp_path):
+    client = SummaryClient()
+    token_store = TokenCountStore(str(tmp_path))
+    text_extractor = TextExtractor("word " * 6000)
+
+    summary = moonshot_tool.get_summary_from_moonshot(client, str(tmp_path), "p1", text_extractor=text_extractor,
+                                                      token_store=token_store)
+    assert summary["summary"] == "总结"
+    assert client.model_list == ["moonshot-v1-32k"]
+
+    # 之后的运行使用接口返回的实际token数，可以换用更小的模型
+    moonshot_tool.get_summary_from_moonshot(client, str(tmp_path), "p1", text_extractor=text_extractor,
+                                            token_store=token_store)
+    assert client.model_list[-1] == "moonshot-v1-8k"
+
+
+def test_summary_falls_back_to_map_reduce_for_long_text(tmp_path):
+    client = SummaryClient()
+    text = "\n".join(["word " * 100] * 8000)
+    moonshot_tool.get_summary_from_moonshot(client, str(tmp_path), "p1", text_extractor=TextExtractor(text),
+                                            token_store=TokenCountStore(str(tmp_path)))
+    chunk_number = len(moonshot_tool.split_text(text, moonshot_tool.MAP_CHUNK_TOKENS))
+    assert chunk_number > 1
+    # 每段分别概括后再总结一次
+    assert len(client.model_list) == chunk_number + 1
+    assert client.model_list[-1] == "moonshot-v1-8k"
@@ -0,0 +1,134 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from llm_tool import screen_tool
+from llm_tool.parse_tool import (JSON_MODE, SCORE_SCHEMA, SUMMARY_SCHEMA, ResponseParseError, close_json,
+                                 extract_json, parse_response, repair_json, validate)
+from llm_tool.store_tool import ResponseStore
+
+SUMMARY = {"summary": "总结", "keypoints_1": "要点一", "keypoints_2": "要点二"}
+
+
+def test_close_json_closes_truncated_string_and_brackets():
+    assert json.loads(close_json('{"a": [1, {"b": "tex')) == {"a": [1, {"b": "tex"}]}
+
+
+def test_close_json_ignores_brackets_inside_strings():
+    assert json.loads(close_json('{"a": "x}]\\"{", "b": [')) == {"a": 'x}]"{', "b": []}
+
+
+def test_repair_json_fixes_trailing_commas_and_python_literals():
+    assert json.loads(repair_json('{"a": True, "b": None, "c": [1, 2,],}')) == {"a": True, "b": None, "c": [1, 2]}
+
+
+@pytest.mark.parametrize("content", [
+    json.dumps(SUMMARY, ensure_ascii=False),
+    "```json\n" + json.dumps(SUMMARY, ensure_ascii=False) + "\n```",
+    "好的，以下是总结：\n" + json.dumps(SUMMARY, ensure_ascii=False) + "\n希望对你有帮助。",
+])
+def test_extract_json_tolerates_fences_and_surrounding_text(content):
+    assert extract_json(content) == SUMMARY
+
+
+def test_extract_json_closes_truncated_reply():
+    assert extract_json('```json\n[{"paper_id": "1", "score": 8}, {"paper_id": "2", "score": 7') == \
+           [{"paper_id": "1", "score": 8}, {"paper_id": "2", "score": 7}]
+
+
+def test_parse_scores_keeps_complete_entries_of_a_reply_cut_mid_key():
+    assert screen_tool.parse_scores('```json\n[{"paper_id": "1", "score": 8}, {"paper_id": "2", "sc') == {"1": 8.0}
+
+
+@pytest.mark.parametrize("content", [
+    '{"results": [{"paper_id": "1", "score": "8"}]}',
+    '{"paper_id": "1", "score": 8}',
+    '{"1": 8}',
+])
+def test_parse_scores_normalizes_common_variants(content):
+    assert screen_tool.parse_scores(content) == {"1": 8.0}
+
+
+def test_extract_json_keeps_raw_newlines_inside_strings():
+    assert extract_json('{"summary": "第一行\n第二行", "keypoints_1": "", "keypoints_2": ""}')["summary"] == \
+           "第一行\n第二行"
+
+
+@pytest.mark.parametrize("content", [None, "", "   ", "没有json的回复"])
+def test_extract_json_raises_with_original_content(content):
+    with pytest.raises(ResponseParseError) as error:
+        extract_json(content)
+    assert error.value.content == content
+
+
+def test_validate_reports_missing_fields_and_wrong_types():
+    error_list = validate({"summary": 1, "keypoints_1": ""}, SUMMARY_SCHEMA)
+    assert "$ 缺少字段 keypoints_2" in error_list
+    assert "$.summary 应为string" in error_list
+
+
+def test_validate_rejects_booleans_as_numbers():
+    assert validate([{"paper_id": "1", "score": True}], SCORE_SCHEMA) == ["$[0].score 应为数字"]
+    assert validate([{"paper_id": "1", "score": 7.5}], SCORE_SCHEMA) == []
+
+
+def test_parse_response_repairs_once_and_records_every_attempt(tmp_path):
+    response_store = ResponseStore(str(tmp_path))
+    repair_list = []
+
+    def _repair(messages):
+        repair_list.append(messages)
+        return json.dumps(SUMMARY, ensure_ascii=False)
+
+    try:
+        value = parse_response('{"summary": "只有总结"}', SUMMARY_SCHEMA, repair=_repair,
+                               response_store=response_store, kind="summary", item_key="2401.00001v1")
+        assert value == SUMMARY
+        assert len(repair_list) == 1
+        # 原始回复与修复后的回复分别记录，之后从原始回复开始修复
+        assert response_store.latest("summary", "2401.00001v1") == ('{"summary": "只有总结"}', False)
+        assert response_store.latest("summary_repair", "2401.00001v1")[1] is True
+    finally:
+        response_store.close()
+
+
+def test_parse_response_raises_after_max_repairs():
+    with pytest.raises(ResponseParseError):
+        parse_response("不是json", SUMMARY_SCHEMA, repair=lambda messages: "仍然不是json", max_repairs=2)
+
+
+class FakeCompletions:
+    """
+    按顺序返回预设回复的 chat.completions 替身
+    """
+
+    def __init__(self, content_list):
+        self.content_list = list(content_list)
+        self.chat = SimpleNamespace(completions=self)
+        self.kwargs_list = []
+
+    def create(self, model, messages, temperature=0, **kwargs):
+        self.kwargs_list.append(kwargs)
+        return SimpleNamespace(model=model, usage=None,
+                               choices=[SimpleNamespace(message=SimpleNamespace(content=self.content_list.pop(0)))])
+
+
+def test_score_batch_leaves_papers_that_are_never_scored_out():
+    batch = [{"paper_id": paper_id, "paper_title": "t", "paper_abstract": "a"} for paper_id in ("1", "2")]
+    client = FakeCompletions(['[{"paper_id": "1", "score": 8}, {"paper_id": "9", "score": 10}]', "[]"])
+    assert screen_tool.score_batch(client, "moonshot-v1-8k", batch) == {"1": 8.0}
+    assert not client.content_list
+
+
+def test_score_batch_retries_missing_papers_once():
+    batch = [{"paper_id": paper_id, "paper_title": "t", "paper_abstract": "a"} for paper_id in ("1", "2")]
+    client = FakeCompletions(['[{"paper_id": "1", "score": 8}]', '[{"paper_id": "2", "score": 3}]'])
+    assert screen_tool.score_batch(client, "moonshot-v1-8k", batch) == {"1": 8.0, "2": 3.0}
+
+
+def test_score_batch_requests_json_mode_for_replies_and_repairs():
+    batch = [{"paper_id": "1", "paper_title": "t", "paper_abstract": "a"}]
+    client = FakeCompletions(['{"scores": [{"paper_id": "1", "score": "高"}]}', '{"scores": [{"paper_id": "1", "score": 6}]}'])
+    assert screen_tool.score_batch(client, "moonshot-v1-8k", batch) == {"1": 6.0}
+    assert client.kwargs_list == [{"response_format": JSON_MODE}] * 2
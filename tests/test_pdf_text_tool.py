@@ -0,0 +1,39 @@
+from llm_tool.pdf_text_tool import select_sections, split_sections
+
+PAPER_TEXT = """Carbon accounting for green buildings
+Alice Zhang
+Abstract
+We propose a framework.
+1 Introduction
+Buildings emit carbon.
+2. Related Work
+Prior studies.
+II. METHODS
+We measure energy.
+5 Conclusions and Future Work
+It works.
+References
+[1] A reference."""
+
+
+def test_split_sections_recognizes_numbered_and_plain_headings():
+    title_list = [title for title, _ in split_sections(PAPER_TEXT)]
+    assert title_list == ["", "Abstract", "Introduction", "Related Work", "METHODS", "Conclusions and Future Work",
+                          "References"]
+    assert split_sections(PAPER_TEXT)[0][1] == "Carbon accounting for green buildings\nAlice Zhang"
+
+
+def test_split_sections_does_not_treat_wrapped_sentences_as_headings():
+    text = "Abstract\nthe results of the\nexperiments are good.\n3 of the buildings were old."
+    assert [title for title, _ in split_sections(text)] == ["", "Abstract"]
+
+
+def test_select_sections_keeps_chosen_sections_in_order():
+    selected = select_sections(PAPER_TEXT, ["abstract", "introduction", "conclusion"])
+    assert selected == "Abstract\nWe propose a framework.\n\nIntroduction\nBuildings emit carbon.\n\n" \
+                       "Conclusions and Future Work\nIt works."
+
+
+def test_select_sections_falls_back_to_full_text():
+    assert select_sections(PAPER_TEXT, None) == PAPER_TEXT
+    assert select_sections("no headings here", ["introduction"]) == "no headings here"
@@ -0,0 +1,91 @@
+import os
+import threading
+import time
+
+import arxiv
+import pytest
+
+from benchmark.fake_server import FakeConfig, start_fake_server
+from llm_tool import arxiv_tool, pipeline_tool
+from llm_tool.store_tool import PdfStore
+
+
+@pytest.fixture
+def fake_server(monkeypatch):
+    server = start_fake_server(FakeConfig(paper_number=6, query_number=2, pdf_size=1024))
+    monkeypatch.setattr(arxiv.Client, "query_url_format", server.base_url + "/api/query?{}")
+    monkeypatch.setattr(arxiv_tool.API_RATE_LIMITER, "min_interval", 0)
+    monkeypatch.setattr(arxiv_tool.PDF_RATE_LIMITER, "min_interval", 0)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_concurrent_fetch_shares_one_rate_limited_client(fake_server, monkeypatch):
+    client_list = []
+    thread_list = [threading.Thread(target=lambda: client_list.append(arxiv_tool.get_arxiv_client()))
+                   for _ in range(4)]
+    for thread in thread_list:
+        thread.start()
+    for thread in thread_list:
+        thread.join()
+    assert len({id(client) for client in client_list}) == 1
+
+    # 并发检索时所有关键词的请求仍按全局间隔依次发出
+    monkeypatch.setattr(arxiv_tool.API_RATE_LIMITER, "min_interval", 0.3)
+    arxiv_tool.API_RATE_LIMITER.wait()
+    start = time.monotonic()
+    topic_paper = pipeline_tool.get_topic_paper("t", ["all:bench0", "all:bench1"], max_results=3, concurrent=True,
+                                                max_workers=2)
+    assert time.monotonic() - start >= 0.55
+    # 两个关键词各3篇，其中一篇重叠的论文只保留一份
+    assert sum(len(paper_content) for paper_content in topic_paper["t"].values()) == 5
+
+
+@pytest.mark.parametrize("concurrent", [False, True])
+def test_fetch_queries_applies_per_query_limits(fake_server, concurrent):
+    query_paper_dict = pipeline_tool.fetch_queries({"all:bench0": 1, "all:bench1": 3}, concurrent=concurrent)
+    assert {query: len(paper_content) for query, paper_content in query_paper_dict.items()} == \
+           {"all:bench0": 1, "all:bench1": 3}
+
+
+def test_fetch_queries_only_returns_papers_after_the_watermark(fake_server):
+    watermark_dict = dict()
+    first_dict = pipeline_tool.fetch_queries({"all:bench0": 3}, watermark_dict=watermark_dict)
+    assert len(first_dict["all:bench0"]) == 3
+    assert watermark_dict["all:bench0"]["published"]
+
+    # 服务端没有新论文时增量检索为空
+    assert pipeline_tool.fetch_queries({"all:bench0": 3}, watermark_dict=watermark_dict) == {"all:bench0": {}}
+
+
+def test_download_with_store_links_papers_downloaded_on_another_day(tmp_path, fake_server):
+    root_paper_path = str(tmp_path / "paper")
+    paper = next(pipeline_tool.iter_query_paper("all:bench0", 1))
+    paper_id = paper["paper_id"]
+
+    first_dir = os.path.join(root_paper_path, "20240105")
+    assert pipeline_tool.download_with_store([paper_id], first_dir, root_paper_path, paper_info=[paper]) == []
+    assert os.path.exists(os.path.join(first_dir, paper_id + ".pdf"))
+
+    # 另一天选中同一篇论文时从pdf存储中链接，不再请求arXiv
+    fake_server.shutdown()
+    later_dir = os.path.join(root_paper_path, "20240106")
+    os.makedirs(later_dir)
+    assert pipeline_tool.download_with_store([paper_id], later_dir, root_paper_path, paper_info=[paper]) == []
+    assert os.path.samefile(os.path.join(first_dir, paper_id + ".pdf"), os.path.join(later_dir, paper_id + ".pdf"))
+
+
+def test_link_existing_pdf_adds_old_downloads_to_the_store(tmp_path):
+    pdf_path = str(tmp_path / "paper" / "20240105" / "2401.00001v1.pdf")
+    os.makedirs(os.path.dirname(pdf_path))
+    with open(pdf_path, "wb") as f:
+        f.write(b"%PDF-old")
+
+    pdf_store = PdfStore(str(tmp_path / "paper"))
+    try:
+        assert pipeline_tool.link_existing_pdf("2401.00001v1", pdf_path, pdf_store)
+        assert pdf_store.lookup("2401.00001v1") is not None
+        assert not pipeline_tool.link_existing_pdf("2401.00002v1", pdf_path.replace("00001", "00002"), pdf_store)
+    finally:
+        pdf_store.close()
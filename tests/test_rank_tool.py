@@ -0,0 +1,43 @@
+import json
+
+from llm_tool import rank_tool
+
+
+def make_paper(paper_id, title, abstract):
+    return {"paper_id": paper_id, "paper_title": title, "paper_abstract": abstract}
+
+
+def test_query_terms_skip_author_fields_and_stop_words():
+    query_list = ['all:"green building" AND au:"Smith"', 'ti:"low carbon"', '"energy of the city"']
+    assert rank_tool.get_query_terms("Green and Low-carbon", query_list) == \
+           ["green", "low", "carbon", "building", "energy", "city"]
+
+
+def test_bm25_prefers_documents_with_rarer_matching_terms():
+    doc_token_list = [["green", "building"], ["green", "market"], ["quantum", "graph"]]
+    scores = rank_tool.bm25_scores(doc_token_list, ["green", "building"])
+    assert scores[0] > scores[1] > scores[2] == 0
+    assert not rank_tool.bm25_scores([], ["green"]).size
+    assert list(rank_tool.bm25_scores(doc_token_list, [])) == [0, 0, 0]
+
+
+def test_rank_papers_weights_titles_and_keeps_order_on_ties():
+    papers_info = [
+        make_paper("abstract", "neural network", "green building energy"),
+        make_paper("title", "green building energy", "neural network"),
+        make_paper("none_1", "quantum graph", "protein vision"),
+        make_paper("none_2", "market theorem", "language model"),
+    ]
+    rank_list = rank_tool.rank_papers(papers_info, "green building", ['all:"energy"'])
+    assert [item["paper_id"] for item in rank_list] == ["title", "abstract", "none_1", "none_2"]
+    assert rank_list[-1]["score"] == 0
+
+
+def test_prefilter_keeps_top_k_and_saves_the_ranking(tmp_path):
+    paper_data_path = str(tmp_path / "20240105.json")
+    papers_info = [make_paper(str(i), "green building" if i % 3 == 0 else "quantum graph", "abstract")
+                   for i in range(9)]
+    assert rank_tool.prefilter_papers(paper_data_path, papers_info, "green building", [], 3) == ["0", "3", "6"]
+
+    with open(str(tmp_path / "20240105_local_rank.json"), "r", encoding="utf-8") as f:
+        assert len(json.load(f)) == 9
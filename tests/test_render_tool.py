@@ -0,0 +1,84 @@
+import datetime
+import json
+import os
+
+import pytest
+
+from llm_tool.render_tool import render_digest, render_inline, render_report
+
+PAPER_INDEX = {"2401.00001v1": {"paper_id": "2401.00001v1", "paper_title": "Carbon accounting",
+                                "paper_authors": "Alice Zhang", "paper_published_time": "2024-01-02",
+                                "paper_entry_id": "http://arxiv.org/abs/2401.00001v1"}}
+
+SUMMARY_DICT = {"2401.00001v1": {"summary": "提出**碳排放**核算方法，*显著*降低误差，a < b",
+                                 "keypoints_1": "k1", "keypoints_2": "k2"}}
+
+
+def test_render_report_pins_markdown_and_html():
+    md_text, html_text = render_report("绿色建筑", ['all:"low carbon"'], SUMMARY_DICT, PAPER_INDEX,
+                                       current_time="2024-01-05 08:00:00")
+    assert md_text == (
+        "## 论文自动化结果\n### 更新时间：2024-01-05 08:00:00\n\n"
+        "### 主题：绿色建筑\n#### 关键词：all:\"low carbon\"\n\n\n#### 共总结论文数量：1\n"
+        "#### 论文序号：1\n**论文标题**：Carbon accounting\n\n**论文作者**：Alice Zhang\n\n"
+        "**论文发表时间**：2024-01-02\n\n**论文总结**：提出**碳排放**核算方法，*显著*降低误差，a < b\n\n"
+        "**论文关键点1**：k1\n\n**论文关键点2**：k2\n\n**论文地址**：http://arxiv.org/abs/2401.00001v1\n\n")
+    # 与此前 markdown2 转换的结果一致
+    assert html_text == (
+        "<h2>论文自动化结果</h2>\n\n<h3>更新时间：2024-01-05 08:00:00</h3>\n\n"
+        "<h3>主题：绿色建筑</h3>\n\n<h4>关键词：all:\"low carbon\"</h4>\n\n<h4>共总结论文数量：1</h4>\n\n"
+        "<h4>论文序号：1</h4>\n\n<p><strong>论文标题</strong>：Carbon accounting</p>\n\n"
+        "<p><strong>论文作者</strong>：Alice Zhang</p>\n\n<p><strong>论文发表时间</strong>：2024-01-02</p>\n\n"
+        "<p><strong>论文总结</strong>：提出<strong>碳排放</strong>核算方法，<em>显著</em>降低误差，a &lt; b</p>\n\n"
+        "<p><strong>论文关键点1</strong>：k1</p>\n\n<p><strong>论文关键点2</strong>：k2</p>\n\n"
+        "<p><strong>论文地址</strong>：http://arxiv.org/abs/2401.00001v1</p>\n")
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("<b>粗</b> & **加粗**", "&lt;b&gt;粗&lt;/b&gt; &amp; <strong>加粗</strong>"),
+    ("__加粗__ 与 snake_case_name", "<strong>加粗</strong> 与 snake_case_name"),
+    ("`a*b*c` 中的 *不* 转换", "<code>a*b*c</code> 中的 <em>不</em> 转换"),
+    ("2 * 3 * 4", "2 * 3 * 4"),
+    ("第一段\n\n第二段", "第一段</p>\n\n<p>第二段"),
+])
+def test_render_inline(text, expected):
+    assert render_inline(text) == expected
+
+
+def test_other_fields_are_escaped_as_plain_text():
+    paper_index = {"1": dict(PAPER_INDEX["2401.00001v1"], paper_id="1", paper_title="$O(n^*)$ <b> x_1_2")}
+    _, html_text = render_report("t", [], {"1": SUMMARY_DICT["2401.00001v1"]}, paper_index)
+    assert "<p><strong>论文标题</strong>：$O(n^*)$ &lt;b&gt; x_1_2</p>" in html_text
+
+
+def write_day(root_paper_path, day, paper_id, summary):
+    day_dir = os.path.join(root_paper_path, day)
+    os.makedirs(day_dir)
+    paper = dict(PAPER_INDEX["2401.00001v1"], paper_id=paper_id)
+    with open(os.path.join(day_dir, day + ".json"), "w", encoding="utf-8") as f:
+        json.dump({"绿色建筑": {"query": {paper_id: paper}}}, f)
+    with open(os.path.join(day_dir, day + "_summary.json"), "w", encoding="utf-8") as f:
+        json.dump({paper_id: summary}, f, ensure_ascii=False)
+
+
+def test_render_digest_lists_each_paper_once_in_the_period(tmp_path):
+    root_paper_path = str(tmp_path)
+    summary = SUMMARY_DICT["2401.00001v1"]
+    write_day(root_paper_path, "20231231", "old", summary)
+    write_day(root_paper_path, "20240105", "p1", summary)
+    write_day(root_paper_path, "20240106", "p1", summary)
+    write_day(root_paper_path, "20240107", "p2", summary)
+
+    md_path = render_digest(root_paper_path, "week", end_date=datetime.date(2024, 1, 7))
+    assert md_path == os.path.join(root_paper_path, "digest", "week_20240107.md")
+    with open(md_path, "r", encoding="utf-8") as f:
+        md_text = f.read()
+    assert "#### 共总结论文数量：2" in md_text
+    assert "### 2024-01-05 绿色建筑" in md_text and "### 2024-01-07 绿色建筑" in md_text
+    assert "2024-01-06" not in md_text
+    with open(md_path.replace(".md", ".html"), "r", encoding="utf-8") as f:
+        assert "<strong>碳排放</strong>" in f.read()
+
+
+def test_render_digest_without_reports_returns_none(tmp_path):
+    assert render_digest(str(tmp_path), "month", end_date=datetime.date(2024, 1, 7)) is None
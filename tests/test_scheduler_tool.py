@@ -0,0 +1,103 @@
+import asyncio
+import datetime
+import os
+import threading
+
+import pytest
+
+from llm_tool.scheduler_tool import RunLock, ScheduleDaemon, last_due_time, next_run_time, read_last_run
+
+# 2024-01-03 是周三
+WEDNESDAY = datetime.datetime(2024, 1, 3, 12, 0)
+
+
+@pytest.mark.parametrize("now, expected", [
+    (WEDNESDAY, datetime.datetime(2024, 1, 3, 8, 40)),
+    # 当天还未到运行时间时取上一个运行日
+    (WEDNESDAY.replace(hour=8, minute=39), datetime.datetime(2024, 1, 1, 8, 40)),
+    # 恰好在运行时间
+    (WEDNESDAY.replace(hour=8, minute=40), datetime.datetime(2024, 1, 3, 8, 40)),
+])
+def test_last_due_time(now, expected):
+    assert last_due_time([0, 2], 8, 40, now) == expected
+
+
+@pytest.mark.parametrize("now, expected", [
+    (WEDNESDAY, datetime.datetime(2024, 1, 8, 8, 40)),
+    (WEDNESDAY.replace(hour=8, minute=39), datetime.datetime(2024, 1, 3, 8, 40)),
+    # 恰好在运行时间时取下一次
+    (WEDNESDAY.replace(hour=8, minute=40), datetime.datetime(2024, 1, 8, 8, 40)),
+])
+def test_next_run_time(now, expected):
+    assert next_run_time([0, 2], 8, 40, now) == expected
+
+
+def test_single_weekday_wraps_to_the_same_day_next_week():
+    assert next_run_time([2], 12, 0, WEDNESDAY) == WEDNESDAY + datetime.timedelta(days=7)
+    assert last_due_time([2], 12, 1, WEDNESDAY) == datetime.datetime(2023, 12, 27, 12, 1)
+
+
+def test_no_weekdays_means_no_run():
+    assert last_due_time([], 9, 0, WEDNESDAY) is None
+    assert next_run_time([], 9, 0, WEDNESDAY) is None
+
+
+def test_run_lock_is_exclusive(tmp_path):
+    lock_path = os.path.join(str(tmp_path), "scheduler.lock")
+    run_lock, other_lock = RunLock(lock_path), RunLock(lock_path)
+    assert run_lock.acquire()
+    assert not other_lock.acquire()
+    run_lock.release()
+    assert other_lock.acquire()
+    other_lock.release()
+
+
+def test_scheduled_run_is_recorded_but_manual_run_is_not(tmp_path):
+    state_dir = str(tmp_path)
+    run_list = []
+    daemon = ScheduleDaemon(lambda: run_list.append(1), ["周三"], 8, 40, state_dir=state_dir)
+
+    assert asyncio.run(daemon.run_job())
+    assert read_last_run(state_dir) is None
+    slot = datetime.datetime(2024, 1, 3, 8, 40)
+    assert asyncio.run(daemon.run_job(slot))
+    assert read_last_run(state_dir) == slot
+    assert len(run_list) == 2
+
+
+def test_failed_run_is_not_recorded(tmp_path):
+    def job():
+        raise RuntimeError("失败")
+
+    daemon = ScheduleDaemon(job, ["周三"], 8, 40, state_dir=str(tmp_path))
+    assert not asyncio.run(daemon.run_job(datetime.datetime(2024, 1, 3, 8, 40)))
+    assert read_last_run(str(tmp_path)) is None
+    # 失败后释放运行锁
+    assert daemon.run_lock.acquire()
+    daemon.run_lock.release()
+
+
+def test_run_job_is_skipped_while_the_lock_is_held(tmp_path):
+    run_list = []
+    daemon = ScheduleDaemon(lambda: run_list.append(1), ["周三"], 8, 40, state_dir=str(tmp_path))
+    other_lock = RunLock(os.path.join(str(tmp_path), "scheduler.lock"))
+    assert other_lock.acquire()
+    try:
+        assert not asyncio.run(daemon.run_job())
+    finally:
+        other_lock.release()
+    assert run_list == []
+
+
+def test_stop_ends_the_daemon_from_another_thread(tmp_path):
+    daemon = ScheduleDaemon(lambda: None, ["周一", "周二", "周三", "周四", "周五", "周六", "周日"], 0, 0,
+                            state_dir=str(tmp_path))
+    # 首次启动不补运行
+    threading.Timer(0.2, daemon.stop).start()
+    asyncio.run(asyncio.wait_for(daemon.run(), timeout=5))
+
+
+def test_stop_before_start_returns_immediately(tmp_path):
+    daemon = ScheduleDaemon(lambda: None, ["周一"], 0, 0, state_dir=str(tmp_path))
+    daemon.stop()
+    asyncio.run(asyncio.wait_for(daemon.run(), timeout=5))
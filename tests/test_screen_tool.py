@@ -0,0 +1,67 @@
+import json
+import re
+import threading
+from types import SimpleNamespace
+
+from llm_tool import screen_tool
+from llm_tool.gen_tool import estimate_tokens
+
+
+def make_paper(paper_id, abstract="abstract"):
+    return {"paper_id": paper_id, "paper_title": f"title {paper_id}", "paper_abstract": abstract,
+            "paper_authors": "Alice", "paper_pdf_url": f"http://arxiv.org/pdf/{paper_id}"}
+
+
+class ScoringClient:
+    """
+    按paper_id末位数字打分的 chat.completions 替身，记录每个批次的论文
+    """
+
+    def __init__(self):
+        self.chat = SimpleNamespace(completions=self)
+        self.batch_list = []
+        self._lock = threading.Lock()
+
+    def create(self, model, messages, temperature=0, **kwargs):
+        paper_id_list = re.findall(r'"paper_id": "([^"]+)"', messages[-1]["content"])
+        with self._lock:
+            self.batch_list.append(paper_id_list)
+        content = json.dumps({"scores": [{"paper_id": paper_id, "score": int(paper_id[-1])}
+                                         for paper_id in paper_id_list]})
+        return SimpleNamespace(model=model, usage=None,
+                               choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+def test_screen_record_keeps_only_screening_fields_and_truncates_the_abstract():
+    record = screen_tool.build_screen_record(make_paper("1", "a" * 2000), abstract_length=100)
+    assert record == {"paper_id": "1", "paper_title": "title 1", "paper_abstract": "a" * 100}
+
+
+def test_screen_batches_respect_the_token_budget():
+    papers_info = [make_paper(str(i), "word " * 200) for i in range(10)]
+    record_tokens = estimate_tokens(json.dumps(screen_tool.build_screen_record(papers_info[0]), ensure_ascii=False))
+
+    batch_list = screen_tool.build_screen_batches(papers_info, token_budget=record_tokens * 3)
+    assert [len(batch) for batch in batch_list] == [3, 3, 3, 1]
+    assert [record["paper_id"] for batch in batch_list for record in batch] == [str(i) for i in range(10)]
+
+    # 单篇论文超过预算时单独成批
+    assert [len(batch) for batch in screen_tool.build_screen_batches(papers_info[:2], token_budget=1)] == [1, 1]
+
+
+def test_select_top_papers_ranks_globally_and_keeps_the_original_order_on_ties():
+    papers_info = [make_paper(paper_id) for paper_id in ("a", "b", "c", "d")]
+    score_dict = {"a": 5, "b": 9, "c": 5, "d": 7, "unknown": 10}
+    assert screen_tool.select_top_papers(papers_info, score_dict, 3) == \
+           [{"paper_id": "b", "score": 9}, {"paper_id": "d", "score": 7}, {"paper_id": "a", "score": 5}]
+
+
+def test_score_papers_scores_every_batch_once():
+    papers_info = [make_paper(f"2401.0000{i}v{i}", "word " * 200) for i in range(1, 10)]
+    client = ScoringClient()
+    score_dict = screen_tool.score_papers(client, "moonshot-v1-8k", papers_info, token_budget=600, max_workers=3)
+
+    assert score_dict == {paper["paper_id"]: float(paper["paper_id"][-1]) for paper in papers_info}
+    assert len(client.batch_list) > 1
+    assert sorted(paper_id for batch in client.batch_list for paper_id in batch) == \
+           sorted(paper["paper_id"] for paper in papers_info)
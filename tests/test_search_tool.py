@@ -0,0 +1,97 @@
+import json
+import os
+
+import pytest
+
+from llm_tool.search_tool import SearchIndex, rebuild_index, update_search_index
+
+PAPER_LIST = [
+    {"paper_id": "2401.00001v1", "paper_title": "Carbon accounting for green buildings",
+     "paper_authors": "Alice Zhang, Bob Li", "paper_abstract": "Life cycle assessment of office buildings.",
+     "paper_published_time": "2024-01-02", "paper_entry_id": "http://arxiv.org/abs/2401.00001v1"},
+    {"paper_id": "2401.00002v1", "paper_title": "Deep learning for protein folding",
+     "paper_authors": "Carol Wang", "paper_abstract": "Structure prediction with transformers.",
+     "paper_published_time": "2024-01-03", "paper_entry_id": "http://arxiv.org/abs/2401.00002v1"},
+]
+
+SUMMARY_DICT = {"2401.00001v1": {"summary": "本文提出了绿色建筑的碳排放核算方法", "keypoints_1": "全生命周期评价",
+                                 "keypoints_2": "运行能耗监测"}}
+
+
+@pytest.fixture
+def search_index(tmp_path):
+    index = SearchIndex(str(tmp_path))
+    index.put_papers(PAPER_LIST, topic="绿色低碳", day="20240105")
+    index.put_summaries(SUMMARY_DICT)
+    yield index
+    index.close()
+
+
+def search_ids(search_index, query):
+    return [result["paper_id"] for result in search_index.search(query)]
+
+
+def test_search_matches_titles_authors_and_abstracts(search_index):
+    assert search_ids(search_index, "carbon") == ["2401.00001v1"]
+    assert search_ids(search_index, "Carol") == ["2401.00002v1"]
+    assert search_ids(search_index, "transformers") == ["2401.00002v1"]
+
+
+def test_search_requires_every_term(search_index):
+    assert search_ids(search_index, "carbon protein") == []
+    assert search_ids(search_index, "carbon office") == ["2401.00001v1"]
+
+
+def test_search_matches_chinese_summaries_including_two_character_terms(search_index):
+    assert search_ids(search_index, "碳排放核算") == ["2401.00001v1"]
+    # 少于三个字符的检索词逐条匹配
+    assert search_ids(search_index, "能耗") == ["2401.00001v1"]
+    assert search_ids(search_index, "碳排放 能耗") == ["2401.00001v1"]
+
+
+def test_search_escapes_quotes_and_ignores_blank_queries(search_index):
+    assert search_ids(search_index, '"carbon') == []
+    assert search_index.search("   ") == []
+
+
+def test_put_papers_keeps_summary_and_earliest_first_seen(search_index):
+    search_index.put_papers(PAPER_LIST[:1], topic=None, day="20240107")
+    result = search_index.search("carbon")[0]
+    assert result["first_seen"] == "20240105"
+    assert result["topic"] == "绿色低碳"
+    assert "碳排放" in result["summary"]
+    assert search_index.count() == 2
+
+
+def write_day(root_paper_path, day, paper_list, summary_dict=None, topic_dir=None):
+    dir_path = os.path.join(root_paper_path, day, *([topic_dir] if topic_dir else []))
+    os.makedirs(dir_path, exist_ok=True)
+    with open(os.path.join(dir_path, day + ".json"), "w", encoding="utf-8") as f:
+        json.dump({topic_dir or "topic": {"query": {paper["paper_id"]: paper for paper in paper_list}}}, f)
+    summary_path = os.path.join(dir_path, day + "_summary.json")
+    with open(summary_path, "w", encoding="utf-8") as f:
+        json.dump(summary_dict or dict(), f, ensure_ascii=False)
+    return os.path.join(dir_path, day + ".json"), summary_path
+
+
+def test_update_search_index_builds_from_existing_days_first(tmp_path):
+    root_paper_path = str(tmp_path)
+    write_day(root_paper_path, "20240105", PAPER_LIST[:1])
+    write_day(root_paper_path, "20240106", PAPER_LIST[1:], topic_dir="生物")
+    paper_data_path, summary_path = write_day(root_paper_path, "20240107", [], SUMMARY_DICT)
+
+    update_search_index(root_paper_path, paper_data_path, summary_path)
+    index = SearchIndex(root_paper_path)
+    try:
+        assert index.count() == 2
+        assert search_ids(index, "protein") == ["2401.00002v1"]
+        assert index.search("protein")[0]["topic"] == "生物"
+
+        # 之后的运行只写入当天的论文
+        new_paper = dict(PAPER_LIST[0], paper_id="2401.00003v1", paper_title="Timber structures")
+        paper_data_path, summary_path = write_day(root_paper_path, "20240108", [new_paper])
+        update_search_index(root_paper_path, paper_data_path, summary_path)
+        assert search_ids(index, "timber") == ["2401.00003v1"]
+        assert rebuild_index(index, root_paper_path) == 3
+    finally:
+        index.close()
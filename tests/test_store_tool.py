@@ -0,0 +1,166 @@
+import json
+import os
+import threading
+
+import pytest
+
+from llm_tool import store_tool
+from llm_tool.store_tool import JudgeCache, PdfStore, SummaryStore
+
+
+@pytest.fixture
+def pdf_store(tmp_path):
+    store = PdfStore(str(tmp_path / "paper"))
+    yield store
+    store.close()
+
+
+def write_pdf(dir_path, paper_id, size):
+    os.makedirs(dir_path, exist_ok=True)
+    file_path = os.path.join(dir_path, paper_id + ".pdf")
+    with open(file_path, "wb") as f:
+        f.write(b"%PDF-" + paper_id.encode() + b"0" * size)
+    return file_path
+
+
+def test_same_content_is_stored_once_and_linked_into_other_days(tmp_path, pdf_store):
+    first_path = write_pdf(str(tmp_path / "paper" / "20240105"), "2401.00001v1", 100)
+    blob_path = pdf_store.add("2401.00001v1", first_path)
+    assert pdf_store.add("2401.00001", first_path) == blob_path
+    assert pdf_store.total_size() == os.path.getsize(first_path)
+
+    later_path = str(tmp_path / "paper" / "20240106" / "2401.00001v1.pdf")
+    os.makedirs(os.path.dirname(later_path))
+    assert pdf_store.link("2401.00001v1", later_path)
+    assert os.path.samefile(later_path, blob_path)
+    assert not pdf_store.link("2401.99999v1", later_path)
+
+
+def test_evict_skips_blobs_still_hard_linked_from_a_day(tmp_path, pdf_store):
+    day_dir = str(tmp_path / "paper" / "20240105")
+    linked_path = write_pdf(day_dir, "linked", 1000)
+    deleted_path = write_pdf(day_dir, "deleted", 1000)
+    linked_blob = pdf_store.add("linked", linked_path)
+    deleted_blob = pdf_store.add("deleted", deleted_path)
+    # 每日目录中的文件已被删除，只剩存储中的一份
+    os.remove(deleted_path)
+
+    assert pdf_store.evict(max_bytes=1500) == 1
+    assert os.path.exists(linked_blob) and not os.path.exists(deleted_blob)
+    assert pdf_store.lookup("deleted") is None
+
+    # 仍被链接的文件删除后不能释放空间，即使超过上限也不淘汰
+    assert pdf_store.evict(max_bytes=0) == 0
+    assert pdf_store.lookup("linked") == linked_blob
+
+
+def test_evict_never_breaks_a_symlinked_day_file(tmp_path, pdf_store, monkeypatch):
+    source_path = write_pdf(str(tmp_path / "download"), "paper", 1000)
+    blob_path = pdf_store.add("paper", source_path)
+    os.remove(source_path)
+
+    # 文件系统不支持硬链接时每日目录使用符号链接
+    def _link(source, target):
+        raise OSError("不支持硬链接")
+
+    monkeypatch.setattr(store_tool.os, "link", _link)
+    day_path = str(tmp_path / "paper" / "20240106" / "paper.pdf")
+    os.makedirs(os.path.dirname(day_path))
+    assert pdf_store.link("paper", day_path)
+    assert os.path.islink(day_path)
+
+    assert pdf_store.evict(max_bytes=0) == 0
+    assert os.path.exists(day_path)
+
+    # 符号链接被删除后可以淘汰
+    os.remove(day_path)
+    assert pdf_store.evict(max_bytes=0) == 1
+    assert not os.path.exists(blob_path)
+
+
+def test_evict_without_limit_keeps_everything(tmp_path, pdf_store):
+    file_path = write_pdf(str(tmp_path / "download"), "paper", 1000)
+    pdf_store.add("paper", file_path)
+    os.remove(file_path)
+    assert pdf_store.evict() == 0
+    assert pdf_store.lookup("paper") is not None
+
+
+def test_summary_store_migrates_the_old_json_file_once(tmp_path):
+    root_paper_path = tmp_path / "paper"
+    root_paper_path.mkdir()
+    json_path = root_paper_path / "total_summary.json"
+    json_path.write_text(json.dumps({"1": {"summary": "旧总结"}}, ensure_ascii=False), encoding="utf-8")
+
+    summary_store = SummaryStore(str(root_paper_path))
+    try:
+        assert summary_store.get("1") == {"summary": "旧总结"}
+        assert not json_path.exists() and (root_paper_path / "total_summary.json.migrated").exists()
+
+        # 已存在的总结不会被迁移覆盖
+        json_path.write_text(json.dumps({"1": {"summary": "更旧的总结"}, "2": {"summary": "新增"}},
+                                        ensure_ascii=False), encoding="utf-8")
+        assert summary_store.migrate_json(str(json_path)) == 1
+        assert summary_store.get_many(["1", "2", "3"]) == {"1": {"summary": "旧总结"}, "2": {"summary": "新增"}}
+    finally:
+        summary_store.close()
+
+
+def test_summary_store_batches_lookups_and_aliases_without_overwriting(tmp_path):
+    summary_store = SummaryStore(str(tmp_path / "paper"))
+    try:
+        for i in range(1200):
+            summary_store.put(str(i), {"summary": f"总结{i}"})
+        # 超过单次查询的参数数量时分批查询
+        assert len(summary_store.get_many(str(i) for i in range(0, 2400, 2))) == 600
+        assert summary_store.summarized_ids(["5", "5000"]) == {"5"}
+
+        assert summary_store.alias({"5v2": "5", "6": "5", "new": "missing"}) == 1
+        assert summary_store.get("5v2") == {"summary": "总结5"}
+        assert summary_store.get("6") == {"summary": "总结6"}
+        assert summary_store.get("new") is None
+    finally:
+        summary_store.close()
+
+
+def test_summary_store_is_shared_between_threads(tmp_path):
+    summary_store = SummaryStore(str(tmp_path / "paper"))
+    try:
+        thread_list = [threading.Thread(target=lambda i=i: [summary_store.put(f"{i}-{j}", {"summary": str(j)})
+                                                             for j in range(50)]) for i in range(4)]
+        for thread in thread_list:
+            thread.start()
+        for thread in thread_list:
+            thread.join()
+        assert len(summary_store.summarized_ids(f"{i}-{j}" for i in range(4) for j in range(50))) == 200
+    finally:
+        summary_store.close()
+
+
+def test_judge_cache_is_keyed_by_topic_prompt_and_model(tmp_path):
+    judge_cache = JudgeCache(str(tmp_path / "paper"))
+    try:
+        judge_cache.put_scores({"1": 8.0, "2": 3.0}, "绿色建筑", "hash", "moonshot-v1-8k")
+        assert judge_cache.get_scores(["1", "2", "3"], "绿色建筑", "hash", "moonshot-v1-8k") == {"1": 8.0, "2": 3.0}
+        assert judge_cache.get_scores(["1"], "低碳", "hash", "moonshot-v1-8k") == dict()
+        assert judge_cache.get_scores(["1"], "绿色建筑", "new_hash", "moonshot-v1-8k") == dict()
+        assert judge_cache.get_scores(["1"], "绿色建筑", "hash", "gpt-3.5-turbo") == dict()
+
+        # 重新打分覆盖旧的分数
+        judge_cache.put_scores({"1": 6.0}, "绿色建筑", "hash", "moonshot-v1-8k")
+        assert judge_cache.get_scores(["1"], "绿色建筑", "hash", "moonshot-v1-8k") == {"1": 6.0}
+    finally:
+        judge_cache.close()
+
+
+def test_judge_cache_alias_copies_scores_to_new_versions(tmp_path):
+    judge_cache = JudgeCache(str(tmp_path / "paper"))
+    try:
+        judge_cache.put_scores({"1v1": 8.0}, "绿色建筑", "hash", "m")
+        judge_cache.put_scores({"1v1": 2.0, "1v2": 5.0}, "低碳", "hash", "m")
+        judge_cache.alias({"1v2": "1v1"})
+        assert judge_cache.get_scores(["1v2"], "绿色建筑", "hash", "m") == {"1v2": 8.0}
+        # 已有的打分不会被覆盖
+        assert judge_cache.get_scores(["1v2"], "低碳", "hash", "m") == {"1v2": 5.0}
+    finally:
+        judge_cache.close()